@@ -1,4 +1,6 @@
-from kubectl_query.main import main
+__version__ = '0.3.4'
+
+from kubectl_query.main import main  # noqa: E402
 
 __all__ = [
     'main',
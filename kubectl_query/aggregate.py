@@ -0,0 +1,100 @@
+import logging
+
+logger = logging.getLogger('kubectl-query')
+
+# functions that can be applied to the rows of a group
+FUNCTIONS = ('sum', 'mean', 'min', 'max', 'count', 'nunique', 'first', 'last')
+
+# functions that only make sense for numbers
+NUMERIC = ('sum', 'mean')
+
+
+def aggregations(aggregate):
+    """
+    Pairs of (function, column) from the `aggregate` of a query, given as a
+    dict of columns with one or more functions each, or as a list like the
+    options, `function:column` or just `count` for the number of rows
+    """
+
+    pairs = []
+    if isinstance(aggregate, dict):
+        for column, functions in aggregate.items():
+            for function in functions if isinstance(functions, list) else [functions]:
+                pairs.append((function, column))
+    else:
+        for option in aggregate:
+            function, _, column = option.partition(':')
+            pairs.append((function, column or None))
+
+    for function, column in pairs:
+        if function not in FUNCTIONS:
+            raise ValueError(f"Unknown aggregation '{function}', use one of {', '.join(FUNCTIONS)}")
+        if column is None and function != 'count':
+            raise ValueError(f"Aggregation '{function}' needs a column, as '{function}:column'")
+
+    return pairs
+
+
+def numeric(values, function):
+    """
+    Values as numbers for arithmetics, or for comparisons if all values
+    that are there are numbers, otherwise as they are
+    """
+
+    import pandas as pd
+
+    numbers = pd.to_numeric(values, errors='coerce')
+    if function in NUMERIC:
+        return numbers
+
+    present = values.notna() & (values != '-')
+    return numbers if numbers[present].notna().all() else values
+
+
+def group(frame, group_by, aggregate):
+    """
+    Group the rows by the `group_by` columns and aggregate the others as
+    given by pairs of (function, column), all of it vectorized by pandas;
+    without columns to group by, everything is aggregated into one row,
+    and without aggregations, the rows of each group are counted; missing
+    values are expected as such, not filled in yet
+
+    Each aggregation keeps the name of its column, unless a column is
+    aggregated more than once or grouped by, which then become
+    `column-function`
+    """
+
+    import pandas as pd
+
+    # a context column is only there with several contexts, any other column
+    # that isn't there is likely a typo that would put all rows in one group
+    if 'context' in group_by and 'context' not in frame.columns:
+        logger.debug("  Not grouping by context, there is only one")
+        group_by = [c for c in group_by if c != 'context']
+
+    absent = [c for c in group_by if c not in frame.columns]
+    if absent:
+        raise ValueError(f"Cannot group by columns {absent} that aren't in the result")
+
+    missing = [c for _, c in aggregate if c is not None and c not in frame.columns]
+    if missing:
+        raise ValueError(f"Cannot aggregate columns {missing} that aren't in the result")
+
+    aggregate = aggregate or [('count', None)]
+    used = [column for _, column in aggregate]
+    work = frame[list(group_by)].copy()
+    names = []
+    for function, column in aggregate:
+        name = column if column is not None else 'count'
+        if used.count(column) > 1 or name in group_by:
+            name = f"{name}-{function}"
+        work[name] = 1 if column is None else numeric(frame[column], function).to_numpy()
+        names.append((name, function))
+
+    logger.debug(f"Grouping {len(frame)} rows by {group_by} with {aggregate}")
+
+    if not group_by:
+        return pd.DataFrame({name: [work[name].agg(function)] for name, function in names})
+
+    grouped = work.groupby(list(group_by), sort=True, dropna=False)
+    return grouped.agg(**{name: (name, function) for name, function in names}).reset_index()
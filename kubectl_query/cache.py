@@ -0,0 +1,58 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+logger = logging.getLogger('kubectl-query')
+
+
+def cache_dir(*parts):
+    """
+    Location of the local cache, honouring XDG_CACHE_HOME
+    """
+
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'kubectl-query', *parts)
+
+
+def digest(*values):
+    """
+    Short and stable hash over the repr of some values, used in cache keys
+    """
+
+    return hashlib.sha256(repr(values).encode('utf-8')).hexdigest()[:24]
+
+
+def load(path):
+    """
+    Read a pickled cache entry, return None if it's missing or unreadable
+    """
+
+    try:
+        with open(path, 'rb') as stream:
+            return pickle.load(stream)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.debug(f"Ignoring unreadable cache {path}: {e}")
+        return None
+
+
+def save(path, data):
+    """
+    Write a pickled cache entry atomically, so concurrent runs never see
+    partial files; failing to write a cache is never fatal
+    """
+
+    tmp = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as stream:
+            pickle.dump(data, stream, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except Exception as e:
+        logger.debug(f"Could not write cache {path}: {e}")
+        if tmp and os.path.exists(tmp):
+            os.unlink(tmp)
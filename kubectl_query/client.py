@@ -1,11 +1,41 @@
 import logging
+import os
 
-from kubernetes import config as kubeconfig
-from kubernetes import dynamic
+import yaml
 
 logger = logging.getLogger('kubectl-query')
 
 
+def kube_config_contexts():
+    """
+    Read the context names and the current context from the kubeconfig
+    files without importing the Kubernetes client library, following the
+    merge rules of kubectl: first file to define a context or the current
+    context wins
+    """
+
+    paths = os.environ.get('KUBECONFIG') or os.path.expanduser('~/.kube/config')
+
+    contexts = []
+    current = None
+    for path in paths.split(os.pathsep):
+        if not path or not os.path.isfile(path):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as stream:
+                kubeconfig = yaml.safe_load(stream) or {}
+        except (OSError, yaml.YAMLError) as e:
+            logger.warning(f"Can't read kubeconfig {path}: {e}")
+            continue
+
+        for context in kubeconfig.get('contexts') or []:
+            if context.get('name') and context['name'] not in contexts:
+                contexts.append(context['name'])
+        current = current or kubeconfig.get('current-context')
+
+    return contexts, current
+
+
 class Client:
     """
     Connections to the Kubernetes clusters
@@ -13,13 +43,13 @@ class Client:
 
     def __init__(self, contexts):
         """
-        Set up a dynamic client to each of the contexts
+        Work out which contexts were asked for; the dynamic client to each
+        of them is only set up once a table needs data from that cluster
         """
 
         logger.debug(f"Contexts: requested {contexts}")
 
-        known_contexts, default_context = kubeconfig.list_kube_config_contexts()
-        self._known_contexts = [context['name'] for context in known_contexts]
+        self._known_contexts, default_context = kube_config_contexts()
 
         if contexts:
             if 'all' in contexts:
@@ -32,14 +62,15 @@ class Client:
                             contextset.add(context)
                 self._default_contexts = list(contextset)
 
+        elif default_context:
+            self._default_contexts = [default_context]
+
         else:
-            self._default_contexts = [default_context['name']]
+            logger.info("Can't find a current context in the kubeconfig")
+            self._default_contexts = []
 
         self._client = {}
 
-        for context in self.default_contexts:
-            self.client(context)
-
     @property
     def known_contexts(self):
         return self._known_contexts or []
@@ -52,7 +83,14 @@ class Client:
         if context not in self._client:
             logger.debug(f"  Loading context '{context}'")
             try:
-                self._client[context] = dynamic.DynamicClient(kubeconfig.new_client_from_config(context=context))
+                from kubernetes import config as kubeconfig
+                from kubernetes import dynamic
+
+                # the same kubeconfig files the contexts were read from
+                config_file = os.environ.get('KUBECONFIG') or None
+                self._client[context] = dynamic.DynamicClient(
+                    kubeconfig.new_client_from_config(config_file=config_file, context=context)
+                )
             except Exception as exc:
                 logger.warning(f"Can't load Kubernetes config: {exc}")
                 pass
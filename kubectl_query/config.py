@@ -1,27 +1,45 @@
-import ast  # noqa: F401
 import glob
 import importlib.resources
-import ipaddress  # noqa: F401
 import logging
 import os
 import sys
 
-import pandas as pd
-import yaml
-from jsonpath_ng.ext import parse
+from . import __version__, cache
+from .extract import Lambda
+from .transforms import Transform
 
 logger = logging.getLogger('kubectl-query')
 
 
+def split_options(options):
+    """
+    Options may be provided multiple times, or as comma separated lists,
+    or both
+    """
+
+    values = []
+    for option in options:
+        values.extend(option.split(','))
+    return values
+
+
 class Config:
     """
     Represents the config files and does sanity checking of the input
     """
 
-    def __init__(self, configpaths, client):
+    def __init__(self, configpaths, client, use_cache=True, defaults=None, overrides=None):
         """
         Parse the configuration files or directories and compile the
         JSON paths needed to select fields later on
+
+        Tables take the `defaults` for settings they don't have themselves,
+        while `overrides`, like options given on the command line, win over
+        their own settings
+
+        The merged result of all files is cached, keyed by the paths,
+        modification times and sizes of the files and the package version,
+        so that unchanged config directories don't have to be parsed again
         """
 
         self.config = {'tables': {}, 'queries': {}, 'bundles': {}}
@@ -29,29 +47,53 @@ class Config:
         built_in = importlib.resources.files(__package__).joinpath('config')
         configpaths = (built_in,) + configpaths
 
+        configfiles = []
         for configpath in configpaths:
             if os.path.isfile(configpath):
-                self.merge_config(configpath)
+                configfiles.append(str(configpath))
             elif os.path.isdir(configpath):
-                for configfile in glob.glob(f"{configpath}/*.yaml"):
-                    self.merge_config(configfile)
+                configfiles.extend(glob.glob(f"{configpath}/*.yaml"))
             else:
                 logger.warning(f"Don't know what to do with '{configpath}'")
 
+        self.use_cache = use_cache
+        self._paths = None
+        self._paths_dirty = False
+
+        cached = None
+        if use_cache:
+            stats = [(f, os.stat(f).st_mtime_ns, os.stat(f).st_size) for f in configfiles]
+            self.cachefile = cache.cache_dir(f"config-{cache.digest(__version__, stats)}.pickle")
+            cached = cache.load(self.cachefile)
+
+        if cached:
+            logger.debug(f"Reading cached config from {self.cachefile}")
+            self.config, self.aliases, self.unaliases = cached
+        else:
+            for configfile in configfiles:
+                self.merge_config(configfile)
+            self.build_aliases()
+
+            if use_cache:
+                cache.save(self.cachefile, (self.config, self.aliases, self.unaliases))
+
         default_contexts = client.default_contexts
         for table, prop in self.config['tables'].items():
             prop.setdefault('contexts', default_contexts)
+            for key, value in (defaults or {}).items():
+                prop.setdefault(key, value)
+            prop.update(overrides or {})
 
         self.namespaces = []
         self.filters = []
 
-        self.build_aliases()
-
     def merge_config(self, configpath):
         """
         Snarf in one more yaml file and return the dict, skip
         with a warning if it can't be parsed
         """
+        import yaml
+
         logger.debug(f"Reading {configpath}")
         with open(configpath, "r", encoding="utf-8") as stream:
             try:
@@ -134,15 +176,75 @@ class Config:
         for field, path in prop.get("fields", {}).items():
             if isinstance(path, dict):
                 for subfield, subpath in path.items():
-                    prop["fields"][field][subfield] = parse(subpath)
+                    prop["fields"][field][subfield] = self.compile(subpath)
 
             elif isinstance(path, list):
-                prop["fields"][field] = [parse(path[0])] + [
-                    'unroll' if f == 'unroll' else 'unrange' if f == 'unrange' else eval(f) for f in path[1:]
-                ]
+                prop["fields"][field] = [self.compile(path[0])] + [self.compile_step(table, field, f) for f in path[1:]]
 
             elif isinstance(path, str):
-                prop["fields"][field] = parse(path)
+                prop["fields"][field] = self.compile(path)
+
+    def compile_step(self, table, field, step):
+        """
+        Steps after the path of a field are unroll, unrange, transforms
+        which are applied to the whole column, or anything else that
+        evaluates to a Python callable, like a lambda, `len` or `str.upper`
+        """
+
+        if step in ('unroll', 'unrange'):
+            return step
+
+        try:
+            return Transform(step)
+        except ValueError as e:
+            error = e
+
+        try:
+            function = Lambda(step)
+        except Exception as e:
+            logger.error(f"Field '{field}' of table '{table}': {error}, nor can it be evaluated, {e}")
+            sys.exit(1)
+
+        if not callable(function.function):
+            logger.error(f"Field '{field}' of table '{table}': '{step}' is neither a transform nor a callable")
+            sys.exit(1)
+        return function
+
+    def compile(self, path):
+        """
+        Parse a JSON path, or pick up the parsed representation from the
+        cache as the jsonpath_ng grammar is rather slow to run
+        """
+
+        if self._paths is None:
+            self._paths = {}
+            if self.use_cache:
+                self._paths = cache.load(self.pathsfile) or {}
+
+        if path not in self._paths:
+            from jsonpath_ng.ext import parse
+
+            self._paths[path] = parse(path)
+            self._paths_dirty = True
+
+        return self._paths[path]
+
+    @property
+    def pathsfile(self):
+        """Cache file for parsed JSON paths, bound to the installed parser"""
+        import jsonpath_ng
+
+        parser = os.stat(jsonpath_ng.__file__).st_mtime_ns
+        return cache.cache_dir(f"paths-{cache.digest(__version__, parser)}.pickle")
+
+    def save_paths(self):
+        """
+        Store newly parsed JSON paths for the next run
+        """
+
+        if self.use_cache and self._paths_dirty:
+            cache.save(self.pathsfile, self._paths)
+            self._paths_dirty = False
 
     def build_aliases(self):
         """
@@ -208,6 +310,8 @@ class Config:
             logger.debug("Nothing to show, so loading 'list' instead")
             self.init_bundle('list')
 
+        self.save_paths()
+
     @property
     def tables(self):
         """All available tables"""
@@ -223,9 +327,9 @@ class Config:
         """All available bundles"""
         return self.config["bundles"] or {}
 
-    def as_table(self, kind):
+    def as_rows(self, kind):
         """
-        Take the internal config and render it as table for help
+        Take the internal config and render it as rows for help
         """
 
         available = []
@@ -239,4 +343,36 @@ class Config:
                 'note': prop.get('note', ""),
             })
 
-        return pd.DataFrame(available)
+        return available
+
+    def as_table(self, kind):
+        """
+        Take the internal config and render it as table for help
+        """
+
+        import pandas as pd
+
+        return pd.DataFrame(self.as_rows(kind))
+
+    def as_columns(self, kind, sort_override=(), hide_columns=(), list_columns=()):
+        """
+        The same as a postprocessed as_table, but without involving pandas,
+        so listing the config stays quick
+        """
+
+        rows = self.as_rows(kind)
+        prop = self.tables.get(kind, {})
+
+        for key in reversed(split_options(sort_override) or prop.get('sort', [])):
+            rows.sort(key=lambda row: row.get(key) or '')
+
+        hide = [c.lower() for c in split_options(hide_columns)] + prop.get('hide', [])
+        limit = [c.lower() for c in split_options(list_columns)]
+
+        columns = {}
+        for column in rows[0].keys() if rows else []:
+            if column in hide or (limit and column not in limit):
+                continue
+            columns[column] = ['-' if row[column] is None else row[column] for row in rows]
+
+        return columns
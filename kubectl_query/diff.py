@@ -0,0 +1,112 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger('kubectl-query')
+
+# spreads the occurrence of a duplicate row over the hash space
+OCCURRENCE = np.uint64(0x9E3779B97F4A7C15)
+
+
+def load_snapshot(path):
+    """
+    Read a result saved before with -o jsonl, parquet, arrow or csv
+    """
+
+    extension = os.path.splitext(path)[1].lower()
+    logger.debug(f"Reading snapshot {path}")
+
+    if extension in ('.jsonl', '.json'):
+        return pd.read_json(path, orient='records', lines=True, dtype=False)
+    if extension == '.parquet':
+        return pd.read_parquet(path)
+    if extension == '.arrow':
+        import pyarrow as pa
+
+        with pa.OSFile(path, 'rb') as stream:
+            return pa.ipc.open_stream(stream).read_all().to_pandas()
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def normalize(frame, columns):
+    """
+    The values of both sides as strings, with missing values shown as
+    dashes like in the tables, so that typed snapshots and live results
+    compare equal
+    """
+
+    return frame[columns].fillna('-').astype(str).reset_index(drop=True)
+
+
+def row_hashes(frame):
+    """
+    One 64 bit hash per row, telling apart duplicates by their occurrence
+    so that each row has a partner on the other side at most once
+    """
+
+    if not len(frame.columns):
+        hashes = np.zeros(len(frame), dtype=np.uint64)
+    else:
+        hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    occurrence = pd.Series(hashes).groupby(hashes).cumcount().to_numpy().astype(np.uint64)
+    with np.errstate(over='ignore'):
+        return hashes + occurrence * OCCURRENCE
+
+
+def diff(left, right, key=()):
+    """
+    Compare two results by hashing their rows: rows found on both sides are
+    left out, rows only on the left are removed (-), rows only on the right
+    added (+), and rows whose key columns match but other values don't are
+    changed (~), showing their values as `left -> right`
+
+    Only the columns common to both sides are compared; without key columns
+    rows are either the same or added and removed
+    """
+
+    columns = [c for c in left.columns if c in right.columns]
+    ignored = sorted(set(left.columns).symmetric_difference(right.columns))
+    if ignored:
+        logger.info(f"Not comparing columns {ignored} that only one side has")
+
+    key = [c for c in key if c in columns]
+    left, right = normalize(left, columns), normalize(right, columns)
+
+    # rows that are the same on both sides
+    left_rows, right_rows = row_hashes(left), row_hashes(right)
+    left = left[~pd.Series(left_rows).isin(right_rows).to_numpy()]
+    right = right[~pd.Series(right_rows).isin(left_rows).to_numpy()]
+
+    # of the others, pair those with the same key
+    if key:
+        left_keys, right_keys = row_hashes(left[key]), row_hashes(right[key])
+        paired = pd.Series(left_keys).isin(right_keys).to_numpy()
+        old = left[paired]
+        new = right.iloc[pd.Index(right_keys).get_indexer(left_keys[paired])]
+        removed = left[~paired]
+        added = right[~pd.Series(right_keys).isin(left_keys).to_numpy()]
+    else:
+        old, new, removed, added = left.iloc[:0], right.iloc[:0], left, right
+
+    # show the values that changed next to each other
+    changed = new.reset_index(drop=True)
+    for column in columns:
+        before, after = old[column].to_numpy(), new[column].to_numpy()
+        differs = before != after
+        if differs.any():
+            values = changed[column].to_numpy(dtype=object, copy=True)
+            values[differs] = [f"{b} -> {a}" for b, a in zip(before[differs], after[differs])]
+            changed[column] = values
+
+    result = pd.concat(
+        [
+            removed.assign(diff='-'),
+            changed.assign(diff='~'),
+            added.assign(diff='+'),
+        ],
+        ignore_index=True,
+    )
+    logger.debug(f"Found {len(removed)} removed, {len(changed)} changed and {len(added)} added rows")
+    return result[['diff'] + columns]
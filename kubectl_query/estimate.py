@@ -0,0 +1,162 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from . import cache
+
+logger = logging.getLogger('kubectl-query')
+
+# predicted rows from which a run is warned about, and refused
+WARN_ROWS = 200000
+MAX_ROWS = 2000000
+
+# concurrent list calls when counting objects
+WORKERS = 8
+
+# tables that aren't read from Kubernetes
+OTHER_APIS = ('file', 'url', 'dns')
+
+
+def counts_file(table, context):
+    return cache.cache_dir('counts', f"{cache.digest(table, context)}.pickle")
+
+
+def record(table, context, objects, rows):
+    """
+    Remember how many objects a table had in a context and how many rows
+    they turned into, for estimating the next runs
+    """
+
+    cache.save(counts_file(table, context), {'objects': objects, 'rows': rows})
+
+
+def recorded(table, context):
+    return cache.load(counts_file(table, context))
+
+
+def query_file(name):
+    return cache.cache_dir('counts', f"query-{cache.digest(name)}.pickle")
+
+
+def record_query(name, rows_in, rows):
+    """
+    Remember how many rows the first table of a query had and how many
+    the joined result had, for the fan-out of its joins in the next runs
+    """
+
+    cache.save(query_file(name), {'rows_in': rows_in, 'rows': rows})
+
+
+def recorded_query(name):
+    return cache.load(query_file(name))
+
+
+def count_objects(client, api, kind, context, namespaces=()):
+    """
+    Number of objects of a kind in a context, asking for a single item and
+    the number of remaining ones; None if the API server doesn't tell, as
+    for example with selectors
+    """
+
+    resource = client.client(context).resources.get(api_version=api, kind=kind)
+
+    total = 0
+    for namespace in namespaces or [None]:
+        listing = json.loads(resource.get(namespace=namespace, limit=1, serialize=False).data)
+        metadata = listing.get('metadata') or {}
+        if metadata.get('continue') and metadata.get('remainingItemCount') is None:
+            return None
+        total += len(listing.get('items') or []) + (metadata.get('remainingItemCount') or 0)
+    return total
+
+
+def estimate_table(client, table, prop, live=False):
+    """
+    Objects and rows per context of a table: the objects are counted with
+    cheap list calls if `live`, or taken from the last run, and the rows
+    predicted from the rows per object seen in the last run
+    """
+
+    # tables that aren't read from Kubernetes can't be counted, they're
+    # recorded as a whole
+    contexts = prop.get('contexts', [])
+    if prop.get('api') in OTHER_APIS:
+        contexts, live = [None], False
+
+    def estimate(context):
+        last = recorded(table, context) or {}
+        objects = last.get('objects')
+        source = 'cached' if objects is not None else None
+
+        if live:
+            try:
+                objects = count_objects(client, prop['api'], prop['kind'], context, prop.get('namespaces', []))
+                source = 'live'
+            except Exception as e:
+                logger.info(f"Failed to count '{prop['kind']}' in '{context}', {e}")
+
+        fanout = last['rows'] / last['objects'] if last.get('objects') else 1.0
+        rows = round(objects * fanout) if objects is not None else None
+        return {
+            'table': table,
+            'context': context,
+            'objects': objects,
+            'source': source,
+            'fanout': fanout,
+            'rows': rows,
+        }
+
+    if not live or len(contexts) < 2:
+        return [estimate(context) for context in contexts]
+
+    with ThreadPoolExecutor(max_workers=min(WORKERS, len(contexts))) as pool:
+        return list(pool.map(estimate, contexts))
+
+
+def estimate_query(client, config, name, live=False):
+    """
+    Estimates of all tables of a query or of a single table, and the rows
+    predicted for the result: the rows of the first table, multiplied by
+    the rows per row of the first table the joins gave in the last run of
+    the query; without one, at least as many as the largest table has, as
+    the tables are left-joined; None if not known
+    """
+
+    tablenames = config.queries[name].get('tables', []) if name in config.queries else [name]
+    tables = [estimate_table(client, table, config.tables[table], live) for table in tablenames]
+
+    def total(estimates):
+        if estimates and all(t['rows'] is not None for t in estimates):
+            return sum(t['rows'] for t in estimates)
+        return None
+
+    rows = total(tables[0]) if tables else None
+    if rows is not None and len(tables) > 1:
+        last = recorded_query(name)
+        if last and last['rows_in']:
+            rows = round(rows * last['rows'] / last['rows_in'])
+        else:
+            rows = max([rows] + [n for n in map(total, tables[1:]) if n is not None])
+
+    return [t for estimates in tables for t in estimates], rows
+
+
+def check(client, config, warn_rows=WARN_ROWS, max_rows=MAX_ROWS):
+    """
+    Warn about queries predicted to give many rows from what was seen in
+    the last runs, and refuse those above `max_rows` by raising ValueError;
+    nothing is fetched for this
+    """
+
+    for name in config.show:
+        tables, rows = estimate_query(client, config, name)
+        if rows is None:
+            continue
+
+        objects = sum(t['objects'] or 0 for t in tables)
+        message = f"'{name}' is estimated at {rows} rows from {objects} objects"
+        advice = "limit it to fewer contexts with --context or to some namespaces with `namespaces` in the table"
+        if max_rows and rows > max_rows:
+            raise ValueError(f"{message}, more than {max_rows}; {advice}, or raise --max-rows")
+        if warn_rows and rows > warn_rows:
+            logger.warning(f"{message}, this may take a while; {advice}")
@@ -0,0 +1,501 @@
+import ast
+import ipaddress
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import __version__, cache
+from .transforms import Transform, vectorized
+
+logger = logging.getLogger('kubectl-query')
+
+# number of items from which extraction is spread across a process pool
+POOL_THRESHOLD = 20000
+
+# errors of paths and steps that don't fit some of the objects of a list,
+# like a missing spec or a lambda splitting a value that isn't there
+OBJECT_ERRORS = (AttributeError, IndexError, KeyError, TypeError, ValueError)
+
+
+class Lambda:
+    """
+    A function given as lambda string in the config; only the source is
+    pickled, so it gets compiled again in worker processes
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.function = eval(source)
+
+    def __call__(self, value):
+        return self.function(value)
+
+    def __reduce__(self):
+        return (Lambda, (self.source,))
+
+    def __repr__(self):
+        return f"Lambda({self.source!r})"
+
+
+def format_list(value):
+    if isinstance(value, list):
+        return ",".join(value)
+    else:
+        return str(value)
+
+
+def format_match(value):
+    if value.operator == 'In':
+        return f"{value.key} = {format_list(value.values)}"
+    elif value.operator == 'NotIn':
+        return f"{value.key} != {format_list(value.values)}"
+    else:
+        return f"{value.key} {value.operator.lower()}"
+
+
+def unroll(value):
+    if isinstance(value, list) and len(value) == 1 and isinstance(value[0], list):
+        return value[0]
+    return value
+
+
+def interval_columns(field):
+    """
+    Names of the columns holding the integer encoded bounds of a range field
+    """
+
+    return f"{field}:start", f"{field}:end"
+
+
+def unrange(value, field):
+    """
+    Ranges of addresses, given as {'start': ..., 'stop': ...} or as
+    {'cidr': ...}, become intervals of integer encoded addresses that are
+    kept as subfields next to the field itself, instead of expanding into
+    one value per address; queries join addresses to them by lookup
+    """
+
+    if isinstance(value, list):
+        if len(value) == 1:
+            value = value[0]
+
+        else:
+            ret = []
+            for v in value:
+                ret.extend(unrange(v, field))
+            return ret
+
+    value = ast.literal_eval(value)
+    ret = value
+    start, end = interval_columns(field)
+
+    if isinstance(value, dict):
+        if 'start' in value and 'stop' in value:
+            ret = [{
+                field: f"{value['start']}-{value['stop']}",
+                start: int(ipaddress.IPv4Address(value['start'])),
+                end: int(ipaddress.IPv4Address(value['stop'])),
+            }]
+
+        elif 'cidr' in value:
+            network = ipaddress.IPv4Network(value['cidr'])
+            ret = [{
+                field: str(network),
+                start: int(network.network_address),
+                end: int(network.broadcast_address),
+            }]
+
+    return ret if isinstance(ret, list) else [ret]
+
+
+def product_dict(**kwargs):
+    """
+    Unroll the combinations, may even be within a column if
+    subqueries were used
+    """
+    keys = kwargs.keys()
+    for instance in itertools.product(*kwargs.values()):
+        values = {}
+        for field, value in dict(zip(keys, instance)).items():
+            if isinstance(value, dict):
+                for subfield, subvalue in value.items():
+                    values[subfield] = subvalue
+            else:
+                values[field] = value
+        yield values
+
+
+def resource_fields(value, field_class):
+    """
+    Wrap plain dicts the way the dynamic client does, so paths find the
+    same values no matter which process does the extraction
+    """
+
+    if isinstance(value, dict):
+        return field_class(params={k: resource_fields(v, field_class) for k, v in value.items()})
+    elif isinstance(value, (list, tuple)):
+        return [resource_fields(v, field_class) for v in value]
+    return value
+
+
+class Extractor:
+    """
+    Applies the precompiled fields of a table to entries
+
+    Entries from Kubernetes are passed in as plain dicts and wrapped into
+    ResourceFields right before extraction, so that they can be shipped to
+    worker processes cheaply
+
+    When profiling, the time spent per field is summed up in `timings`, and
+    the number of rows of each entry is kept in `counts`, or None if some
+    objects from Kubernetes had to be dropped
+    """
+
+    def __init__(self, fields, context=None, kubernetes=False, profile=False):
+        self.fields = fields
+        self.context = context
+        self.kubernetes = kubernetes
+        self.profile = profile
+        self.timings = {}
+        self.counts = []
+
+        # fields with only transforms are left to be applied to whole columns
+        self.deferred = {field for field, path in fields.items() if vectorized(path)}
+
+        # only tables read from Kubernetes produce ResourceFields to be formatted
+        self.field_class = ()
+        if kubernetes:
+            from kubernetes.dynamic.resource import ResourceField
+
+            self.field_class = ResourceField
+
+    def __reduce__(self):
+        return (Extractor, (self.fields, self.context, self.kubernetes, self.profile))
+
+    def format_value(self, value):
+        if isinstance(value, self.field_class):
+            if value.matchExpressions:
+                return ' & '.join([format_match(v) for v in value.matchExpressions])
+            if value.matchFields:
+                return ' & '.join([format_match(v) for v in value.matchFields])
+            if value.effect:
+                return f"{value.key}={value.value}:{value.effect}"
+
+            # convert to string and back to yaml
+            # return yaml.dump(yaml.load(str(value), Loader=yaml.FullLoader)).rstrip()
+
+        elif isinstance(value, list):
+            return value
+
+        return str(value)
+
+    def extract_values(self, field, path, entry):
+        """
+        Fields can be defined as json paths, or json paths to be
+        processed with transforms or lambda functions (defined as lists),
+        transforms being left for the whole column if possible, or they
+        are defined as a dict with subfields to be extracted, or
+        a combination of the above.
+
+        Returns a dict that can be merged into the table.
+        """
+        format_value = self.format_value
+        item = {}
+
+        if isinstance(path, dict):
+            subitem = {}
+            for subfield, subpath in path.items():
+                subitem[subfield] = [format_value(match.value) for match in subpath.find(entry)] or ['<none>']
+
+            # dict of lists to list of dicts
+            item[field] = [dict(zip(subitem, i)) for i in zip(*subitem.values())]
+
+        elif isinstance(path, list):
+            item[field] = [format_value(match.value) for match in path[0].find(entry)]
+            if field not in self.deferred:
+                for f in path[1:]:
+                    if isinstance(f, Transform):
+                        item[field] = f.values(item[field])
+                    elif f != 'unroll' and f != 'unrange':
+                        item[field] = [f(v) for v in item[field]]
+
+            if 'unroll' in path:
+                item[field] = unroll(item[field])
+
+            if 'unrange' in path:
+                item[field] = unrange(item[field], field)
+
+        else:
+            item[field] = [format_value(match.value) for match in path.find(entry)] or ['<none>']
+
+        return item
+
+    def extract_fields(self, entry, item):
+        """
+        Go through all paths requested, timing each of them if profiling
+        """
+
+        if not self.profile:
+            for field, path in self.fields.items():
+                item.update(self.extract_values(field, path, entry))
+            return
+
+        timings = self.timings
+        for field, path in self.fields.items():
+            start = time.perf_counter()
+            item.update(self.extract_values(field, path, entry))
+            timings[field] = timings.get(field, 0.0) + time.perf_counter() - start
+
+    def rows(self, entry):
+        """
+        Extract all fields from one entry and expand the result into rows
+        """
+
+        if not self.kubernetes:
+            item = {}
+
+            # extract fields by going through all paths requested
+            self.extract_fields(entry, item)
+
+            # expand the result and add to table
+            return list(product_dict(**item))
+
+        if self.context is None:
+            item = {}
+        else:
+            item = {'context': [self.context]}
+
+        rows = []
+        entry = resource_fields(entry, self.field_class)
+
+        # cilium network policies, for example, allow `specs` as a list of spec
+        specs = entry.get('specs', [entry['spec']])
+        subentry = entry
+
+        for spec in specs:
+            setattr(subentry, 'spec', spec)
+
+            # extract fields by going through all paths requested
+            self.extract_fields(subentry, item)
+
+            # expand the result and add to table
+            rows.extend(product_dict(**item))
+
+        return rows
+
+    def columns(self, entries):
+        """
+        Extract a list of entries into columns
+        """
+
+        rows = []
+        counts = []
+        dropped = 0
+        for entry in entries:
+            try:
+                extracted = self.rows(entry)
+
+            # objects from Kubernetes that the fields don't fit are dropped,
+            # anything else is an error in the table or its data
+            except OBJECT_ERRORS as e:
+                if not self.kubernetes:
+                    raise
+                if not dropped:
+                    logger.warning(f"Dropping objects from '{self.context}' that fields can't be extracted from, {e!r}")
+                dropped += 1
+                continue
+
+            counts.append(len(extracted))
+            rows.extend(extracted)
+
+        if dropped:
+            logger.warning(f"Dropped {dropped} of {len(entries)} objects from '{self.context}'")
+        self.counts = None if dropped else counts
+
+        return as_columns(rows)
+
+
+def as_columns(rows):
+    """
+    Turn a list of row dicts into a dict of columns
+    """
+
+    keys = {}
+    for row in rows:
+        for key in row:
+            keys.setdefault(key, None)
+
+    return {key: [row.get(key) for row in rows] for key in keys}
+
+
+def concat_columns(chunks):
+    """
+    Concatenate columnar chunks, padding columns missing in some chunks
+    """
+
+    columns = {}
+    length = 0
+    for chunk in chunks:
+        size = len(next(iter(chunk.values()))) if chunk else 0
+        for key in chunk:
+            columns.setdefault(key, [None] * length)
+        for key, column in columns.items():
+            column.extend(chunk.get(key, [None] * size))
+        length += size
+
+    return columns
+
+
+def extract_chunk(extractor, entries):
+    """
+    Extract one chunk, also on the worker side of the process pool
+
+    Returns the columns along with the time spent per field and the number
+    of rows of each entry, which isn't known if objects were dropped
+    """
+
+    columns = extractor.columns(entries)
+    return columns, extractor.timings, extractor.counts
+
+
+def pool_context():
+    """
+    The way worker processes are started: forking while other threads are
+    running, like those fetching the next contexts when streaming, can
+    deadlock on locks those threads held, so the workers are started from a
+    fresh process then
+    """
+
+    if threading.active_count() < 2:
+        return None
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def extract(batches, threshold=POOL_THRESHOLD, workers=None, stats=None):
+    """
+    Run the extractors over their batches of entries, given as a list of
+    (extractor, entries) pairs, and return the concatenated columns; if a
+    list is given as `stats`, the number of rows, the time spent per field
+    and the rows of each entry are appended to it for each batch
+
+    Evaluating paths is CPU-bound and holds the GIL, so above a threshold
+    of items in total, chunks of entries are handed to a process pool
+    """
+
+    total = sum(len(entries) for _, entries in batches)
+    workers = workers or os.cpu_count() or 1
+
+    if not threshold or total < threshold or workers < 2:
+        chunks = [(index, extract_chunk(extractor, entries)) for index, (extractor, entries) in enumerate(batches)]
+
+    else:
+        size = max(1000, math.ceil(total / (workers * 4)))
+        logger.debug(f"  Extracting {total} items in chunks of {size} with {workers} processes")
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as pool:
+            futures = [
+                (index, pool.submit(extract_chunk, extractor, entries[start : start + size]))
+                for index, (extractor, entries) in enumerate(batches)
+                for start in range(0, len(entries), size)
+            ]
+            chunks = [(index, future.result()) for index, future in futures]
+
+    if stats is not None:
+        stats.extend({'rows': 0, 'timings': {}, 'counts': []} for _ in batches)
+        for index, (columns, timings, counts) in chunks:
+            batch = stats[len(stats) - len(batches) + index]
+            batch['rows'] += len(next(iter(columns.values()), []))
+            for field, seconds in timings.items():
+                batch['timings'][field] = batch['timings'].get(field, 0.0) + seconds
+            if counts is None or batch['counts'] is None:
+                batch['counts'] = None
+            else:
+                batch['counts'].extend(counts)
+
+    return concat_columns([columns for _, (columns, _, _) in chunks])
+
+
+def slice_columns(columns, start, stop):
+    return {key: column[start:stop] for key, column in columns.items()}
+
+
+class RowCache:
+    """
+    The rows extracted from the objects of one table and context before, by
+    uid along with the resourceVersion they were extracted from; objects
+    that haven't changed since don't have their paths evaluated again
+
+    The key covers everything that goes into the rows, like the fields of
+    the table and whether there is a context column
+    """
+
+    def __init__(self, *key):
+        self.path = cache.cache_dir('rows', f"{cache.digest(__version__, *key)}.pickle")
+        self.rows = cache.load(self.path) or {}
+
+    @staticmethod
+    def version(entry):
+        metadata = entry.get('metadata') or {}
+        return metadata.get('uid'), metadata.get('resourceVersion')
+
+    def split(self, entries):
+        """
+        The entries that need extracting, and the cached rows of the others
+        by their position
+        """
+
+        fresh = []
+        reused = {}
+        for position, entry in enumerate(entries):
+            uid, version = self.version(entry)
+            cached = self.rows.get(uid)
+            if version and cached is not None and cached[0] == version:
+                reused[position] = cached[1]
+            else:
+                fresh.append(entry)
+
+        logger.debug(f"  Reusing the rows of {len(reused)} of {len(entries)} objects")
+        return fresh, reused
+
+    def merge(self, entries, reused, columns, counts):
+        """
+        The columns of all entries in their order, taking the rows of the
+        fresh ones from the extracted `columns`, `counts` rows each, and
+        keep them all for the next time; objects that are gone are dropped
+        """
+
+        self.objects = len(entries)
+
+        if counts is None:
+            logger.debug("  Not caching rows, extraction failed for some objects")
+            rows = [row for position in sorted(reused) for row in reused[position]]
+            return concat_columns([as_columns(rows), columns])
+
+        keys = list(columns)
+        values = zip(*columns.values())
+        counts = iter(counts)
+
+        rows = []
+        cached = {}
+        for position, entry in enumerate(entries):
+            if position in reused:
+                extracted = reused[position]
+            else:
+                extracted = [dict(zip(keys, next(values))) for _ in range(next(counts))]
+
+            uid, version = self.version(entry)
+            if uid and version:
+                cached[uid] = (version, extracted)
+            rows.extend(extracted)
+
+        if len(reused) < len(entries) or len(cached) != len(self.rows):
+            cache.save(self.path, cached)
+        self.rows = cached
+
+        return as_columns(rows)
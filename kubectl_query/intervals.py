@@ -0,0 +1,129 @@
+import ipaddress
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .extract import interval_columns
+
+logger = logging.getLogger('kubectl-query')
+
+
+def encode(values):
+    """
+    Integer encode addresses, once per distinct value; anything that isn't
+    an IPv4 address becomes -1, which is outside of every interval
+    """
+
+    def address(value):
+        try:
+            return int(ipaddress.IPv4Address(value))
+        except ValueError:
+            return -1
+
+    codes, uniques = pd.factorize(values)
+    addresses = np.array([address(value) for value in uniques] + [-1], dtype=np.int64)
+    return addresses[codes]
+
+
+def range_fields(frame):
+    """
+    Columns holding ranges of addresses, see unrange
+    """
+
+    return [column for column in frame.columns if interval_columns(column)[0] in frame.columns]
+
+
+def helper_columns(frame):
+    """
+    Columns holding the bounds of ranges, which aren't meant to be shown
+    """
+
+    return [bound for column in range_fields(frame) for bound in interval_columns(column)]
+
+
+def lookup(points, ranges, column):
+    """
+    Find all pairs of a point within a range by binary search over the
+    sorted points, so the work is proportional to the number of points,
+    ranges and matches rather than to the size of the address space
+    """
+
+    start, end = interval_columns(column)
+
+    addresses = encode(points[column])
+    order = np.argsort(addresses, kind='stable')
+    ordered = addresses[order]
+
+    # ranges without bounds are empty
+    starts = pd.to_numeric(ranges[start], errors='coerce').fillna(1).to_numpy(dtype=np.int64)
+    ends = pd.to_numeric(ranges[end], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+
+    lo = np.searchsorted(ordered, starts, side='left')
+    hi = np.searchsorted(ordered, ends, side='right')
+    counts = np.maximum(hi - lo, 0)
+
+    range_index = np.repeat(np.arange(len(ranges)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    point_index = order[np.repeat(lo, counts) + offsets]
+
+    return point_index, range_index
+
+
+def interval_merge(left, right, column):
+    """
+    Left join two tables where one side holds addresses and the other side
+    ranges of addresses in `column`, and all other common columns match
+    """
+
+    left = left.reset_index(drop=True)
+    right = right.reset_index(drop=True)
+    ranges_left = column in range_fields(left)
+    bounds = list(interval_columns(column))
+
+    if ranges_left:
+        right_index, left_index = lookup(right, left, column)
+    else:
+        left_index, right_index = lookup(left, right, column)
+
+    # the other common columns have to match as well, missing values each
+    # other like in pd.merge
+    keep = np.ones(len(left_index), dtype=bool)
+    for other in left.columns.intersection(right.columns).difference([column] + bounds):
+        a = left[other].iloc[left_index].reset_index(drop=True)
+        b = right[other].iloc[right_index].reset_index(drop=True)
+        keep &= ((a == b).fillna(False) | (a.isna() & b.isna())).to_numpy(dtype=bool)
+    left_index, right_index = left_index[keep], right_index[keep]
+
+    # rows of the left table without any match are kept, like in a left join
+    unmatched = np.setdiff1d(np.arange(len(left)), left_index)
+    left_index = np.concatenate([left_index, unmatched])
+    right_index = np.concatenate([right_index, np.full(len(unmatched), -1)])
+    order = np.argsort(left_index, kind='stable')
+    left_index, right_index = left_index[order], right_index[order]
+
+    result = left.iloc[left_index].reset_index(drop=True)
+    added = right[right.columns.difference(left.columns, sort=False)]
+    result = pd.concat([result, added.reindex(right_index).reset_index(drop=True)], axis=1)
+
+    # matched ranges are replaced by the address found in them
+    if ranges_left:
+        points = right[column].reindex(right_index).to_numpy()
+        result[column] = np.where(right_index >= 0, points, result[column].to_numpy())
+
+    logger.debug(f"  Joined {len(left)} and {len(right)} rows on ranges in '{column}' into {len(result)} rows")
+    return result.drop(columns=[b for b in bounds if b in result.columns])
+
+
+def merge(left, right):
+    """
+    Left join two tables on their common columns, looking up addresses in
+    ranges where only one side holds ranges of a column
+    """
+
+    common = left.columns.intersection(right.columns)
+    for column in common:
+        if (column in range_fields(left)) != (column in range_fields(right)):
+            return interval_merge(left, right, column)
+
+    return pd.merge(left, right, how="left")
@@ -1,19 +1,56 @@
 import logging
 import os.path
+import sys
 
 import click
-from colors import color
-from tabulate import tabulate
+from click.core import ParameterSource
 
+from .aggregate import aggregations
 from .client import Client
-from .config import Config
-from .query import Query
+from .config import Config, split_options
+from .estimate import MAX_ROWS, WARN_ROWS, check
+from .extract import POOL_THRESHOLD
+from .profiling import profile
+from .render import render
+from .writers import BINARY, WRITERS, missing_dependency, write
 
 logger = logging.getLogger('kubectl-query')
 logging.basicConfig(format="# %(levelname)s: %(message)s")
 
 CONTEXT_SETTINGS = {"help_option_names": ["-h", "--help"]}
 
+# tables describing the config itself rather than data in the clusters
+LISTINGS = ('tables', 'queries', 'bundles')
+
+
+def complete_contexts(ctx, param, incomplete):
+    """
+    Shell completion for the contexts found in the kubeconfig
+    """
+
+    return [context for context in ['all'] + Client([]).known_contexts if context.startswith(incomplete)]
+
+
+def complete_names(ctx, param, incomplete):
+    """
+    Shell completion for bundles, queries and tables and their aliases,
+    served from the config cache without touching any cluster
+    """
+
+    config = Config(tuple(ctx.params.get('configpaths') or ()), Client([]), ctx.params.get('use_cache', True))
+
+    names = []
+    for kind in ['bundles', 'queries', 'tables']:
+        for name, prop in getattr(config, kind).items():
+            names.append(click.shell_completion.CompletionItem(name, help=prop.get('note')))
+    for alias, name in config.unaliases.items():
+        names.append(click.shell_completion.CompletionItem(alias, help=name))
+
+    return sorted(
+        [name for name in names if name.value.startswith(incomplete)],
+        key=lambda name: name.value,
+    )
+
 
 @click.command(context_settings=CONTEXT_SETTINGS)
 @click.option(
@@ -63,6 +100,7 @@ CONTEXT_SETTINGS = {"help_option_names": ["-h", "--help"]}
     "contexts",
     default=None,
     multiple=True,
+    shell_complete=complete_contexts,
     help="""
     Override the Kubernetes context, may be provided multiple times, or "all"
     """,
@@ -74,7 +112,17 @@ CONTEXT_SETTINGS = {"help_option_names": ["-h", "--help"]}
     help="""
     Table format to pass on to
     https://github.com/astanin/python-tabulate#table-format,
-    default `color` that is `plain` with custom colored output
+    default `color` that is `plain` with custom colored output, or one of
+    the machine readable formats `jsonl`, `arrow` and `parquet`
+    """,
+)
+@click.option(
+    "--output-file",
+    "output_file",
+    default=None,
+    type=click.Path(dir_okay=False, writable=True),
+    help="""
+    Write the output to a file instead of stdout
     """,
 )
 @click.option(
@@ -123,7 +171,140 @@ CONTEXT_SETTINGS = {"help_option_names": ["-h", "--help"]}
     Include directory with yaml files
     """,
 )
-@click.argument("args", nargs=-1)
+@click.option(
+    "--cache/--no-cache",
+    "use_cache",
+    default=True,
+    help="""
+    Use the local cache of compiled config files and responses
+    """,
+)
+@click.option(
+    "--pool-threshold",
+    "pool_threshold",
+    default=POOL_THRESHOLD,
+    show_default=True,
+    help="""
+    Number of items from which fields are extracted in parallel processes,
+    0 to never do so
+    """,
+)
+@click.option(
+    "--protobuf/--no-protobuf",
+    "use_protobuf",
+    default=False,
+    help="""
+    Fetch built-in resources like pods and nodes in the more compact
+    protobuf encoding, decoding only the fields that are looked at
+    """,
+)
+@click.option(
+    "-g",
+    "--group-by",
+    "group_by",
+    multiple=True,
+    help="""
+    Group rows by the column(s), may be provided multiple times, and
+    aggregate the others as given by --agg
+    """,
+)
+@click.option(
+    "-a",
+    "--agg",
+    "aggregate",
+    multiple=True,
+    help="""
+    Aggregate a column of the grouped rows as FUNCTION:COLUMN, with one of
+    the functions sum, mean, min, max, count, nunique, first and last, or
+    just `count` for the number of rows, may be provided multiple times
+    """,
+)
+@click.option(
+    "--diff",
+    "diff_sides",
+    nargs=2,
+    default=None,
+    help="""
+    Compare the result between two contexts or snapshots saved with -o
+    jsonl, parquet, arrow or csv, showing only removed, changed and added rows
+    """,
+)
+@click.option(
+    "-k",
+    "--key",
+    "key_columns",
+    multiple=True,
+    help="""
+    Select the column(s) identifying a row when comparing, may be provided
+    multiple times; rows with the same key but other values are changed
+    """,
+)
+@click.option(
+    "--estimate",
+    "estimate_only",
+    is_flag=True,
+    help="""
+    Only estimate the objects and rows of each table and context, counting
+    the objects with cheap list calls, and the rows of the result
+    """,
+)
+@click.option(
+    "--warn-rows",
+    "warn_rows",
+    default=WARN_ROWS,
+    show_default=True,
+    help="""
+    Warn before running queries estimated to give more rows, from what was
+    seen in earlier runs, 0 to never do so
+    """,
+)
+@click.option(
+    "--max-rows",
+    "max_rows",
+    default=MAX_ROWS,
+    show_default=True,
+    help="""
+    Refuse to run queries estimated to give more rows, from what was seen
+    in earlier runs, 0 to never do so
+    """,
+)
+@click.option(
+    "--stream",
+    "stream_rows",
+    is_flag=True,
+    help="""
+    Show a table or query context by context as soon as each one has
+    been read and joined, the fastest first, sorting the rows within each
+    context
+    """,
+)
+@click.option(
+    "--unsorted",
+    "unsorted",
+    is_flag=True,
+    help="""
+    Leave the rows in the order they were read rather than sorting them
+    """,
+)
+@click.option(
+    "--profile",
+    "profile_run",
+    is_flag=True,
+    help="""
+    Report timings, sizes, row counts and memory of fetching, extracting,
+    merging and postprocessing to stderr
+    """,
+)
+@click.option(
+    "--profile-format",
+    "profile_format",
+    default="table",
+    type=click.Choice(["table", "json"]),
+    help="""
+    Write the profile as tables or as json
+    """,
+)
+@click.argument("args", nargs=-1, shell_complete=complete_names)
 # pylint: disable=too-many-arguments
 def main(
     verbose,
@@ -133,11 +314,26 @@ def main(
     namespaces,
     contexts,
     tablefmt,
+    output_file,
     sort_override,
     hide_columns,
     list_columns,
     list_available,
     include,
+    use_cache,
+    pool_threshold,
+    use_protobuf,
+    group_by,
+    aggregate,
+    diff_sides,
+    key_columns,
+    estimate_only,
+    warn_rows,
+    max_rows,
+    stream_rows,
+    unsorted,
+    profile_run,
+    profile_format,
     args,
 ):
     """
@@ -168,61 +364,164 @@ def main(
     elif not args:
         main.main(["--help"])
 
+    try:
+        aggregations(split_options(aggregate))
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    if missing_dependency(tablefmt):
+        raise click.UsageError(f"Writing {tablefmt} needs {missing_dependency(tablefmt)} to be installed")
+
+    profile.reset(profile_run)
+
     # prepare the Kubernetes client with various contexts
     client = Client(list(contexts))
 
     # load the configuration file into our internal structure and
-    # amend the client with new contexts if needed
-    config = Config(configpaths, client)
+    # amend the client with new contexts if needed; settings given on the
+    # command line win over those of the tables, the defaults don't
+    settings = {'use_cache': use_cache, 'pool_threshold': pool_threshold, 'use_protobuf': use_protobuf}
+    names = {'use_cache': 'cache', 'pool_threshold': 'pool_threshold', 'use_protobuf': 'protobuf'}
+    ctx = click.get_current_context()
+    defaults = {names[param]: value for param, value in settings.items()}
+    explicit = {
+        names[param]: value
+        for param, value in settings.items()
+        if ctx.get_parameter_source(param) != ParameterSource.DEFAULT
+    }
+    config = Config(configpaths, client, use_cache, defaults, explicit)
 
     # initialize and process the config data according to what we want to query
     config.init_config(args, patterns)
 
-    output = []
-
-    def render(result, tablefmt):
-        """
-        Turn dataframe into a table, by default colorized
-        """
-
-        # colorize the output
-        if tablefmt == "color":
-            colors = ["cyan", "green", "magenta", "white", "yellow"] * 3
-            for column, columncolor in zip(result.columns.values, colors):
-                # pylint: disable=cell-var-from-loop
-                result[column] = result[column].map(lambda x: color(x, columncolor))
-
-        elif tablefmt == "csv":
-            return result.to_csv(index=False)
-
-        return tabulate(
-            result,
-            tablefmt=tablefmt.replace("color", "plain"),
-            stralign="left",
-            showindex=False,
-            headers=[h.upper() for h in result.columns],
-        )
-
-    for arg in config.show:
-        # load all data
-        result = Query(client, config, include, arg)
-        result.postprocess(
-            patterns,
-            filters or config.filters,
-            namespaces or config.namespaces,
-            sort_override,
-            hide_columns,
-            list_columns,
-        )
-        if not len(result.index):
-            continue
-        output.append(render(result, tablefmt))
-
-    if output:
-        print("\n\n".join(output))
+    if tablefmt in BINARY and len(config.show) > 1:
+        raise click.UsageError(f"Writing {tablefmt} needs a single table or query, not {config.show}")
+
+    # the file is closed along with the click context, even on errors
+    if output_file:
+        stream = ctx.with_resource(open(output_file, "wb" if tablefmt in BINARY else "w"))
     else:
+        stream = sys.stdout.buffer if tablefmt in BINARY else sys.stdout
+
+    if estimate_only:
+        from .estimate import estimate_query
+
+        for arg in config.show:
+            tables, rows = estimate_query(client, config, arg, live=True)
+            if tables:
+                columns = {key: ['-' if t[key] is None else t[key] for t in tables] for key in tables[0]}
+                columns['fanout'] = [round(fanout, 2) for fanout in columns['fanout']]
+                render(columns, tablefmt if tablefmt not in WRITERS else 'plain', sys.stdout)
+            objects = sum(t['objects'] or 0 for t in tables)
+            sys.stdout.write(f"# {arg}: {'-' if rows is None else rows} rows estimated from {objects} objects\n")
+        return
+
+    rendered = []
+
+    def output(result, continued=False):
+        with profile.step('render', tablefmt, rows=len(result.index) if hasattr(result, 'index') else None):
+            if tablefmt in WRITERS:
+                write(result, tablefmt, stream)
+            elif continued and tablefmt == "csv":
+                # more rows of the same table
+                render(result, tablefmt, stream, header=False)
+            else:
+                # separate multiple tables by an empty line
+                if rendered:
+                    stream.write("\n")
+                render(result, tablefmt, stream)
+        rendered.append(tablefmt)
+
+    # listing the config needs neither cluster data nor pandas, unless
+    # the rows need to be filtered or written as csv or another machine
+    # readable format
+    machine = tablefmt == "csv" or tablefmt in WRITERS
+    if not (patterns or filters or machine) and all(arg in LISTINGS for arg in config.show):
+        for arg in config.show:
+            result = config.as_columns(arg, sort_override, hide_columns, list_columns)
+            if result:
+                output(result)
+
+    else:
+        from .query import Query, stream_contexts, streamable
+
+        try:
+            check(client, config, warn_rows, max_rows)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+
+        def postprocess(result, fill):
+            return result.postprocess(
+                patterns,
+                filters or config.filters,
+                namespaces or config.namespaces,
+                sort_override,
+                hide_columns,
+                list_columns,
+                fill=fill,
+                group_by=group_by,
+                aggregate=split_options(aggregate),
+                sort=not unsorted,
+            )
+
+        def query(arg, fill, contexts=None):
+            # load all data
+            return postprocess(Query(client, config, include, arg, contexts=contexts), fill)
+
+        def stream_query(arg, fill):
+            # show each context as soon as it's in, as one table for csv
+            columns = None
+            for part in stream_contexts(client, config, include, arg):
+                result = postprocess(part, fill)
+                if not len(result.index):
+                    continue
+                if columns is None:
+                    columns = list(result.columns)
+                    output(result)
+                else:
+                    output(result.reindex(columns=columns, fill_value=fill), continued=True)
+                stream.flush()
+
+        def side(name, arg):
+            # one side of a comparison, either a snapshot or a single context
+            from .diff import load_snapshot
+
+            if os.path.isfile(name):
+                return load_snapshot(name)
+            if name not in client.known_contexts:
+                raise click.UsageError(f"'{name}' is neither a file nor a context")
+            return query(arg, None, contexts=[name])
+
+        for arg in config.show:
+            if diff_sides:
+                from .diff import diff
+
+                prop = config.queries.get(arg) or config.tables.get(arg) or {}
+                key = split_options(key_columns) or prop.get('key', [])
+                result = diff(*[side(name, arg) for name in diff_sides], key)
+            elif stream_rows and streamable(config, arg) and not (group_by or aggregate) and tablefmt not in BINARY:
+                stream_query(arg, None if tablefmt in WRITERS else "-")
+                continue
+            else:
+                if stream_rows:
+                    logger.info(
+                        f"Can't stream '{arg}', only ungrouped queries starting with a table from several contexts, "
+                        "showing it at once"
+                    )
+                result = query(arg, None if tablefmt in WRITERS else "-")
+
+            if not len(result.index):
+                continue
+            output(result)
+
+    if diff_sides and not rendered:
+        logger.info(f"No differences between {diff_sides[0]} and {diff_sides[1]} for {config.show}")
+    elif not rendered:
         logger.warning(f"Could not find any data for {config.show} with patterns {patterns}")
 
+    if profile_run:
+        profile.report(profile_format, sys.stderr)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,198 @@
+import contextlib
+import json
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def maxrss():
+    """
+    Peak resident size of the process so far in bytes, as far as known
+    """
+
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def peak_rss():
+    """
+    Peak resident size in bytes since it was last reset, as Linux keeps it
+    as VmHWM, or None elsewhere
+    """
+
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """
+    Let the peak resident size start over from the current size, which is
+    what Linux does on writing 5 to /proc/self/clear_refs; this costs next
+    to nothing, unlike tracing allocations, so the timings stay as they are
+    """
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class Profile:
+    """
+    Collects timings of a run when enabled: fetches per table and context,
+    extraction time per field path, and steps like merging and each part of
+    postprocessing with the rows going in and out of them
+
+    Memory is the peak resident size of the process during each step, as
+    far as the system allows resetting it, taking nested steps into those
+    around them; the process as a whole ends up at its max rss
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, enabled=False):
+        """
+        Forget what was collected, so that another run in the same process
+        starts over
+        """
+
+        self.enabled = enabled
+        self.fetches = []
+        self.paths = {}
+        self.steps = []
+
+        # the records of the steps that haven't finished, innermost last
+        self.open = []
+
+    def fetch(self, table, context, seconds, size, objects, rows):
+        if self.enabled:
+            self.fetches.append({
+                'table': table,
+                'context': context,
+                'seconds': seconds,
+                'bytes': size,
+                'objects': objects,
+                'rows': rows,
+            })
+
+    def add_paths(self, table, timings):
+        if self.enabled:
+            for field, seconds in timings.items():
+                self.paths[(table, field)] = self.paths.get((table, field), 0.0) + seconds
+
+    @contextlib.contextmanager
+    def step(self, stage, name, frame=None, rows=None):
+        """
+        Time a step, counting the rows of `frame` before and after, or
+        taking `rows` in and whatever is set as `rows_out` on the record
+        """
+
+        record = {'stage': stage, 'name': name, 'rows_in': len(frame) if frame is not None else rows, 'rows_out': None}
+        if not self.enabled:
+            yield record
+            return
+
+        record['peak'] = None
+        self.track_peak()
+        self.open.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self.track_peak()
+            self.open.remove(record)
+
+        if frame is not None:
+            record['rows_out'] = len(frame)
+        self.steps.append(record)
+
+    def track_peak(self):
+        """
+        Take the peak since the last reset into all steps that are open,
+        and start over, so that each step only sees the peak during itself
+        """
+
+        peak = peak_rss()
+        if peak is None or not reset_peak_rss():
+            return
+        for record in self.open:
+            record['peak'] = max(record['peak'] or 0, peak)
+
+    def as_dict(self):
+        return {
+            'fetches': self.fetches,
+            'paths': [
+                {'table': table, 'field': field, 'seconds': seconds}
+                for (table, field), seconds in sorted(self.paths.items(), key=lambda p: -p[1])
+            ],
+            'steps': self.steps,
+            'maxrss': maxrss(),
+        }
+
+    def report(self, fmt, stream):
+        """
+        Write what was collected to the stream, as tables or as JSON
+        """
+
+        report = self.as_dict()
+
+        if fmt == 'json':
+            json.dump(report, stream, indent=2)
+            stream.write("\n")
+            return
+
+        from .render import render
+
+        def megabytes(size):
+            return round(size / 2**20, 1) if size is not None else '-'
+
+        def milliseconds(seconds):
+            return round(seconds * 1000, 1)
+
+        sections = [
+            {
+                'table': [f['table'] for f in report['fetches']],
+                'context': [f['context'] for f in report['fetches']],
+                'ms': [milliseconds(f['seconds']) for f in report['fetches']],
+                'bytes': ['-' if f['bytes'] is None else f['bytes'] for f in report['fetches']],
+                'objects': [f['objects'] for f in report['fetches']],
+                'rows': [f['rows'] for f in report['fetches']],
+            },
+            {
+                'table': [p['table'] for p in report['paths']],
+                'field': [p['field'] for p in report['paths']],
+                'ms': [milliseconds(p['seconds']) for p in report['paths']],
+            },
+            {
+                'stage': [s['stage'] for s in report['steps']],
+                'step': [s['name'] for s in report['steps']],
+                'ms': [milliseconds(s['seconds']) for s in report['steps']],
+                'rows in': ['-' if s['rows_in'] is None else s['rows_in'] for s in report['steps']],
+                'rows out': ['-' if s['rows_out'] is None else s['rows_out'] for s in report['steps']],
+                'peak mb': [megabytes(s['peak']) for s in report['steps']],
+            },
+        ]
+
+        for section in sections:
+            if next(iter(section.values())):
+                render(section, 'plain', stream)
+                stream.write("\n")
+        stream.write(f"Max RSS of the process {megabytes(report['maxrss'])} MB\n")
+
+
+# the profile of this run, only collecting anything once enabled
+profile = Profile()
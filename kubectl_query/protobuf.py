@@ -0,0 +1,714 @@
+import datetime
+import json
+import logging
+
+logger = logging.getLogger('kubectl-query')
+
+# what the API server prefixes protobuf encoded bodies with
+MAGIC = b'k8s\x00'
+
+CONTENT_TYPE = 'application/vnd.kubernetes.protobuf'
+
+# ask for protobuf, custom resources are served as json anyway
+ACCEPT = f"{CONTENT_TYPE}, application/json"
+
+# API versions of the built-in types that have a protobuf encoding
+APIS = ('v1', 'apps/v1')
+
+# seconds of the zero time, shown as null in json
+ZERO_TIME = -62135596800
+
+# Fields of the messages of k8s.io/api and k8s.io/apimachinery as given in
+# their generated.proto, by field number: the json name and the type, which
+# is a scalar, another message, `map:<type>` for maps of strings to a type,
+# and prefixed with `*` if repeated; fields without a name are embedded in
+# their parent, like the volume source of a volume
+#
+# The API server writes every field that isn't a pointer, zero or not, so
+# numbers and booleans that json leaves out when zero are marked with
+# `,omitempty` as in the json tags of their Go types
+#
+# Only what the built-in tables and typical queries look at is decoded,
+# everything else is skipped on the wire
+MESSAGES = {
+    'Unknown': {1: ('typeMeta', 'TypeMeta'), 2: ('raw', 'bytes')},
+    'TypeMeta': {1: ('apiVersion', 'string'), 2: ('kind', 'string')},
+    'ListMeta': {
+        1: ('selfLink', 'string'),
+        2: ('resourceVersion', 'string'),
+        3: ('continue', 'string'),
+        4: ('remainingItemCount', 'int'),
+    },
+    'ObjectMeta': {
+        1: ('name', 'string'),
+        2: ('generateName', 'string'),
+        3: ('namespace', 'string'),
+        5: ('uid', 'string'),
+        6: ('resourceVersion', 'string'),
+        7: ('generation', 'int,omitempty'),
+        8: ('creationTimestamp', 'Time'),
+        9: ('deletionTimestamp', 'Time'),
+        10: ('deletionGracePeriodSeconds', 'int'),
+        11: ('labels', 'map:string'),
+        12: ('annotations', 'map:string'),
+        13: ('ownerReferences', '*OwnerReference'),
+        14: ('finalizers', '*string'),
+    },
+    'OwnerReference': {
+        1: ('kind', 'string'),
+        3: ('name', 'string'),
+        4: ('uid', 'string'),
+        5: ('apiVersion', 'string'),
+        6: ('controller', 'bool'),
+        7: ('blockOwnerDeletion', 'bool'),
+    },
+    'LabelSelector': {1: ('matchLabels', 'map:string'), 2: ('matchExpressions', '*LabelSelectorRequirement')},
+    'LabelSelectorRequirement': {1: ('key', 'string'), 2: ('operator', 'string'), 3: ('values', '*string')},
+    'Condition': {
+        1: ('type', 'string'),
+        2: ('status', 'string'),
+        3: ('observedGeneration', 'int,omitempty'),
+        4: ('lastTransitionTime', 'Time'),
+        5: ('reason', 'string'),
+        6: ('message', 'string'),
+    },
+    'ObjectReference': {
+        1: ('kind', 'string'),
+        2: ('namespace', 'string'),
+        3: ('name', 'string'),
+        4: ('uid', 'string'),
+        5: ('apiVersion', 'string'),
+        6: ('resourceVersion', 'string'),
+        7: ('fieldPath', 'string'),
+    },
+    'LocalObjectReference': {1: ('name', 'string')},
+    # pods
+    'Pod': {1: ('metadata', 'ObjectMeta'), 2: ('spec', 'PodSpec'), 3: ('status', 'PodStatus')},
+    'PodTemplateSpec': {1: ('metadata', 'ObjectMeta'), 2: ('spec', 'PodSpec')},
+    'PodSpec': {
+        1: ('volumes', '*Volume'),
+        2: ('containers', '*Container'),
+        3: ('restartPolicy', 'string'),
+        4: ('terminationGracePeriodSeconds', 'int'),
+        6: ('dnsPolicy', 'string'),
+        7: ('nodeSelector', 'map:string'),
+        8: ('serviceAccountName', 'string'),
+        10: ('nodeName', 'string'),
+        11: ('hostNetwork', 'bool,omitempty'),
+        15: ('imagePullSecrets', '*LocalObjectReference'),
+        16: ('hostname', 'string'),
+        17: ('subdomain', 'string'),
+        18: ('affinity', 'Affinity'),
+        19: ('schedulerName', 'string'),
+        20: ('initContainers', '*Container'),
+        22: ('tolerations', '*Toleration'),
+        24: ('priorityClassName', 'string'),
+        25: ('priority', 'int'),
+        29: ('runtimeClassName', 'string'),
+    },
+    'Volume': {1: ('name', 'string'), 2: ('', 'VolumeSource')},
+    'VolumeSource': {
+        1: ('hostPath', 'HostPathVolumeSource'),
+        2: ('emptyDir', 'EmptyDirVolumeSource'),
+        6: ('secret', 'SecretVolumeSource'),
+        7: ('nfs', 'NFSVolumeSource'),
+        10: ('persistentVolumeClaim', 'PersistentVolumeClaimVolumeSource'),
+        19: ('configMap', 'ConfigMapVolumeSource'),
+    },
+    'HostPathVolumeSource': {1: ('path', 'string'), 2: ('type', 'string')},
+    'EmptyDirVolumeSource': {1: ('medium', 'string'), 2: ('sizeLimit', 'Quantity')},
+    'SecretVolumeSource': {1: ('secretName', 'string'), 3: ('defaultMode', 'int'), 4: ('optional', 'bool')},
+    'ConfigMapVolumeSource': {1: ('', 'LocalObjectReference'), 3: ('defaultMode', 'int'), 4: ('optional', 'bool')},
+    'NFSVolumeSource': {1: ('server', 'string'), 2: ('path', 'string'), 3: ('readOnly', 'bool,omitempty')},
+    'PersistentVolumeClaimVolumeSource': {1: ('claimName', 'string'), 2: ('readOnly', 'bool,omitempty')},
+    'Container': {
+        1: ('name', 'string'),
+        2: ('image', 'string'),
+        3: ('command', '*string'),
+        4: ('args', '*string'),
+        5: ('workingDir', 'string'),
+        6: ('ports', '*ContainerPort'),
+        7: ('env', '*EnvVar'),
+        8: ('resources', 'ResourceRequirements'),
+        9: ('volumeMounts', '*VolumeMount'),
+        14: ('imagePullPolicy', 'string'),
+    },
+    'ContainerPort': {
+        1: ('name', 'string'),
+        2: ('hostPort', 'int,omitempty'),
+        3: ('containerPort', 'int'),
+        4: ('protocol', 'string'),
+        5: ('hostIP', 'string'),
+    },
+    'EnvVar': {1: ('name', 'string'), 2: ('value', 'string')},
+    'ResourceRequirements': {1: ('limits', 'map:Quantity'), 2: ('requests', 'map:Quantity')},
+    'VolumeMount': {
+        1: ('name', 'string'),
+        2: ('readOnly', 'bool,omitempty'),
+        3: ('mountPath', 'string'),
+        4: ('subPath', 'string'),
+    },
+    'Affinity': {1: ('nodeAffinity', 'NodeAffinity')},
+    'NodeAffinity': {
+        1: ('requiredDuringSchedulingIgnoredDuringExecution', 'NodeSelector'),
+        2: ('preferredDuringSchedulingIgnoredDuringExecution', '*PreferredSchedulingTerm'),
+    },
+    'NodeSelector': {1: ('nodeSelectorTerms', '*NodeSelectorTerm')},
+    'NodeSelectorTerm': {
+        1: ('matchExpressions', '*NodeSelectorRequirement'),
+        2: ('matchFields', '*NodeSelectorRequirement'),
+    },
+    'NodeSelectorRequirement': {1: ('key', 'string'), 2: ('operator', 'string'), 3: ('values', '*string')},
+    'PreferredSchedulingTerm': {1: ('weight', 'int'), 2: ('preference', 'NodeSelectorTerm')},
+    'Toleration': {
+        1: ('key', 'string'),
+        2: ('operator', 'string'),
+        3: ('value', 'string'),
+        4: ('effect', 'string'),
+        5: ('tolerationSeconds', 'int'),
+    },
+    'PodStatus': {
+        1: ('phase', 'string'),
+        2: ('conditions', '*PodCondition'),
+        3: ('message', 'string'),
+        4: ('reason', 'string'),
+        5: ('hostIP', 'string'),
+        6: ('podIP', 'string'),
+        7: ('startTime', 'Time'),
+        8: ('containerStatuses', '*ContainerStatus'),
+        9: ('qosClass', 'string'),
+        10: ('initContainerStatuses', '*ContainerStatus'),
+        11: ('nominatedNodeName', 'string'),
+        12: ('podIPs', '*PodIP'),
+    },
+    'PodCondition': {
+        1: ('type', 'string'),
+        2: ('status', 'string'),
+        3: ('lastProbeTime', 'Time'),
+        4: ('lastTransitionTime', 'Time'),
+        5: ('reason', 'string'),
+        6: ('message', 'string'),
+    },
+    'PodIP': {1: ('ip', 'string')},
+    'ContainerStatus': {
+        1: ('name', 'string'),
+        2: ('state', 'ContainerState'),
+        3: ('lastState', 'ContainerState'),
+        4: ('ready', 'bool'),
+        5: ('restartCount', 'int'),
+        6: ('image', 'string'),
+        7: ('imageID', 'string'),
+        8: ('containerID', 'string'),
+        9: ('started', 'bool'),
+    },
+    'ContainerState': {
+        1: ('waiting', 'ContainerStateWaiting'),
+        2: ('running', 'ContainerStateRunning'),
+        3: ('terminated', 'ContainerStateTerminated'),
+    },
+    'ContainerStateWaiting': {1: ('reason', 'string'), 2: ('message', 'string')},
+    'ContainerStateRunning': {1: ('startedAt', 'Time')},
+    'ContainerStateTerminated': {
+        1: ('exitCode', 'int'),
+        2: ('signal', 'int,omitempty'),
+        3: ('reason', 'string'),
+        4: ('message', 'string'),
+        5: ('startedAt', 'Time'),
+        6: ('finishedAt', 'Time'),
+        7: ('containerID', 'string'),
+    },
+    # nodes
+    'Node': {1: ('metadata', 'ObjectMeta'), 2: ('spec', 'NodeSpec'), 3: ('status', 'NodeStatus')},
+    'NodeSpec': {
+        1: ('podCIDR', 'string'),
+        3: ('providerID', 'string'),
+        4: ('unschedulable', 'bool,omitempty'),
+        5: ('taints', '*Taint'),
+        7: ('podCIDRs', '*string'),
+    },
+    'Taint': {1: ('key', 'string'), 2: ('value', 'string'), 3: ('effect', 'string'), 4: ('timeAdded', 'Time')},
+    'NodeStatus': {
+        1: ('capacity', 'map:Quantity'),
+        2: ('allocatable', 'map:Quantity'),
+        3: ('phase', 'string'),
+        4: ('conditions', '*NodeCondition'),
+        5: ('addresses', '*NodeAddress'),
+        7: ('nodeInfo', 'NodeSystemInfo'),
+        9: ('volumesInUse', '*string'),
+    },
+    'NodeCondition': {
+        1: ('type', 'string'),
+        2: ('status', 'string'),
+        3: ('lastHeartbeatTime', 'Time'),
+        4: ('lastTransitionTime', 'Time'),
+        5: ('reason', 'string'),
+        6: ('message', 'string'),
+    },
+    'NodeAddress': {1: ('type', 'string'), 2: ('address', 'string')},
+    'NodeSystemInfo': {
+        1: ('machineID', 'string'),
+        2: ('systemUUID', 'string'),
+        3: ('bootID', 'string'),
+        4: ('kernelVersion', 'string'),
+        5: ('osImage', 'string'),
+        6: ('containerRuntimeVersion', 'string'),
+        7: ('kubeletVersion', 'string'),
+        8: ('kubeProxyVersion', 'string'),
+        9: ('operatingSystem', 'string'),
+        10: ('architecture', 'string'),
+    },
+    # storage
+    'PersistentVolume': {
+        1: ('metadata', 'ObjectMeta'),
+        2: ('spec', 'PersistentVolumeSpec'),
+        3: ('status', 'PersistentVolumeStatus'),
+    },
+    'PersistentVolumeSpec': {
+        1: ('capacity', 'map:Quantity'),
+        2: ('', 'PersistentVolumeSource'),
+        3: ('accessModes', '*string'),
+        4: ('claimRef', 'ObjectReference'),
+        5: ('persistentVolumeReclaimPolicy', 'string'),
+        6: ('storageClassName', 'string'),
+        7: ('mountOptions', '*string'),
+        8: ('volumeMode', 'string'),
+        9: ('nodeAffinity', 'VolumeNodeAffinity'),
+    },
+    'PersistentVolumeSource': {
+        3: ('hostPath', 'HostPathVolumeSource'),
+        5: ('nfs', 'NFSVolumeSource'),
+        20: ('local', 'LocalVolumeSource'),
+        22: ('csi', 'CSIPersistentVolumeSource'),
+    },
+    'LocalVolumeSource': {1: ('path', 'string'), 2: ('fsType', 'string')},
+    'CSIPersistentVolumeSource': {
+        1: ('driver', 'string'),
+        2: ('volumeHandle', 'string'),
+        3: ('readOnly', 'bool,omitempty'),
+        4: ('fsType', 'string'),
+        5: ('volumeAttributes', 'map:string'),
+    },
+    'VolumeNodeAffinity': {1: ('required', 'NodeSelector')},
+    'PersistentVolumeStatus': {1: ('phase', 'string'), 2: ('message', 'string'), 3: ('reason', 'string')},
+    'PersistentVolumeClaim': {
+        1: ('metadata', 'ObjectMeta'),
+        2: ('spec', 'PersistentVolumeClaimSpec'),
+        3: ('status', 'PersistentVolumeClaimStatus'),
+    },
+    'PersistentVolumeClaimSpec': {
+        1: ('accessModes', '*string'),
+        2: ('resources', 'ResourceRequirements'),
+        3: ('volumeName', 'string'),
+        4: ('selector', 'LabelSelector'),
+        5: ('storageClassName', 'string'),
+        6: ('volumeMode', 'string'),
+    },
+    'PersistentVolumeClaimStatus': {
+        1: ('phase', 'string'),
+        2: ('accessModes', '*string'),
+        3: ('capacity', 'map:Quantity'),
+    },
+    # events
+    'Event': {
+        1: ('metadata', 'ObjectMeta'),
+        2: ('involvedObject', 'ObjectReference'),
+        3: ('reason', 'string'),
+        4: ('message', 'string'),
+        5: ('source', 'EventSource'),
+        6: ('firstTimestamp', 'Time'),
+        7: ('lastTimestamp', 'Time'),
+        8: ('count', 'int,omitempty'),
+        9: ('type', 'string'),
+        10: ('eventTime', 'MicroTime'),
+        12: ('action', 'string'),
+        14: ('reportingComponent', 'string'),
+        15: ('reportingInstance', 'string'),
+    },
+    'EventSource': {1: ('component', 'string'), 2: ('host', 'string')},
+    # services
+    'Service': {1: ('metadata', 'ObjectMeta'), 2: ('spec', 'ServiceSpec'), 3: ('status', 'ServiceStatus')},
+    'ServiceSpec': {
+        1: ('ports', '*ServicePort'),
+        2: ('selector', 'map:string'),
+        3: ('clusterIP', 'string'),
+        4: ('type', 'string'),
+        5: ('externalIPs', '*string'),
+        7: ('sessionAffinity', 'string'),
+        8: ('loadBalancerIP', 'string'),
+        10: ('externalName', 'string'),
+        11: ('externalTrafficPolicy', 'string'),
+    },
+    'ServicePort': {
+        1: ('name', 'string'),
+        2: ('protocol', 'string'),
+        3: ('port', 'int'),
+        4: ('targetPort', 'IntOrString'),
+        5: ('nodePort', 'int,omitempty'),
+    },
+    'ServiceStatus': {1: ('loadBalancer', 'LoadBalancerStatus'), 2: ('conditions', '*Condition')},
+    'LoadBalancerStatus': {1: ('ingress', '*LoadBalancerIngress')},
+    'LoadBalancerIngress': {1: ('ip', 'string'), 2: ('hostname', 'string')},
+    # apps
+    'Deployment': {1: ('metadata', 'ObjectMeta'), 2: ('spec', 'DeploymentSpec'), 3: ('status', 'DeploymentStatus')},
+    'DeploymentSpec': {
+        1: ('replicas', 'int'),
+        2: ('selector', 'LabelSelector'),
+        3: ('template', 'PodTemplateSpec'),
+        5: ('minReadySeconds', 'int,omitempty'),
+        6: ('revisionHistoryLimit', 'int'),
+        7: ('paused', 'bool,omitempty'),
+    },
+    'DeploymentStatus': {
+        1: ('observedGeneration', 'int,omitempty'),
+        2: ('replicas', 'int,omitempty'),
+        3: ('updatedReplicas', 'int,omitempty'),
+        4: ('availableReplicas', 'int,omitempty'),
+        5: ('unavailableReplicas', 'int,omitempty'),
+        6: ('conditions', '*DeploymentCondition'),
+        7: ('readyReplicas', 'int,omitempty'),
+    },
+    'DeploymentCondition': {
+        1: ('type', 'string'),
+        2: ('status', 'string'),
+        3: ('lastUpdateTime', 'Time'),
+        4: ('lastTransitionTime', 'Time'),
+        5: ('reason', 'string'),
+        6: ('message', 'string'),
+    },
+}
+
+# messages that have all of their fields above, so paths may return them whole
+COMPLETE = {
+    'OwnerReference',
+    'LabelSelector',
+    'LabelSelectorRequirement',
+    'ObjectReference',
+    'LocalObjectReference',
+    'PersistentVolumeClaimVolumeSource',
+    'ContainerPort',
+    'NodeSelector',
+    'NodeSelectorTerm',
+    'NodeSelectorRequirement',
+    'PreferredSchedulingTerm',
+    'Toleration',
+    'PodIP',
+    'Taint',
+    'NodeAddress',
+    'EventSource',
+    'LoadBalancerIngress',
+}
+
+# kinds that can be decoded, by API version
+KINDS = {
+    'v1': ('Pod', 'Node', 'PersistentVolume', 'PersistentVolumeClaim', 'Event', 'Service'),
+    'apps/v1': ('Deployment',),
+}
+
+# values that stand for a whole message rather than its fields
+SCALARS = ('string', 'int', 'bool', 'bytes', 'Time', 'MicroTime', 'Quantity', 'IntOrString')
+
+
+def field_type(kind):
+    """
+    Split a type from MESSAGES into whether it's repeated, whether it's a
+    map and the type of the values, without `,omitempty`
+    """
+
+    repeated = kind.startswith('*')
+    kind = kind.lstrip('*').split(',')[0]
+    if kind.startswith('map:'):
+        return repeated, True, kind[4:]
+    return repeated, False, kind
+
+
+def plan_field(message, number, fields=None):
+    """
+    How to decode a field of a message: its json name, whether it's repeated
+    or a map, its type, the plan for its own fields if it's a message, all
+    of them unless `fields` is given to be filled in, and whether it's left
+    out when zero
+    """
+
+    name, kind = MESSAGES[message][number]
+    omitempty = kind.endswith(',omitempty')
+    repeated, is_map, kind = field_type(kind)
+    if kind in SCALARS:
+        return (name, repeated, is_map, kind, None, omitempty)
+    return (name, repeated, is_map, kind, full_plan(kind) if fields is None else fields, omitempty)
+
+
+def full_plan(message):
+    """
+    The plan to decode all known fields of a message, by field number
+    """
+
+    return {number: plan_field(message, number) for number in MESSAGES[message]}
+
+
+def varint(data, pos):
+    """
+    Read a base 128 varint, returning the value and the position after it
+    """
+
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def timestamp(seconds, nanos=0, micro=False):
+    if seconds == ZERO_TIME:
+        return None
+    moment = datetime.datetime.fromtimestamp(seconds, tz=datetime.timezone.utc)
+    if micro:
+        return moment.strftime('%Y-%m-%dT%H:%M:%S') + f".{nanos // 1000:06d}Z"
+    return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def decode_scalar(kind, data, start, end, value):
+    """
+    The json value of a scalar, taking either the varint `value` or the
+    bytes between `start` and `end`
+    """
+
+    if kind == 'string':
+        return data[start:end].decode()
+    if kind == 'int':
+        # negative numbers are encoded as 64 bit two's complement
+        return value - (1 << 64) if value >= 1 << 63 else value
+    if kind == 'bool':
+        return bool(value)
+    if kind == 'bytes':
+        return data[start:end]
+
+    fields = decode(data, start, end, None)
+    if kind in ('Time', 'MicroTime'):
+        return timestamp(fields.get(1, 0), fields.get(2, 0), kind == 'MicroTime')
+    if kind == 'Quantity':
+        return fields.get(1, b'').decode()
+    if kind == 'IntOrString':
+        return fields.get(3, b'').decode() if fields.get(1) else fields.get(2, 0)
+    raise ValueError(f"Unknown protobuf type {kind}")
+
+
+def decode(data, start, end, plan):
+    """
+    Decode the bytes between `start` and `end` into a dict like the json
+    encoding would give, for the fields in the plan, leaving out empty
+    strings, zero times and zero `omitempty` fields just as json does;
+    without a plan, the raw values are returned by field number
+    """
+
+    item = {}
+    pos = start
+    while pos < end:
+        key = data[pos]
+        if key < 0x80:
+            pos += 1
+        else:
+            key, pos = varint(data, pos)
+        number, wire = key >> 3, key & 7
+
+        value = None
+        if wire == 2:
+            length = data[pos]
+            if length < 0x80:
+                value_start = pos + 1
+            else:
+                length, value_start = varint(data, pos)
+            value_end = pos = value_start + length
+        elif wire == 0:
+            value, pos = varint(data, pos)
+            value_start = value_end = pos
+        elif wire == 1:
+            pos += 8
+            continue
+        elif wire == 5:
+            pos += 4
+            continue
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire}")
+
+        if plan is None:
+            item[number] = value if wire == 0 else data[value_start:value_end]
+            continue
+
+        field = plan.get(number)
+        if field is None:
+            continue
+        name, repeated, is_map, kind, fields, omitempty = field
+
+        if is_map:
+            entry = decode(data, value_start, value_end, None)
+            raw = entry.get(2, b'')
+            decoded = raw.decode() if kind == 'string' else decode_scalar(kind, raw, 0, len(raw), None)
+            item.setdefault(name, {})[entry.get(1, b'').decode()] = decoded
+            continue
+
+        if fields is not None:
+            decoded = decode(data, value_start, value_end, fields)
+        elif kind == 'string':
+            decoded = data[value_start:value_end].decode()
+            if not decoded and not repeated:
+                continue
+        else:
+            decoded = decode_scalar(kind, data, value_start, value_end, value)
+            if decoded is None or (omitempty and not decoded):
+                continue
+
+        if not name:
+            item.update(decoded)
+        elif repeated:
+            item.setdefault(name, []).append(decoded)
+        else:
+            item[name] = decoded
+
+    return item
+
+
+def loads(data, kind, plan=None):
+    """
+    Decode a list of `kind` as served in protobuf into the same dict as
+    `json.loads` would give for its json encoding, for the fields in the
+    plan or all that are known; json is decoded as such
+    """
+
+    if not data.startswith(MAGIC):
+        return json.loads(data)
+
+    envelope = decode(data, len(MAGIC), len(data), full_plan('Unknown'))
+    raw = envelope.get('raw', b'')
+    plan = full_plan(kind) if plan is None else plan
+
+    # the list itself only has its metadata and the items, decoded as they come
+    result = {**envelope.get('typeMeta', {}), 'metadata': {}, 'items': []}
+    items = result['items']
+    pos = 0
+    while pos < len(raw):
+        key, pos = varint(raw, pos)
+        length, start = varint(raw, pos)
+        pos = start + length
+        if key >> 3 == 1:
+            result['metadata'] = decode(raw, start, pos, full_plan('ListMeta'))
+        elif key >> 3 == 2:
+            items.append(decode(raw, start, pos, plan))
+
+    return result
+
+
+def path_members(path):
+    """
+    The parts of a parsed JSON path from left to right
+    """
+
+    from jsonpath_ng import Child, Root, This
+
+    if isinstance(path, Child):
+        return path_members(path.left) + path_members(path.right)
+    if isinstance(path, (Root, This)):
+        return []
+    return [path]
+
+
+def locate(message, name):
+    """
+    The field numbers leading to the field with the json name in a message,
+    through embedded messages, along with the message of each number
+    """
+
+    for number, (field, kind) in MESSAGES[message].items():
+        if field == name:
+            return [(message, number)]
+        if not field:
+            found = locate(kind, name)
+            if found:
+                return [(message, number)] + found
+    return None
+
+
+def plan_path(message, path, plan):
+    """
+    Add what `path` looks at to the plan for `message`, returning whether
+    all of it is known to the decoder
+    """
+
+    from jsonpath_ng import Fields, Index, Slice
+    from jsonpath_ng.ext.filter import Filter
+
+    kind, is_map = message, False
+    for member in path_members(path):
+        if isinstance(member, (Index, Slice)):
+            continue
+
+        if isinstance(member, Filter):
+            if kind in SCALARS or not all(plan_path(kind, e.target, plan) for e in member.expressions):
+                return False
+            continue
+
+        if not isinstance(member, Fields):
+            # functions like sub() work on the value found so far
+            return type(member).__module__.startswith('jsonpath_ng.ext') and kind in SCALARS
+
+        if len(member.fields) != 1:
+            return False
+        if is_map:
+            is_map = False
+            continue
+        if kind in SCALARS:
+            return False
+
+        steps = locate(kind, member.fields[0])
+        if steps is None:
+            return False
+        for step in steps:
+            fields = plan[step[1]][4] if step[1] in plan else {}
+            plan[step[1]] = plan_field(*step, fields)
+            plan = fields
+        _, _, is_map, kind, _, _ = plan_field(*steps[-1], {})
+
+    if is_map or kind in SCALARS:
+        return True
+    if kind in COMPLETE:
+        plan.update(full_plan(kind))
+        return True
+    return False
+
+
+def table_plan(api, kind, fields, versioned=False):
+    """
+    The plan to decode only what the fields of a table look at, if the
+    table can be fetched in protobuf: only for the built-in types and only
+    if all of its paths find what they look for in what is decoded,
+    otherwise it is fetched in json to get the complete objects
+
+    If `versioned`, the uid and resourceVersion are decoded as well, which
+    tell the row cache which objects are unchanged
+    """
+
+    if kind not in KINDS.get(api, ()):
+        return None
+
+    paths = []
+    for path in fields.values():
+        if isinstance(path, dict):
+            paths.extend(path.values())
+        elif isinstance(path, list):
+            paths.append(path[0])
+        else:
+            paths.append(path)
+
+    plan = {}
+    missing = [str(p) for p in paths if not plan_path(kind, p, plan)]
+    if missing:
+        logger.debug(f"  Fetching {kind} as json for {missing}")
+        return None
+
+    if versioned:
+        metadata = plan.setdefault(1, plan_field(kind, 1, {}))[4]
+        metadata.update({number: plan_field('ObjectMeta', number) for number in (5, 6)})
+    return plan
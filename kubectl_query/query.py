@@ -1,21 +1,158 @@
-import functools
 import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 
-from .table import Table
+from .aggregate import aggregations, group
+from .config import split_options
+from .estimate import OTHER_APIS, record_query
+from .intervals import helper_columns, merge
+from .profiling import profile
+from .protobuf import table_plan
+from .table import Table, fetch_lists
+from .urls import prefetch, table_requests
 
 logger = logging.getLogger('kubectl-query')
 
+# lists fetched at the same time when streaming
+STREAM_WORKERS = 8
+
+
+def explode(table, d):
+    """
+    Turn the lists in the columns of a table into rows
+    """
+
+    for column in d:
+        if isinstance(d[column][0], list):
+            with profile.step('explode', f"{table}.{column}", rows=len(d)) as step:
+                d = d.explode(column)
+                step['rows_out'] = len(d)
+    return d
+
+
+def merge_tables(tablenames, data):
+    """
+    Left join the tables one after the other
+    """
+
+    result = data[0]
+    for table, d in zip(tablenames[1:], data[1:]):
+        with profile.step('merge', table, rows=len(result)) as step:
+            result = merge(result, d)
+            step['rows_out'] = len(result)
+    return result
+
+
+def streamable(config, name):
+    """
+    Whether a query, or table, starts with a table read from Kubernetes in
+    several contexts, so that it can be shown context by context, its rows
+    only ever joining rows of the same context; the other tables from
+    Kubernetes need to be read from the same contexts, and rows grouped
+    across contexts need all of them at once
+    """
+
+    if name in config.queries:
+        prop = config.queries[name]
+        tablenames = prop.get('tables', [])
+        if not tablenames or prop.get('group_by') or prop.get('aggregate'):
+            return False
+    elif name in config.tables:
+        tablenames = [name]
+    else:
+        return False
+
+    tables = [config.tables.get(table, {}) for table in tablenames]
+    contexts = tables[0].get('contexts', [])
+    return (
+        tables[0].get('api') not in OTHER_APIS
+        and len(contexts) > 1
+        and all(t.get('contexts', []) == contexts for t in tables if t.get('api') not in OTHER_APIS)
+    )
+
+
+def stream_contexts(client, config, include, name, workers=STREAM_WORKERS):
+    """
+    Load a query context by context, fetching the contexts concurrently
+    and yielding a Query for each as soon as the lists of all its tables
+    are in, the fastest cluster first; the tables of each context are joined
+    on their own, those not read from Kubernetes being joined to every
+    context, so that only the rows of the contexts that haven't been shown
+    yet are held in memory
+
+    Only waiting for the lists runs in threads, the lists are decoded and
+    their fields extracted here one context after the other, as both hold
+    the GIL and would slow down each other and the contexts that are in
+    """
+
+    tablenames = config.queries[name]['tables'] if name in config.queries else [name]
+    props = {table: config.tables[table] for table in tablenames}
+    contexts = props[tablenames[0]].get('contexts', [])
+
+    # tables from files, urls or DNS are the same in every context
+    static = {
+        table: Table(client, table, include, **prop) for table, prop in props.items() if prop.get('api') in OTHER_APIS
+    }
+    fetching = [table for table in props if table not in static]
+    plans = {
+        table: table_plan(prop['api'], prop['kind'], prop['fields'], prop.get('cache', True))
+        for table, prop in props.items()
+        if table in fetching and prop.get('protobuf')
+    }
+
+    # responses are handed over through a queue rather than kept by futures,
+    # so they are released as soon as they have been extracted
+    fetched = queue.Queue()
+
+    def fetch(context, table):
+        prop = props[table]
+        start = time.perf_counter()
+        try:
+            responses = fetch_lists(
+                client, context, prop['api'], prop['kind'], prop.get('namespaces', []), plans.get(table)
+            )
+        except Exception as e:
+            responses = e
+        fetched.put((context, table, time.perf_counter() - start, responses))
+
+    def load(table, context, prefetched):
+        prop = dict(props[table], contexts=[context], no_context=False, prefetched={context: prefetched.pop(table)})
+        return Table(client, table, include, **prop)
+
+    logger.debug(f"Streaming '{name}' from {len(contexts)} contexts")
+    with ThreadPoolExecutor(max_workers=min(workers, len(contexts) * len(fetching))) as pool:
+        for context in contexts:
+            for table in fetching:
+                pool.submit(fetch, context, table)
+
+        # the responses of the contexts that are still missing some tables
+        pending = {context: {} for context in contexts}
+        while pending:
+            context, table, seconds, responses = fetched.get()
+            pending[context][table] = (seconds, responses)
+            del responses
+            if len(pending[context]) < len(fetching):
+                continue
+
+            prefetched = pending.pop(context)
+            tables = {**static, **{table: load(table, context, prefetched) for table in fetching}}
+            yield Query(client, config, include, name, [tables[table] for table in tablenames])
+            del tables
+
 
 class Query(pd.DataFrame):
     """
     Represents the entire query and holds the result
     """
 
-    def __init__(self, client, config, include, query_name):
+    def __init__(self, client, config, include, query_name, loaded=None, contexts=None):
         """
-        Load each resource and combine the result
+        Load each resource and combine the result, or combine the tables
+        given as `loaded` if they have been loaded already; `contexts`
+        stands in for the contexts of the tables for this query alone
         """
 
         data = []
@@ -31,27 +168,38 @@ class Query(pd.DataFrame):
             tablenames = [query_name]
 
         # for showing the internal state
-        if query_name in ['tables', 'queries', 'bundles']:
+        if loaded is not None:
+            data = [explode(table, d) for table, d in zip(tablenames, loaded)]
+        elif query_name in ['tables', 'queries', 'bundles']:
             data = [config.as_table(query_name)]
         else:
+            # fetch the urls of all url tables at once, for this query alone
+            responses = {}
+            urltables = [config.tables[table] for table in tablenames if config.tables[table].get('api') == 'url']
+            prefetch([request for prop in urltables for request in table_requests(prop)], responses)
+
             # for each kind of resource, build a table and append it to the data set
+            rows_in = 0
             for table in tablenames:
-                d = Table(client, table, include, **config.tables[table])
-                for column in d:
-                    if isinstance(d[column][0], list):
-                        d = d.explode(column)
-                data.append(d)
+                prop = config.tables[table]
+                if contexts is not None:
+                    prop = dict(prop, contexts=contexts)
+                if prop.get('api') == 'url':
+                    prop = dict(prop, responses=responses)
+                d = Table(client, table, include, **prop)
+                if not data:
+                    rows_in = len(d)
+                data.append(explode(table, d))
 
-        # zip through the data set and pd.merge them all together
+        # zip through the data set and merge them all together, context by
+        # context, looking up addresses in ranges where needed
         try:
-            result = functools.reduce(
-                lambda left, right: pd.merge(
-                    left,
-                    right,
-                    how="left",
-                ),
-                data,
-            )
+            result = merge_tables(tablenames, data)
+            result = result.drop(columns=helper_columns(result))
+
+            # remember the fan-out of the joins for estimating the next runs
+            if loaded is None and query_name in config.queries and len(tablenames) > 1:
+                record_query(query_name, rows_in, len(result))
         except Exception as e:
             logger.critical(f"Could not join {tablenames} together: {e}")
             result = []
@@ -62,9 +210,27 @@ class Query(pd.DataFrame):
         # and we want to keep the result as a DataFrame
         super().__init__(result)
 
-    def postprocess(self, patterns, filters, namespaces, sort_override, hide_columns, list_columns):
+    def postprocess(
+        self,
+        patterns,
+        filters,
+        namespaces,
+        sort_override,
+        hide_columns,
+        list_columns,
+        fill="-",
+        group_by=(),
+        aggregate=(),
+        sort=True,
+    ):
         """
-        Cleanup and filtering of combined result
+        Cleanup and filtering of combined result; missing values are filled
+        with `fill`, or kept as such if it is None, and rows are left in the
+        order they were read in unless `sort`
+
+        If rows are grouped, either by the query or by the arguments, the
+        result is a new DataFrame with one row per group, otherwise the
+        result is changed in place; either way, the result is returned
         """
 
         logger.debug("Postprocessing:")
@@ -72,12 +238,13 @@ class Query(pd.DataFrame):
         # drop rows that have no namespace or the namespace isn't in the list
         if namespaces and 'namespace' in self.columns:
             logger.debug(f"Limiting to namespace(s) {namespaces}")
-            matches = self.loc[self['namespace'].isin(namespaces)]
-            drop_rows = self.index.difference(matches.index)
-            self.drop(drop_rows, inplace=True)
+            with profile.step('postprocess', 'namespaces', self):
+                matches = self.loc[self['namespace'].isin(namespaces)]
+                drop_rows = self.index.difference(matches.index)
+                self.drop(drop_rows, inplace=True)
 
-        if filters:
-            for k, v in [f.split('=') for f in filters]:
+        for k, v in [f.split('=') for f in filters or []]:
+            with profile.step('postprocess', f"filter {k}", self):
                 k = k.lower()
                 logger.debug(f"Filtering on '{k}' with pattern '.*{v}.*'")
                 try:
@@ -94,71 +261,79 @@ class Query(pd.DataFrame):
                     logger.info(f"Failed to filter on '{k}' with pattern '.*{v}.*' ({e})")
                     pass
 
-        # fill the NaN's with dashes
-        self.fillna("-", inplace=True)
-
-        # sort the result
-        if sort_override:
-            sort_by = []
-            for s in sort_override:
-                if ',' in s:
-                    sort_by.extend(s.split(','))
-                else:
-                    sort_by.append(s)
-        else:
-            sort_by = self.query.get("sort", [])
+        # rows that are grouped are filled afterwards, so that missing values
+        # aren't counted or compared as dashes
+        group_by = split_options(group_by) or self.query.get("group_by", [])
+        aggregate = aggregate or self.query.get("aggregate", [])
 
-        if sort_by:
-            try:
-                if sort_by == ["usagecpu"]:
-                    self["usagecpu"] = self["usagecpu"].apply(pd.to_numeric, errors="coerce")
-                    self.sort_values(by=sort_by, inplace=True, ascending=False)
-                elif sort_by == ["usagemem"]:
-                    self["usagemem"] = self["usagemem"].apply(pd.to_numeric, errors="coerce")
-                    self.sort_values(by=sort_by, inplace=True, ascending=False)
-                else:
-                    self.sort_values(by=sort_by, inplace=True)
-            except Exception as e:
-                logger.warning(f"Could not sort by {sort_by}, error on {e}")
-                pass
+        # fill the NaN's with dashes
+        if fill is not None and not (group_by or aggregate):
+            with profile.step('postprocess', 'fill', self):
+                self.fillna(fill, inplace=True)
 
         # if there's a pattern or patterns, look for rows matching those patterns
         # in any column
         if patterns:
-            matches = self.apply(lambda col: col.str.contains("|".join(patterns), na=False), axis=1).any(axis=1)
+            with profile.step('postprocess', 'patterns', self):
+                matches = self.apply(lambda col: col.str.contains("|".join(patterns), na=False), axis=1).any(axis=1)
+
+                # invert the selection to be able to drop those that don't match
+                drop_rows = self[~matches.values].index
+                self.drop(drop_rows, inplace=True)
+                logger.debug(f"  Dropped {len(drop_rows)} rows that did not match {patterns}")
+
+        # group the rows and aggregate them
+        result = self
+
+        if group_by or aggregate:
+            with profile.step('postprocess', f"group {','.join(group_by)}", rows=len(self)) as step:
+                try:
+                    result = group(self, group_by, aggregations(aggregate))
+                except Exception as e:
+                    logger.warning(f"Could not group by {group_by} with {aggregate}, error on {e}")
+                step['rows_out'] = len(result)
 
-            # invert the selection to be able to drop those that don't match
-            drop_rows = self[~matches.values].index
-            self.drop(drop_rows, inplace=True)
-            logger.debug(f"  Dropped {len(drop_rows)} rows that did not match {patterns}")
+            if fill is not None:
+                with profile.step('postprocess', 'fill', result):
+                    result.fillna(fill, inplace=True)
+
+        # sort the result, grouped rows only by what's left of the columns
+        sort_by = (split_options(sort_override) or self.query.get("sort", [])) if sort else []
+        if result is not self:
+            sort_by = [c for c in sort_by if c in result.columns]
+
+        if sort_by:
+            with profile.step('postprocess', f"sort {','.join(sort_by)}", result):
+                try:
+                    if sort_by == ["usagecpu"]:
+                        result["usagecpu"] = result["usagecpu"].apply(pd.to_numeric, errors="coerce")
+                        result.sort_values(by=sort_by, inplace=True, ascending=False)
+                    elif sort_by == ["usagemem"]:
+                        result["usagemem"] = result["usagemem"].apply(pd.to_numeric, errors="coerce")
+                        result.sort_values(by=sort_by, inplace=True, ascending=False)
+                    else:
+                        result.sort_values(by=sort_by, inplace=True)
+                except Exception as e:
+                    logger.warning(f"Could not sort by {sort_by}, error on {e}")
+                    pass
 
         # select a possible subset of columns
-        hide = []
-        if hide_columns:
-            for c in hide_columns:
-                if ',' in c:
-                    hide.extend(c.lower().split(','))
-                else:
-                    hide.append(c.lower())
+        hide = [c.lower() for c in split_options(hide_columns)]
 
         if list_columns:
-            limit_columns = []
-            for c in list_columns:
-                if ',' in c:
-                    limit_columns.extend(c.lower().split(','))
-                else:
-                    limit_columns.append(c.lower())
+            limit_columns = [c.lower() for c in split_options(list_columns)]
 
             logger.debug(f"Limiting columns to {limit_columns}")
 
-            for c in self.columns:
+            for c in result.columns:
                 if c not in limit_columns:
                     hide.append(c)
 
-        # drop all columns configured to be 'hide'
+        # drop all columns configured to be 'hide', as far as they are still there
         hide.extend(self.query.get("hide", []))
+        hide = [c for c in hide if c in result.columns]
         if hide:
-            self.drop(columns=hide, inplace=True)
+            result.drop(columns=hide, inplace=True)
             logger.debug(f"  Dropped columns {hide}")
 
-        return self
+        return result
@@ -0,0 +1,199 @@
+import functools
+import itertools
+import re
+
+COLORS = ["cyan", "green", "magenta", "white", "yellow"]
+
+# rows written to the stream at once
+CHUNK = 5000
+
+# same padding and separators as the `plain` format of tabulate
+PADDING = 2
+SEPARATOR = "  "
+
+INTEGER = re.compile(r"[-+]?\d+")
+FLOAT = re.compile(r"[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?|[-+]?(inf|nan)", re.I)
+
+
+def afterpoint(string):
+    """
+    Number of characters after the decimal point, as tabulate counts them
+    """
+
+    if INTEGER.fullmatch(string):
+        return -1
+    position = string.rfind('.')
+    if position < 0:
+        position = string.lower().rfind('e')
+    return len(string) - position - 1 if position >= 0 else -1
+
+
+def as_strings(values):
+    """
+    Turn the values of a column into strings and tell how to align them:
+    like tabulate, integers are right aligned and floats formatted and
+    aligned at the decimal point, decided once for the whole column
+
+    The spaces aligning the decimal points are returned on their own, so
+    they can go after the colors and be stripped at the end of a line;
+    a Series is worked on as a whole, lists like those of the listings
+    value by value, so they don't need pandas
+    """
+
+    if hasattr(values, 'dtype'):
+        return series_strings(values)
+
+    strings = [str(v) for v in values]
+    none = [''] * len(strings)
+    if strings and all(map(INTEGER.fullmatch, strings)):
+        return strings, none, 'right'
+    if not strings or not all(map(FLOAT.fullmatch, strings)):
+        return strings, none, 'left'
+
+    strings = [format(float(v), 'g') for v in strings]
+    points = [afterpoint(s) for s in strings]
+    decimals = max(points)
+    return strings, [' ' * (decimals - p) for p in points], 'right'
+
+
+def series_strings(values):
+    """
+    as_strings for a whole Series at once
+    """
+
+    import pandas as pd
+
+    values = values.reset_index(drop=True)
+    none = pd.Series('', index=values.index, dtype=str)
+
+    if values.dtype.kind == 'f':
+        strings = pd.Series(list(map('{:g}'.format, values.tolist())), dtype=str)
+
+    else:
+        # missing values become missing strings, so they're named one by one
+        strings = values.astype(str)
+        missing = strings.isna()
+        if missing.any():
+            strings[missing] = values[missing].map(str)
+
+        if values.dtype.kind in 'iu' or (len(strings) and strings.str.fullmatch(INTEGER).all()):
+            return strings, none, 'right'
+        if not len(strings) or not strings.str.fullmatch(FLOAT).all():
+            return strings, none, 'left'
+        strings = pd.Series(list(map('{:g}'.format, strings.astype(float).tolist())), dtype=str)
+
+    # align the decimal points, or the exponents if there are none, looking
+    # at each of the values only once as there are usually few of them
+    points = strings.map({s: afterpoint(s) for s in strings.unique()})
+    pads = points.max() - points
+    return strings, pads.map({n: ' ' * n for n in pads.unique()}).astype(str), 'right'
+
+
+def cells(strings, trail, align, width, prefix, suffix):
+    """
+    The padded and colored cells of a slice of a column
+    """
+
+    # the colors take up no room, so they're added to the width
+    width += len(prefix) + len(suffix)
+    if hasattr(strings, 'str'):
+        if align == 'right':
+            return (prefix + strings + suffix + trail).str.rjust(width)
+        return (prefix + strings + suffix).str.ljust(width)
+
+    if align == 'right':
+        return [f"{prefix}{s}{suffix}{t}".rjust(width) for s, t in zip(strings, trail)]
+    return [f"{prefix}{s}{suffix}".ljust(width) for s in strings]
+
+
+def render_fixed(result, colorize, stream):
+    """
+    Write the result as fixed width table: widths and alignment are worked
+    out per column, colors are applied per column, and rows are formatted
+    and written in chunks; returns False without writing anything if a
+    value spans multiple lines, which is left to tabulate
+    """
+
+    colors = itertools.cycle(COLORS)
+    headers = []
+    columns = []
+    length = 0
+
+    keys = list(result.keys())
+    for column in keys:
+        strings, trail, align = as_strings(result[column])
+        length = len(strings)
+        if hasattr(strings, 'str'):
+            multiline = strings.str.contains('\n', regex=False).any()
+            longest = (strings.str.len() + trail.str.len()).max() if length else 0
+        else:
+            multiline = any('\n' in s for s in strings)
+            longest = max((len(s) + len(t) for s, t in zip(strings, trail)), default=0)
+        if multiline:
+            return False
+
+        header = column.upper()
+        width = max(len(header) + PADDING, longest)
+
+        # like tabulate, don't leave trailing whitespace
+        if column == keys[-1] and align == 'left':
+            width = 0
+
+        prefix, suffix = "", ""
+        if colorize:
+            from colors import color
+
+            prefix, suffix = color("\0", next(colors)).split("\0")
+
+        headers.append(header.rjust(width) if align == 'right' else header.ljust(width))
+        columns.append((strings, trail, align, width, prefix, suffix))
+
+    stream.write(SEPARATOR.join(headers).rstrip())
+    for start in range(0, length, CHUNK):
+        chunk = [
+            cells(strings[start : start + CHUNK], trail[start : start + CHUNK], *rest)
+            for strings, trail, *rest in columns
+        ]
+        if hasattr(chunk[0], 'str'):
+            rows = functools.reduce(lambda row, cell: row + SEPARATOR + cell, chunk).str.rstrip().str.cat(sep="\n")
+        else:
+            rows = "\n".join(SEPARATOR.join(row).rstrip() for row in zip(*chunk))
+        stream.write("\n")
+        stream.write(rows)
+    stream.write("\n")
+
+    return True
+
+
+def render(result, tablefmt, stream, header=True):
+    """
+    Write a DataFrame, or a dict of columns, to the stream as table, by
+    default colorized; tabulate is only used for the fancier formats, and
+    the header can be left out of csv to add rows to a table written before
+    """
+
+    if tablefmt in ("color", "plain") and render_fixed(result, tablefmt == "color", stream):
+        return
+
+    if tablefmt == "csv":
+        return result.to_csv(stream, index=False, header=header)
+
+    from tabulate import tabulate
+
+    # colorize the output
+    if tablefmt == "color":
+        from colors import color
+
+        for column, columncolor in zip(list(result.keys()), itertools.cycle(COLORS)):
+            result[column] = [color(x, columncolor) for x in result[column]]
+
+    stream.write(
+        tabulate(
+            result,
+            tablefmt=tablefmt.replace("color", "plain"),
+            stralign="left",
+            showindex=False,
+            headers=[h.upper() for h in result.keys()],
+        )
+    )
+    stream.write("\n")
@@ -1,22 +1,49 @@
-import ast  # noqa: F401
 import glob
-import ipaddress  # noqa: F401
-import itertools
+import json
 import logging
+import os
+import time
 
-import dns.exception
-import dns.query
-import dns.rdatatype
-import dns.xfr
-import dns.zone
 import pandas as pd
-import requests
 import yaml
-from kubernetes.dynamic.resource import ResourceField
+
+from .estimate import OTHER_APIS, record
+from .extract import (
+    POOL_THRESHOLD,
+    Extractor,
+    RowCache,
+    concat_columns,
+    extract,
+    slice_columns,
+)
+from .profiling import profile
+from .protobuf import ACCEPT, loads, table_plan
+from .transforms import apply_transforms
+from .urls import fetch, prefetch, table_requests
+from .zones import TIMEOUT, ZoneRows, load_zones
 
 logger = logging.getLogger('kubectl-query')
 
 
+def fetch_lists(client, context, api, kind, namespaces, plan=None):
+    """
+    The raw responses listing a kind in one context, in all namespaces or
+    only those given, in protobuf if there is a plan to decode it; this only
+    waits on the network, so it can run in a thread next to extraction
+    """
+
+    resource = client.client(context).resources.get(api_version=api, kind=kind)
+
+    responses = []
+    for namespace in namespaces or [None]:
+        if plan is None:
+            response = resource.get(namespace=namespace, serialize=False)
+        else:
+            response = resource.get(namespace=namespace, serialize=False, header_params={'Accept': ACCEPT})
+        responses.append(response.data)
+    return responses
+
+
 class Table(pd.DataFrame):
     """
     Akin to running a
@@ -36,267 +63,193 @@ class Table(pd.DataFrame):
         independently when joining other tables
         """
 
-        def format_list(value):
-            if isinstance(value, list):
-                return ",".join(value)
-            else:
-                return str(value)
-
-        def format_match(value):
-            if value.operator == 'In':
-                return f"{value.key} = {format_list(value.values)}"
-            elif value.operator == 'NotIn':
-                return f"{value.key} != {format_list(value.values)}"
-            else:
-                return f"{value.key} {value.operator.lower()}"
-
-        def format_value(value):
-            if isinstance(value, ResourceField):
-                if value.matchExpressions:
-                    return ' & '.join([format_match(v) for v in value.matchExpressions])
-                if value.matchFields:
-                    return ' & '.join([format_match(v) for v in value.matchFields])
-                if value.effect:
-                    return f"{value.key}={value.value}:{value.effect}"
-
-                # convert to string and back to yaml
-                # return yaml.dump(yaml.load(str(value), Loader=yaml.FullLoader)).rstrip()
-
-            elif isinstance(value, list):
-                return value
-
-            return str(value)
-
-        def unroll(value):
-            if isinstance(value, list) and len(value) == 1 and isinstance(value[0], list):
-                return value[0]
-            return value
-
-        def unrange(value):
-            if isinstance(value, list):
-                if len(value) == 1:
-                    value = value[0]
-
-                else:
-                    ret = []
-                    for v in value:
-                        ret.extend(unrange(v))
-                    return ret
-
-            value = ast.literal_eval(value)
-            ret = value
-
-            if isinstance(value, dict):
-                if 'start' in value and 'stop' in value:
-                    ret = []
-                    addr = ipaddress.IPv4Address(value['start'])
-                    stop = ipaddress.IPv4Address(value['stop'])
-                    while addr <= stop:
-                        ret.append(str(addr))
-                        addr = addr + 1
-
-                elif 'cidr' in value:
-                    logger.debug(f"Unroll CIDR {value}")
-                    ret = [str(addr) for addr in ipaddress.IPv4Network(value['cidr'])]
-                    logger.debug(f"   got {ret}")
-
-            return ret
-
-        def extract_values(field, path, entry):
-            """
-            Fields can be defined as json paths, or json paths to be
-            processed with lambda functions (defined as lists) or they
-            are defined as a dict with subfields to be extracted, or
-            a combination of the above.
-
-            Returns a dict that can be merged into the table.
-            """
-            item = {}
-
-            if isinstance(path, dict):
-                subitem = {}
-                for subfield, subpath in path.items():
-                    subitem[subfield] = [format_value(match.value) for match in subpath.find(entry)] or ['<none>']
-
-                # dict of lists to list of dicts
-                item[field] = [dict(zip(subitem, i)) for i in zip(*subitem.values())]
-
-            elif isinstance(path, list):
-                item[field] = [format_value(match.value) for match in path[0].find(entry)]
-                for f in path[1:]:
-                    if f != 'unroll' and f != 'unrange':
-                        item[field] = [f(v) for v in item[field]]
-
-                if 'unroll' in path:
-                    item[field] = unroll(item[field])
-
-                if 'unrange' in path:
-                    item[field] = unrange(item[field])
-
-            else:
-                item[field] = [format_value(match.value) for match in path.find(entry)] or ['<none>']
-
-            return item
-
-        def product_dict(**kwargs):
-            """
-            Unroll the combinations, may even be within a column if
-            subqueries were used
-            """
-            keys = kwargs.keys()
-            for instance in itertools.product(*kwargs.values()):
-                values = {}
-                for field, value in dict(zip(keys, instance)).items():
-                    if isinstance(value, dict):
-                        for subfield, subvalue in value.items():
-                            values[subfield] = subvalue
-                    else:
-                        values[field] = value
-                yield values
-
         contexts = kwargs.get('contexts', [])
         logger.debug(f"Initializing table {table} with contexts {contexts}")
 
-        # get resources, all contexts and all namespaces
-        items = []
+        # get resources, all contexts and all namespaces, as batches of
+        # entries with the extractor that turns them into rows, where each
+        # batch came from for profiling, and the cached rows of unchanged
+        # objects or zones by batch
+        batches = []
+        sources = []
+        caches = {}
+        start = time.perf_counter()
 
         if len(contexts) == 1:
-            kwargs['no_context'] = True
-
-        if api == 'file':
-
-            # load data from yaml files found in the include paths
-            resources = {}
-
-            logger.debug(f'Scanning {include}')
-            for path in include:
-                for filename in glob.glob(f"{path}/**/*.y*ml", recursive=True):
-                    logger.debug(f'Reading {filename}')
-                    with open(filename) as stream:
-                        try:
-                            resources.update(yaml.safe_load(stream))
-                        except yaml.YAMLError as e:
-                            logger.warning(e)
-
-            for entry in resources[kind]:
-                item = {}
-
-                # extract fields by going through all paths requested
-                for field, path in fields.items():
-                    item.update(extract_values(field, path, entry))
-
-                # expand the result and add to table
-                items.extend(product_dict(**item))
+            kwargs.setdefault('no_context', True)
+
+        # fetching is a step of its own for the memory it takes
+        with profile.step('fetch', table):
+            if api == 'file':
+
+                # load data from yaml files found in the include paths
+                resources = {}
+
+                size = 0
+                logger.debug(f'Scanning {include}')
+                for path in include:
+                    for filename in glob.glob(f"{path}/**/*.y*ml", recursive=True):
+                        logger.debug(f'Reading {filename}')
+                        size += os.path.getsize(filename)
+                        with open(filename) as stream:
+                            try:
+                                resources.update(yaml.safe_load(stream))
+                            except yaml.YAMLError as e:
+                                logger.warning(e)
+
+                batches.append((Extractor(fields, profile=profile.enabled), resources[kind]))
+                sources.append(('file', time.perf_counter() - start, size))
+
+            elif api == 'url':
+
+                # load data from arbitrary urls instead, all at once if there are several,
+                # or take them from the responses the query fetched already
+                responses = kwargs.get('responses', {})
+                pending = table_requests(kwargs)
+                prefetch(pending, responses)
+
+                for request in pending:
+                    start = time.perf_counter()
+                    text = fetch(**request, responses=responses)
+                    if text is None:
+                        continue
+
+                    resources = yaml.safe_load(text) or {}
+                    batches.append((Extractor(fields, profile=profile.enabled), resources.get(kind, [])))
+                    sources.append((request['url'], time.perf_counter() - start, len(text)))
+
+            elif api == 'dns':
+
+                nameserver = kwargs.get('nameserver', 'localhost')
+                domains = kwargs.get('domains', [])
+                port = kwargs.get('port', 53)
+                use_cache = kwargs.get('cache', True)
+
+                # the rows of zones whose serial hasn't changed aren't extracted again
+                rowcaches = [
+                    ZoneRows(nameserver, port, domain, table, fields) if use_cache else None for domain in domains
+                ]
+
+                # transfer all zones at once, only the changes if a zone is cached
+                zones = load_zones(
+                    nameserver,
+                    domains,
+                    port=port,
+                    timeout=kwargs.get('timeout', TIMEOUT),
+                    use_cache=use_cache,
+                    known=[rowcache and rowcache.serial for rowcache in rowcaches],
+                )
+                # the zones are transferred concurrently, each taking up to the time of all
+                elapsed = time.perf_counter() - start
+                for domain, rowcache, (serial, entries) in zip(domains, rowcaches, zones):
+                    if rowcache is not None:
+                        caches[len(batches)] = (rowcache, entries, serial)
+                    batches.append((Extractor(fields, profile=profile.enabled), entries or []))
+                    sources.append((domain, elapsed, None))
 
-        elif api == 'url':
-
-            # load data from an arbitrary url instead
-            url = kwargs.get('url')
-            try:
-                r = requests.get(url, headers=kwargs.get('headers', {}))
-            except Exception as e:
-                logger.info(f"Could not request {url}: {e}")
-
-            resources = yaml.safe_load(r.text)
-
-            for entry in resources[kind]:
-                item = {}
-
-                # extract fields by going through all paths requested
-                for field, path in fields.items():
-                    item.update(extract_values(field, path, entry))
-
-                # expand the result and add to table
-                items.extend(product_dict(**item))
-
-        elif api == 'dns':
-
-            nameserver = kwargs.get('nameserver', 'localhost')
-            for domain in kwargs.get('domains', []):
-                if domain[-1] != ".":
-                    domain = domain + "."
-                logger.debug(f"  Loading zone {domain} from {nameserver}")
-                try:
-                    zone = dns.zone.Zone(domain, relativize=False)
-                    query, _ = dns.xfr.make_query(zone)
-                    dns.query.inbound_xfr(nameserver, zone, query)
-                except dns.exception.DNSException as e:
-                    logger.warning(e)
-                    pass
-
-                for node, records in zone.nodes.items():
-
-                    nodename = str(node)[:-1]
-
-                    for r in records.rdatasets:
-                        rdtype = dns.rdatatype.to_text(r.rdtype)
-
-                        if rdtype in ('RRSIG') or 'NSEC3' in rdtype or 'DNSKEY' in rdtype:
-                            continue
+            else:
 
-                        entry = {
-                            'name': nodename,
-                            'zone': domain,
-                            'type': rdtype,
-                            'records': [],
-                        }
+                # limit queries to namespaces
+                namespaces = kwargs.get('namespaces', [])
 
-                        for e in r.items:
-                            entry['records'].append(str(e))
+                # rows of unchanged objects are taken from the cache of the last run
+                use_cache = kwargs.get('cache', True)
 
-                        # extract fields by going through all paths requested
-                        item = {}
+                # built-in types can be fetched in protobuf, decoding only what the fields look at
+                plan = table_plan(api, kind, fields, use_cache) if kwargs.get('protobuf', False) else None
 
-                        for field, path in fields.items():
-                            item.update(extract_values(field, path, entry))
+                # the responses of contexts fetched beforehand, with the seconds it took, by context
+                prefetched = dict(kwargs.get('prefetched', {}))
 
-                        # expand the result and add to table
-                        items.extend(product_dict(**item))
+                # for each cluster, get the data and build one long table with all the data
+                for context in contexts:
+                    try:
+                        logger.debug(f"  Loading '{table}' from '{context}'")
+                        start = time.perf_counter()
 
-        else:
-
-            # limit queries to namespaces
-            namespaces = kwargs.get('namespaces', [])
-
-            # for each cluster, get the data and build one long table with all the data
-            for context in contexts:
-                try:
-                    logger.debug(f"  Loading '{table}' from '{context}'")
-                    resource = client.client(context).resources.get(api_version=api, kind=kind)
-
-                    # if the config limits us to certain namespaces, only get that data to begin with
-                    entries = []
-                    if namespaces:
-                        for namespace in namespaces:
-                            entries.extend(resource.get(namespace=namespace).items)
-                    else:
-                        entries = resource.get().items
-
-                    for entry in entries:
-                        if kwargs.get('no_context', False):
-                            item = {}
+                        # the lists may have been fetched already, while others were extracted
+                        if context in prefetched:
+                            seconds, responses = prefetched.pop(context)
+                            if isinstance(responses, Exception):
+                                raise responses
+                            start -= seconds
                         else:
-                            item = {'context': [context]}
-
-                        # cilium network policies, for example, allow `specs` as a list of spec
-                        specs = entry.get('specs', [entry['spec']])
-                        subentry = entry
-
-                        for spec in specs:
-                            setattr(subentry, 'spec', spec)
-
-                            # extract fields by going through all paths requested
-                            for field, path in fields.items():
-                                item.update(extract_values(field, path, subentry))
-
-                            # expand the result and add to table
-                            items.extend(product_dict(**item))
+                            responses = fetch_lists(client, context, api, kind, namespaces, plan)
+
+                        entries = []
+                        size = 0
+                        for data in responses:
+                            resources = json.loads(data) if plan is None else loads(data, kind, plan)
+                            size += len(data)
+
+                            # like the dynamic client, tell each item what it is
+                            for entry in resources.get('items') or []:
+                                entry.setdefault('apiVersion', resources.get('apiVersion'))
+                                entry.setdefault('kind', resources.get('kind', '')[:-4])
+                                entries.append(entry)
+
+                        extractor = Extractor(
+                            fields,
+                            None if kwargs.get('no_context', False) else context,
+                            kubernetes=True,
+                            profile=profile.enabled,
+                        )
+                        if use_cache:
+                            rowcache = RowCache(table, api, kind, fields, context, extractor.context)
+                            fresh, reused = rowcache.split(entries)
+                            caches[len(batches)] = (rowcache, entries, reused)
+                            entries = fresh
+
+                        batches.append((extractor, entries))
+                        sources.append((context, time.perf_counter() - start, size))
+
+                    except Exception as e:
+                        logger.info(f"Failed to get '{kind}' from '{context}', {e}")
+                        pass
+
+        # extract all fields, spread across processes for large lists
+        stats = []
+        with profile.step('extract', table, rows=sum(len(entries) for _, entries in batches)) as step:
+            columns = extract(batches, kwargs.get('pool_threshold', POOL_THRESHOLD), stats=stats)
+
+            # objects and rows of each batch, including those taken from the cache
+            objects = [len(entries) for _, entries in batches]
+            rows = [stat['rows'] for stat in stats]
+
+            # put the cached rows in between the extracted ones, batch by batch
+            if caches:
+                parts = []
+                start = 0
+                for index, stat in enumerate(stats):
+                    part = slice_columns(columns, start, start + stat['rows'])
+                    start += stat['rows']
+                    if index in caches:
+                        rowcache, entries, reused = caches[index]
+                        part = rowcache.merge(entries, reused, part, stat['counts'])
+                        objects[index] = rowcache.objects
+                        rows[index] = len(next(iter(part.values()), []))
+                    parts.append(part)
+                columns = concat_columns(parts)
+
+            step['rows_out'] = len(next(iter(columns.values()), []))
+
+        # remember how many objects and rows each context had, or the whole
+        # table if it isn't read from Kubernetes, for estimating the next runs
+        if api in OTHER_APIS:
+            record(table, None, sum(objects), sum(rows))
+        else:
+            for (context, _, _), n, m in zip(sources, objects, rows):
+                record(table, context, n, m)
 
-                except Exception as e:
-                    logger.info(f"Failed to get '{kind}' from '{context}', {e}")
-                    pass
+        for (source, seconds, size), stat, n, m in zip(sources, stats, objects, rows):
+            profile.fetch(table, source, seconds, size, n, m)
+            profile.add_paths(table, stat['timings'])
 
-        logger.debug(f"  Loaded {len(items)} {table} ({kind})")
+        logger.debug(f"  Loaded {len(next(iter(columns.values()), []))} {table} ({kind})")
 
         # throw the resulting items into a DataFrame
-        super().__init__(items)
+        super().__init__(columns)
+
+        # and transform whole columns at once
+        with profile.step('transform', table, self):
+            apply_transforms(self, fields)
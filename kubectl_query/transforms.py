@@ -0,0 +1,191 @@
+import ast
+import logging
+
+logger = logging.getLogger('kubectl-query')
+
+# multipliers of the suffixes of Kubernetes quantities
+DECIMAL = {
+    'n': 1e-9,
+    'u': 1e-6,
+    'm': 1e-3,
+    'k': 1e3,
+    'M': 1e6,
+    'G': 1e9,
+    'T': 1e12,
+    'P': 1e15,
+    'E': 1e18,
+}
+BINARY = {
+    'Ki': 2.0**10,
+    'Mi': 2.0**20,
+    'Gi': 2.0**30,
+    'Ti': 2.0**40,
+    'Pi': 2.0**50,
+    'Ei': 2.0**60,
+}
+LETTERS = 'nukmMGTPEi'
+
+
+def numbers(values):
+    """
+    Values as floats, those that aren't numbers becoming NaN; converting
+    directly is much faster, so coercing is left for when that fails
+    """
+
+    import pandas as pd
+
+    try:
+        return values.astype('float64')
+    except (TypeError, ValueError):
+        return pd.to_numeric(values.astype(object), errors='coerce').astype('float64')
+
+
+def integers(values):
+    """
+    Whole numbers as integers, unless some are missing, the way pandas
+    would have typed a list of Python integers and None
+    """
+
+    if values.notna().all():
+        return values.astype('int64')
+    return values
+
+
+def to_int(values):
+    import numpy as np
+
+    return integers(np.trunc(numbers(values)))
+
+
+def to_round(values, digits=0):
+    rounded = numbers(values).round(digits)
+    return integers(rounded) if digits == 0 else rounded
+
+
+def quantity(values):
+    """
+    Kubernetes quantities like 250m, 2 or 64Gi as plain numbers, looking
+    up the suffix by the last two or one characters
+    """
+
+    text = values.astype('string').str.strip()
+    number = text.str.rstrip(LETTERS)
+    binary = text.str[-2:].map(BINARY).astype('float64')
+    decimal = text.str[-1:].map(DECIMAL).astype('float64')
+
+    # anything else than a number and a suffix isn't a quantity
+    suffix = binary.notna() * 2 + (binary.isna() & decimal.notna())
+    valid = (number.str.len() + suffix == text.str.len()).fillna(False).astype(bool)
+    return (numbers(number) * binary.fillna(decimal).fillna(1.0)).where(valid)
+
+
+def regex_extract(values, pattern, group=1):
+    return values.astype('string').str.extract(pattern, expand=True)[group - 1].astype(object)
+
+
+def split(values, separator=',', index=None):
+    parts = values.astype('string').str.split(separator, regex=False)
+    return (parts if index is None else parts.str[index]).astype(object)
+
+
+def replace(values, old, new=''):
+    return values.astype('string').str.replace(old, new, regex=False).astype(object)
+
+
+def strings(method):
+    def function(values, *args):
+        return getattr(values.astype('string').str, method)(*args).astype(object)
+
+    return function
+
+
+# transforms by name, each taking the values of a column as Series and
+# returning the new values
+TRANSFORMS = {
+    'replace': replace,
+    'strip_prefix': strings('removeprefix'),
+    'strip_suffix': strings('removesuffix'),
+    'strip': strings('strip'),
+    'lower': strings('lower'),
+    'upper': strings('upper'),
+    'regex_extract': regex_extract,
+    'split': split,
+    'int': to_int,
+    'float': numbers,
+    'quantity': quantity,
+    'mul': lambda values, factor: numbers(values) * factor,
+    'div': lambda values, divisor: numbers(values) / divisor,
+    'round': to_round,
+}
+
+
+class Transform:
+    """
+    One step of the transform language of field lists, like `int`,
+    `div(1024)` or `replace('Ki', '')`: a name out of TRANSFORMS with
+    literal arguments, applied to whole columns at once
+    """
+
+    def __init__(self, source):
+        self.source = source
+        try:
+            call = ast.parse(source.strip(), mode='eval').body
+            if isinstance(call, ast.Name):
+                self.name, self.args = call.id, ()
+            elif isinstance(call, ast.Call) and isinstance(call.func, ast.Name) and not call.keywords:
+                self.name, self.args = call.func.id, tuple(ast.literal_eval(arg) for arg in call.args)
+            else:
+                raise ValueError("not a transform")
+        except (SyntaxError, ValueError) as e:
+            raise ValueError(f"Can't parse transform '{source}': {e}")
+
+        if self.name not in TRANSFORMS:
+            raise ValueError(f"Unknown transform '{self.name}', use one of {', '.join(TRANSFORMS)} or a lambda")
+
+    def __call__(self, values):
+        """
+        Transform a Series of values, missing ones staying missing
+        """
+
+        return TRANSFORMS[self.name](values, *self.args)
+
+    def values(self, values):
+        """
+        Transform a list of values
+        """
+
+        import pandas as pd
+
+        result = self(pd.Series(values, dtype=object))
+        return result.astype(object).where(result.notna(), None).tolist()
+
+    def __reduce__(self):
+        return (Transform, (self.source,))
+
+    def __repr__(self):
+        return f"Transform({self.source!r})"
+
+
+def vectorized(path):
+    """
+    Whether the steps of a field list can all be applied to the column once
+    the table is built, rather than value by value during extraction:
+    lambdas and unrolling or unranging come first in order
+    """
+
+    return isinstance(path, list) and all(isinstance(step, Transform) for step in path[1:])
+
+
+def apply_transforms(frame, fields):
+    """
+    Apply the transforms of the fields that are vectorized to their columns
+    """
+
+    for field, path in fields.items():
+        if vectorized(path) and len(path) > 1 and field in frame.columns:
+            values = frame[field]
+            for step in path[1:]:
+                values = step(values)
+            if values.dtype == object:
+                values = values.where(values.notna(), None)
+            frame[field] = values.to_numpy()
@@ -0,0 +1,122 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import cache
+
+logger = logging.getLogger('kubectl-query')
+
+# seconds to wait for an endpoint to connect and to answer
+TIMEOUT = 10
+
+# concurrent requests when prefetching the urls of a query
+WORKERS = 8
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def session():
+    """
+    One pooled session shared by all url tables, keeping connections to
+    the same endpoints alive; requests negotiates gzip by default
+    """
+
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            import requests
+            import requests.adapters
+
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=WORKERS, pool_maxsize=WORKERS)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+
+    return _session
+
+
+def key(url, headers):
+    return (url, tuple(sorted((headers or {}).items())))
+
+
+def fetch(url, headers=None, timeout=TIMEOUT, use_cache=True, responses=None):
+    """
+    Get the body of a url, asking the endpoint whether the locally cached
+    response is still current; returns None if the request fails
+
+    Bodies fetched already by the same run are taken from `responses`, a
+    dict by url and headers that successful requests are added to
+    """
+
+    if responses is not None and key(url, headers) in responses:
+        return responses[key(url, headers)]
+
+    cachefile = cache.cache_dir('urls', f"{cache.digest(*key(url, headers))}.pickle")
+    cached = cache.load(cachefile) if use_cache else None
+
+    conditional = dict(headers or {})
+    if cached:
+        if cached.get('etag'):
+            conditional['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            conditional['If-Modified-Since'] = cached['last_modified']
+
+    try:
+        logger.debug(f"  Requesting {url}")
+        r = session().get(url, headers=conditional, timeout=timeout)
+
+        if r.status_code == 304 and cached:
+            logger.debug(f"  Cached response for {url} is still current")
+            text = cached['text']
+
+        else:
+            r.raise_for_status()
+            text = r.text
+
+            etag, last_modified = r.headers.get('ETag'), r.headers.get('Last-Modified')
+            if use_cache and (etag or last_modified):
+                cache.save(cachefile, {'etag': etag, 'last_modified': last_modified, 'text': text})
+
+    except Exception as e:
+        logger.warning(f"Could not request {url}: {e}")
+        return None
+
+    if responses is not None:
+        responses[key(url, headers)] = text
+    return text
+
+
+def prefetch(pending, responses):
+    """
+    Fetch many urls at once, given as a list of keyword arguments to fetch,
+    into `responses`
+    """
+
+    pending = [r for r in pending if key(r['url'], r.get('headers')) not in responses]
+    if len(pending) < 2:
+        return
+
+    logger.debug(f"Prefetching {len(pending)} urls")
+    with ThreadPoolExecutor(max_workers=min(WORKERS, len(pending))) as pool:
+        list(pool.map(lambda r: fetch(**r, responses=responses), pending))
+
+
+def table_requests(prop):
+    """
+    The requests needed for a url table, which may have one `url` or a
+    list of `urls`
+    """
+
+    urls = prop.get('urls') or [prop.get('url')]
+    return [
+        {
+            'url': url,
+            'headers': prop.get('headers', {}),
+            'timeout': prop.get('timeout', TIMEOUT),
+            'use_cache': prop.get('cache', True),
+        }
+        for url in urls
+        if url
+    ]
@@ -0,0 +1,110 @@
+import logging
+
+logger = logging.getLogger('kubectl-query')
+
+# rows converted and written at once
+BATCH = 10000
+
+# formats written as bytes and needing pyarrow
+BINARY = ('arrow', 'parquet')
+
+
+def typed(frame):
+    """
+    Give columns a real type where all their values agree, and turn the
+    values of columns mixing types into strings, keeping missing values
+    missing instead of filling in dashes like for the tables
+    """
+
+    frame = frame.infer_objects()
+    for column in frame.columns:
+        if frame[column].dtype == object:
+            values = frame[column]
+            if values.map(type, na_action='ignore').nunique() > 1:
+                frame[column] = values.map(str, na_action='ignore')
+    return frame
+
+
+def batches(frame, size=BATCH):
+    for start in range(0, len(frame), size):
+        yield frame.iloc[start : start + size]
+
+
+def write_jsonl(frame, stream):
+    """
+    One JSON object per row, each line ended by a newline whether or not
+    the version of pandas puts one after the last row of a batch
+    """
+
+    for batch in batches(frame):
+        lines = batch.to_json(orient='records', lines=True, force_ascii=False, date_format='iso')
+        stream.write(lines.rstrip('\n'))
+        stream.write('\n')
+
+
+def arrow_schema(frame):
+    """
+    The Arrow schema of the whole frame, so that all batches agree even if
+    a column happens to be empty in some of them
+    """
+
+    import pyarrow as pa
+
+    return pa.Schema.from_pandas(frame, preserve_index=False)
+
+
+def write_arrow(frame, stream):
+    """
+    Arrow IPC stream format, one record batch per batch of rows
+    """
+
+    import pyarrow as pa
+
+    schema = arrow_schema(frame)
+    with pa.ipc.new_stream(stream, schema) as writer:
+        for batch in batches(frame):
+            writer.write_batch(pa.RecordBatch.from_pandas(batch, schema=schema, preserve_index=False))
+
+
+def write_parquet(frame, stream):
+    """
+    Parquet, one row group per batch of rows
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(frame)
+    with pq.ParquetWriter(stream, schema) as writer:
+        for batch in batches(frame):
+            writer.write_table(pa.Table.from_pandas(batch, schema=schema, preserve_index=False))
+
+
+WRITERS = {
+    'jsonl': write_jsonl,
+    'arrow': write_arrow,
+    'parquet': write_parquet,
+}
+
+
+def missing_dependency(tablefmt):
+    """
+    Name of the package needed for a format that isn't installed, if any
+    """
+
+    if tablefmt in BINARY:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return 'pyarrow'
+    return None
+
+
+def write(result, tablefmt, stream):
+    """
+    Stream a result in a machine readable format, in batches of rows
+    """
+
+    frame = typed(result)
+    logger.debug(f"Writing {len(frame)} rows as {tablefmt}")
+    WRITERS[tablefmt](frame, stream)
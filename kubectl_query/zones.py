@@ -0,0 +1,177 @@
+import glob
+import logging
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+from . import __version__, cache
+
+logger = logging.getLogger('kubectl-query')
+
+# seconds to wait for a nameserver to answer
+TIMEOUT = 10
+
+# concurrent zone transfers
+WORKERS = 8
+
+
+def address(nameserver):
+    """
+    dnspython only talks to addresses, so resolve the name of a nameserver
+    """
+
+    import dns.inet
+
+    if dns.inet.is_address(nameserver):
+        return nameserver
+    return socket.getaddrinfo(nameserver, None)[0][4][0]
+
+
+def serial(where, domain, port, timeout):
+    """
+    Ask for the SOA serial of a zone, which is cheap compared to a transfer
+    """
+
+    import dns.message
+    import dns.query
+    import dns.rdatatype
+
+    query = dns.message.make_query(domain, dns.rdatatype.SOA)
+    response, _ = dns.query.udp_with_fallback(query, where, port=port, timeout=timeout)
+    for rrset in response.answer:
+        if rrset.rdtype == dns.rdatatype.SOA:
+            return rrset[0].serial
+    return None
+
+
+def zone_entries(zone, domain):
+    """
+    Turn all records of a zone into entries, one per name and type
+    """
+
+    import dns.rdatatype
+
+    # the same few types over and over, named once each
+    types = {}
+    for rdtype in {rdataset.rdtype for _, rdataset in zone.iterate_rdatasets()}:
+        text = dns.rdatatype.to_text(rdtype)
+        if not (text == 'RRSIG' or 'NSEC3' in text or 'DNSKEY' in text):
+            types[rdtype] = text
+
+    return [
+        {'name': str(name)[:-1], 'zone': domain, 'type': types[rdataset.rdtype], 'records': list(map(str, rdataset))}
+        for name, rdataset in zone.iterate_rdatasets()
+        if rdataset.rdtype in types
+    ]
+
+
+class ZoneRows:
+    """
+    The rows a table extracted from a zone before, along with the serial of
+    the zone and its number of entries; while the serial stays the same,
+    the zone isn't even read from the cache, let alone extracted again
+
+    The key covers everything that goes into the rows, like the fields of
+    the table
+    """
+
+    def __init__(self, nameserver, port, domain, *key):
+        if domain[-1] != ".":
+            domain = domain + "."
+        self.path = cache.cache_dir('zones', f"{cache.digest(__version__, nameserver, port, domain, *key)}-rows.pickle")
+        self.serial, self.objects, self.columns = cache.load(self.path) or (None, 0, None)
+
+    def merge(self, entries, serial, columns, counts):
+        """
+        The cached columns if the zone is unchanged and `entries` is None,
+        otherwise the `columns` extracted from the entries, kept for the
+        next time if the zone has a serial
+        """
+
+        if entries is None:
+            return self.columns
+
+        if serial is not None:
+            cache.save(self.path, (serial, len(entries), columns))
+        self.serial, self.objects, self.columns = serial, len(entries), columns
+
+        return columns
+
+
+def load_zone(nameserver, domain, port=53, timeout=TIMEOUT, use_cache=True, known=None):
+    """
+    Get the serial and the entries of one zone
+
+    The zone and its entries are cached locally by SOA serial: if the serial
+    didn't change, the cached entries are used as they are, otherwise the
+    cached zone is brought up to date by an IXFR of the changes only; if the
+    serial is the one `known` to the caller already, there are no entries
+    """
+
+    import dns.exception
+    import dns.query
+    import dns.xfr
+    import dns.zone
+
+    if domain[-1] != ".":
+        domain = domain + "."
+
+    key = cache.cache_dir('zones', cache.digest(nameserver, port, domain))
+
+    # the cached zone comes first, to fall back to if the nameserver fails
+    zone = cache.load(f"{key}.pickle") if use_cache else None
+
+    try:
+        where = address(nameserver)
+
+        if use_cache:
+            current = serial(where, domain, port, timeout)
+            if current is not None and current == known:
+                logger.debug(f"  Zone {domain} from {nameserver} is unchanged at serial {current}, rows are cached")
+                return current, None
+            entries = cache.load(f"{key}-{current}.pickle")
+            if entries is not None:
+                logger.debug(f"  Zone {domain} from {nameserver} is unchanged at serial {current}")
+                return current, entries
+
+        # IXFR from the serial of the cached zone, or AXFR for a new zone
+        zone = zone or dns.zone.Zone(domain, relativize=False)
+        query, _ = dns.xfr.make_query(zone)
+        logger.debug(f"  Loading zone {domain} from {nameserver} ({query.question[0].rdtype.name})")
+        dns.query.inbound_xfr(where, zone, query, port=port, timeout=timeout)
+
+    except (dns.exception.DNSException, OSError) as e:
+        logger.warning(f"Could not transfer zone {domain} from {nameserver}: {e}")
+        if not zone:
+            return None, []
+        current = zone.get_soa().serial
+        return (current, None) if current == known else (current, zone_entries(zone, domain))
+
+    current = zone.get_soa().serial
+    entries = zone_entries(zone, domain)
+
+    if use_cache:
+        for stale in glob.glob(f"{key}-*.pickle"):
+            os.unlink(stale)
+        cache.save(f"{key}.pickle", zone)
+        cache.save(f"{key}-{current}.pickle", entries)
+
+    return current, entries
+
+
+def load_zones(nameserver, domains, port=53, timeout=TIMEOUT, use_cache=True, known=None):
+    """
+    Transfer several zones concurrently, returning their serials and entries
+    in order; `known` are the serials the caller has the rows of already
+    """
+
+    if not domains:
+        return []
+
+    known = known or [None] * len(domains)
+    with ThreadPoolExecutor(max_workers=min(WORKERS, len(domains))) as pool:
+        return list(
+            pool.map(
+                lambda domain, serial: load_zone(nameserver, domain, port, timeout, use_cache, serial), domains, known
+            )
+        )
@@ -1,8 +1,13 @@
+import re
+
 import setuptools
 
 with open('README.md', 'r') as fh:
     long_description = fh.read()
 
+with open('kubectl_query/__init__.py', 'r') as fh:
+    version = re.search(r"^__version__ = '(.*)'$", fh.read(), re.M).group(1)
+
 REQUIREMENTS = [
     "kubernetes",
     "click",
@@ -27,7 +32,7 @@ DEV_REQUIREMENTS = [
 
 setuptools.setup(
     name='python-kubectl-query',
-    version='0.3.4',
+    version=version,
     description='Query multiple cluster resources and join them together as tables',
     long_description=long_description,
     long_description_content_type="text/markdown",
@@ -54,6 +59,7 @@ setuptools.setup(
     install_requires=REQUIREMENTS,
     extras_require={
         'dev': DEV_REQUIREMENTS,
+        'arrow': ['pyarrow'],
     },
     entry_points={
         'console_scripts': [
@@ -0,0 +1,257 @@
+import contextlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from test.fakeapi import environment, fixtures
+from test.fakeapi.server import FakeApiServer
+
+import click
+import pandas as pd
+
+from kubectl_query import query, table
+from kubectl_query.client import Client
+from kubectl_query.config import Config
+from kubectl_query.extract import POOL_THRESHOLD
+from kubectl_query.query import Query
+from kubectl_query.render import render
+
+STAGES = ('fetch', 'extract', 'explode', 'merge', 'postprocess', 'render')
+
+# pods in total and number of clusters they are spread over
+SCENARIOS = {
+    'tiny': (200, 2),
+    'small': (1000, 1),
+    'medium': (50000, 5),
+    'large': (500000, 50),
+}
+
+# built-in queries covering pods, nodes, claims, volumes and events
+QUERIES = ('pods-topology', 'pods-nodes-storage', 'events-pods', 'nodes')
+
+# stages faster than this are too noisy to compare against a baseline
+NOISE = 0.05
+
+
+def maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Stages:
+    """
+    Wall time and peak memory per stage; time spent in a nested stage, like
+    extraction within fetching a table, only counts for the nested stage
+
+    The peak resident size of the process is cheap to follow but only ever
+    grows, tracing allocations gives the peak of each stage on its own but
+    slows everything down several times
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.peaks = dict.fromkeys(STAGES, None)
+        self.rss = dict.fromkeys(STAGES, 0)
+        self.stack = []
+
+    def peak(self, name):
+        current = tracemalloc.get_traced_memory()[1]
+        for stage in [name] + [frame[0] for frame in self.stack]:
+            self.peaks[stage] = max(self.peaks[stage] or 0, current)
+        tracemalloc.reset_peak()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.memory and self.stack:
+            self.peak(self.stack[-1][0])
+
+        frame = [name, 0.0]
+        self.stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stack.pop()
+            self.seconds[name] += elapsed - frame[1]
+            if self.stack:
+                self.stack[-1][1] += elapsed
+            self.rss[name] = max(self.rss[name], maxrss())
+            if self.memory:
+                self.peak(name)
+
+    def wrap(self, name, function):
+        def wrapped(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+
+        return wrapped
+
+    @contextlib.contextmanager
+    def instrument(self):
+        """
+        Time the stages that happen within building a Query
+        """
+
+        patches = [
+            (query, 'Table', 'fetch'),
+            (table, 'extract', 'extract'),
+            (pd.DataFrame, 'explode', 'explode'),
+            (query, 'merge', 'merge'),
+        ]
+        originals = [getattr(owner, attribute) for owner, attribute, _ in patches]
+        try:
+            for (owner, attribute, name), original in zip(patches, originals):
+                setattr(owner, attribute, self.wrap(name, original))
+            yield self
+        finally:
+            for (owner, attribute, _), original in zip(patches, originals):
+                setattr(owner, attribute, original)
+
+    def as_dict(self):
+        return {
+            name: {'seconds': round(self.seconds[name], 4), 'peak': self.peaks[name], 'rss': self.rss[name]}
+            for name in STAGES
+        }
+
+
+def run(
+    objects,
+    contexts,
+    queries=QUERIES,
+    latency=0.0,
+    memory=False,
+    pool_threshold=POOL_THRESHOLD,
+    tablefmt='plain',
+    protobuf=False,
+):
+    """
+    Serve synthetic clusters from a fake API and run the queries against
+    all of them, returning the time and memory taken by each stage
+    """
+
+    clusters = fixtures.clusters(objects, contexts)
+
+    with FakeApiServer(clusters, latency, protobuf) as server, tempfile.TemporaryDirectory() as workdir:
+        kubeconfig = server.kubeconfig(os.path.join(workdir, 'kubeconfig'))
+
+        with environment(KUBECONFIG=kubeconfig, XDG_CACHE_HOME=workdir), open(os.devnull, 'w') as devnull:
+            client = Client(['all'])
+            config = Config((), client, False, {'cache': False, 'pool_threshold': pool_threshold, 'protobuf': protobuf})
+            config.init_config(list(queries), [])
+
+            # importing the client library isn't part of fetching
+            import kubernetes.config  # noqa: F401
+            import kubernetes.dynamic  # noqa: F401
+
+            stages = Stages(memory)
+            rows = {}
+            if memory:
+                tracemalloc.start()
+
+            try:
+                with stages.instrument():
+                    for name in config.show:
+                        result = Query(client, config, [], name)
+                        with stages.stage('postprocess'):
+                            result.postprocess([], config.filters, config.namespaces, (), (), ())
+                        with stages.stage('render'):
+                            render(result, tablefmt, devnull)
+                        rows[name] = len(result.index)
+            finally:
+                if memory:
+                    tracemalloc.stop()
+
+    return {
+        'objects': objects,
+        'contexts': contexts,
+        'latency': latency,
+        'memory': memory,
+        'protobuf': protobuf,
+        'rows': rows,
+        'stages': stages.as_dict(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Stages of all scenarios next to their baseline, and the regressions:
+    stages that took more than `tolerance` times as long, or scenarios
+    that produced a different number of rows
+    """
+
+    lines = []
+    regressions = []
+    for scenario, result in results.items():
+        before = baseline.get(scenario)
+
+        # tracing memory changes the timings too much to compare
+        if before and before.get('memory') != result['memory']:
+            regressions.append(f"{scenario}: baseline was taken with memory tracing {before.get('memory')}")
+            before = None
+
+        if before and before['rows'] != result['rows']:
+            regressions.append(f"{scenario}: rows changed from {before['rows']} to {result['rows']}")
+
+        for name, stage in result['stages'].items():
+            seconds = stage['seconds']
+            previous = before['stages'][name]['seconds'] if before else None
+            ratio = seconds / previous if previous else None
+            peak = stage['peak'] // 2**20 if stage['peak'] is not None else None
+            lines.append([scenario, name, previous, seconds, ratio, peak, stage['rss'] // 2**20])
+
+            if ratio and ratio > tolerance and max(seconds, previous) > NOISE:
+                regressions.append(f"{scenario}: {name} took {seconds:.3f}s instead of {previous:.3f}s")
+
+    return lines, regressions
+
+
+@click.command()
+@click.option('--scenario', 'scenarios', multiple=True, type=click.Choice(list(SCENARIOS)), help="Predefined scales")
+@click.option('--objects', type=int, help="Number of pods in total, instead of a scenario")
+@click.option('--contexts', type=int, default=1, help="Number of clusters to spread the pods over")
+@click.option('--query', 'queries', multiple=True, help="Queries to run, by default a few built-in ones")
+@click.option('--latency', type=float, default=0.0, help="Seconds the fake API takes to answer a list")
+@click.option('--memory/--no-memory', default=False, help="Trace the peak memory per stage, which slows things down")
+@click.option('--pool-threshold', type=int, default=POOL_THRESHOLD)
+@click.option('--protobuf/--no-protobuf', default=False, help="Fetch built-in resources in protobuf")
+@click.option('--save', type=click.Path(dir_okay=False), help="Save the results as new baseline")
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help="Compare against a saved baseline")
+@click.option('--tolerance', type=float, default=1.5, help="Slowdown factor counted as regression")
+def main(scenarios, objects, contexts, queries, latency, memory, pool_threshold, protobuf, save, baseline, tolerance):
+    """
+    Benchmark the stages of running queries against synthetic clusters
+    served by an in-process fake Kubernetes API
+    """
+
+    if objects:
+        scales = {f"{objects}x{contexts}": (objects, contexts)}
+    else:
+        scales = {name: SCENARIOS[name] for name in scenarios or ['small']}
+
+    results = {}
+    for name, (count, clusters) in scales.items():
+        click.echo(f"# {name}: {count} pods in {clusters} clusters", err=True)
+        results[name] = run(count, clusters, queries or QUERIES, latency, memory, pool_threshold, protobuf=protobuf)
+
+    previous = {}
+    if baseline:
+        with open(baseline) as stream:
+            previous = json.load(stream)
+
+    from tabulate import tabulate
+
+    lines, regressions = compare(results, previous, tolerance)
+    headers = ['SCENARIO', 'STAGE', 'BASELINE', 'SECONDS', 'RATIO', 'PEAK MB', 'RSS MB']
+    click.echo(tabulate(lines, headers=headers, tablefmt='plain', floatfmt='.3f', missingval='-'))
+
+    if save:
+        with open(save, 'w') as stream:
+            json.dump({**previous, **results}, stream, indent=2)
+
+    for regression in regressions:
+        click.echo(f"# REGRESSION: {regression}", err=True)
+    sys.exit(1 if regressions else 0)
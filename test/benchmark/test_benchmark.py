@@ -0,0 +1,20 @@
+from .run import STAGES, compare, run
+
+
+def test_run():
+    result = run(60, 2, queries=['pods-nodes-storage', 'events-pods'], memory=True)
+
+    # each of the 60 pods has one address, claim and volume
+    assert result['rows'] == {'pods-nodes-storage': 60, 'events-pods': 60}
+    assert list(result['stages']) == list(STAGES)
+    for name in ['fetch', 'extract', 'merge', 'postprocess', 'render']:
+        assert result['stages'][name]['seconds'] > 0
+        assert result['stages'][name]['peak'] > 0
+
+    lines, regressions = compare({'tiny': result}, {'tiny': result}, 1.5)
+    assert len(lines) == len(STAGES) and regressions == []
+
+    slower = {**result, 'stages': {n: {**s, 'seconds': s['seconds'] * 2 + 1} for n, s in result['stages'].items()}}
+    lines, regressions = compare({'tiny': slower}, {'tiny': result}, 1.5)
+    # nothing needs to be exploded, so there is nothing to compare to
+    assert [r.split()[1] for r in regressions] == ['fetch', 'extract', 'merge', 'postprocess', 'render']
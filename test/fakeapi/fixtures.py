@@ -0,0 +1,147 @@
+import random
+
+# resources served by the fake API, by plural name
+RESOURCES = {
+    'pods': {'kind': 'Pod', 'namespaced': True},
+    'nodes': {'kind': 'Node', 'namespaced': False},
+    'persistentvolumeclaims': {'kind': 'PersistentVolumeClaim', 'namespaced': True},
+    'persistentvolumes': {'kind': 'PersistentVolume', 'namespaced': False},
+    'events': {'kind': 'Event', 'namespaced': True},
+}
+
+ZONES = ['zone-a', 'zone-b', 'zone-c']
+
+
+def address(i, prefix=10):
+    return f"{prefix}.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+
+
+def metadata(name, namespace=None, **extra):
+    meta = {'name': name, 'uid': f"uid-{name}", 'resourceVersion': '1', **extra}
+    if namespace:
+        meta['namespace'] = namespace
+    return meta
+
+
+def node(i):
+    return {
+        'metadata': metadata(
+            f"node-{i}",
+            labels={'topology.kubernetes.io/region': 'region-1', 'topology.kubernetes.io/zone': ZONES[i % len(ZONES)]},
+        ),
+        'spec': {
+            'podCIDR': f"10.{i & 255}.0.0/24",
+            'taints': [{'key': 'dedicated', 'value': 'batch', 'effect': 'NoSchedule'}] if i % 4 == 0 else [],
+        },
+        'status': {
+            'addresses': [{'type': 'InternalIP', 'address': address(i, 192)}],
+            'capacity': {'cpu': '16', 'memory': '65842896Ki'},
+            'nodeInfo': {
+                'kubeletVersion': 'v1.30.2',
+                'kernelVersion': '6.1.0',
+                'containerRuntimeVersion': 'containerd',
+            },
+            'conditions': [
+                {'type': 'MemoryPressure', 'status': 'False', 'lastTransitionTime': '2024-05-01T10:00:00Z'},
+                {'type': 'Ready', 'status': 'True', 'lastTransitionTime': '2024-05-01T10:00:00Z'},
+            ],
+        },
+    }
+
+
+def pod(i, nodes, namespaces):
+    namespace = f"namespace-{i % namespaces}"
+    containers = [
+        {
+            'name': f"container-{c}",
+            'image': f"registry.example.com/app-{i % 50}:{c}",
+            'ports': [{'containerPort': 8080 + c}],
+            'resources': {'requests': {'cpu': f"{(i % 8 + 1) * 50}m", 'memory': '128Mi'}},
+        }
+        for c in range(1 + i % 2)
+    ]
+    return {
+        'metadata': metadata(f"pod-{i}", namespace, labels={'app': f"app-{i % 50}", 'tier': 'backend'}),
+        'spec': {
+            'nodeName': f"node-{i % nodes}",
+            'containers': containers,
+            'volumes': [{'name': 'data', 'persistentVolumeClaim': {'claimName': f"claim-{i // 2}"}}],
+            'tolerations': [{'key': 'topology.kubernetes.io/zone', 'value': ZONES[i % len(ZONES)]}],
+            'affinity': {
+                'nodeAffinity': {
+                    'requiredDuringSchedulingIgnoredDuringExecution': {
+                        'nodeSelectorTerms': [
+                            {'matchExpressions': [{'key': 'tier', 'operator': 'In', 'values': ['backend', 'batch']}]}
+                        ]
+                    }
+                }
+            },
+        },
+        'status': {
+            'phase': 'Running' if i % 10 else 'Pending',
+            'podIPs': [{'ip': address(i)}],
+            'containerStatuses': [{'name': c['name'], 'lastState': {}} for c in containers],
+        },
+    }
+
+
+def claim(i, namespaces):
+    # two pods share a claim, see pod
+    namespace = f"namespace-{(2 * i) % namespaces}"
+    return {
+        'metadata': metadata(f"claim-{i}", namespace),
+        'spec': {'volumeName': f"volume-{i}", 'storageClassName': 'standard'},
+        'status': {'phase': 'Bound'},
+    }
+
+
+def volume(i, namespaces):
+    return {
+        'metadata': metadata(f"volume-{i}"),
+        'spec': {
+            'claimRef': {'name': f"claim-{i}", 'namespace': f"namespace-{(2 * i) % namespaces}"},
+            'storageClassName': 'standard',
+        },
+        'status': {'phase': 'Bound'},
+    }
+
+
+def event(i, namespaces, rng):
+    return {
+        'metadata': metadata(f"pod-{i}.{i:x}", f"namespace-{i % namespaces}"),
+        'reason': rng.choice(['Scheduled', 'Pulled', 'Created', 'Started', 'BackOff']),
+        'lastTimestamp': f"2024-05-01T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}Z",
+        'count': 1 + i % 5,
+        'involvedObject': {'kind': 'Pod', 'name': f"pod-{i}", 'namespace': f"namespace-{i % namespaces}"},
+        'message': f"Event {i} about pod-{i}",
+    }
+
+
+def cluster(objects, seed=0):
+    """
+    Items by resource for one cluster with `objects` pods spread over nodes
+    and namespaces, with claims, volumes and events in proportion, shaped
+    after what the built-in tables look for
+    """
+
+    rng = random.Random(seed)
+    nodes = max(1, objects // 30)
+    namespaces = max(1, min(100, objects // 100))
+    claims = (objects + 1) // 2
+
+    return {
+        'pods': [pod(i, nodes, namespaces) for i in range(objects)],
+        'nodes': [node(i) for i in range(nodes)],
+        'persistentvolumeclaims': [claim(i, namespaces) for i in range(claims)],
+        'persistentvolumes': [volume(i, namespaces) for i in range(claims)],
+        'events': [event(i, namespaces, rng) for i in range(objects)],
+    }
+
+
+def clusters(objects, contexts):
+    """
+    Spread `objects` pods over `contexts` clusters, by context name
+    """
+
+    per_context = max(1, objects // contexts)
+    return {f"context-{c}": cluster(per_context, seed=c) for c in range(contexts)}
@@ -0,0 +1,82 @@
+import calendar
+import time
+
+from kubectl_query.protobuf import MAGIC, MESSAGES, field_type
+
+
+def varint(value):
+    value &= (1 << 64) - 1
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def delimited(number, data):
+    return varint(number << 3 | 2) + varint(len(data)) + data
+
+
+def seconds(value):
+    return calendar.timegm(time.strptime(value[:19], '%Y-%m-%dT%H:%M:%S'))
+
+
+def encode_value(number, kind, value):
+    if kind == 'string':
+        return delimited(number, value.encode())
+    if kind in ('int', 'bool'):
+        return varint(number << 3) + varint(int(value))
+    if kind == 'Time':
+        return delimited(number, varint(1 << 3) + varint(seconds(value)))
+    if kind == 'MicroTime':
+        nanos = int(value[20:26]) * 1000
+        return delimited(number, varint(1 << 3) + varint(seconds(value)) + varint(2 << 3) + varint(nanos))
+    if kind == 'Quantity':
+        return delimited(number, delimited(1, value.encode()))
+    if kind == 'IntOrString':
+        if isinstance(value, int):
+            return delimited(number, varint(1 << 3) + varint(0) + varint(2 << 3) + varint(value))
+        return delimited(number, varint(1 << 3) + varint(1) + delimited(3, value.encode()))
+    return delimited(number, encode(value, kind))
+
+
+def encode(item, message):
+    """
+    Encode a dict the way the API server would, for the fields known to
+    the decoder; anything else is left out
+    """
+
+    out = b''
+    for number, (name, kind) in sorted(MESSAGES[message].items()):
+        repeated, is_map, kind = field_type(kind)
+
+        if not name:
+            embedded = encode(item, kind)
+            if embedded:
+                out += delimited(number, embedded)
+            continue
+
+        value = item.get(name)
+        if value is None:
+            continue
+
+        if is_map:
+            for key, v in value.items():
+                out += delimited(number, delimited(1, key.encode()) + encode_value(2, kind, v))
+            continue
+
+        for v in value if repeated else [value]:
+            out += encode_value(number, kind, v)
+
+    return out
+
+
+def encode_list(api_version, kind, items):
+    """
+    A list of items as served with `Accept: application/vnd.kubernetes.protobuf`
+    """
+
+    listing = delimited(1, b'') + b''.join(delimited(2, encode(item, kind)) for item in items)
+    type_meta = delimited(1, api_version.encode()) + delimited(2, f"{kind}List".encode())
+    return MAGIC + delimited(1, type_meta) + delimited(2, listing)
@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from kubectl_query.protobuf import CONTENT_TYPE
+
+from .fixtures import RESOURCES
+from .protobuf import encode_list
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Just enough of the Kubernetes API for the dynamic client: discovery of
+    the core group and lists of all resources, cluster wide or by namespace,
+    each cluster being served under its own path prefix; lists are served
+    in protobuf when asked for, like the API server does for built-in types,
+    and a limit gives the first items with the number of remaining ones
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, body, status=200, content_type='application/json'):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        parts = self.path.split('?')[0].strip('/').split('/')
+
+        # /clusters/<context>/...
+        if len(parts) < 2 or parts[0] != 'clusters' or parts[1] not in server.clusters:
+            return self.send_json({'kind': 'Status', 'code': 404}, 404)
+        context, path = parts[1], parts[2:]
+        server.requests.append((context, '/'.join(path)))
+
+        if path == ['version']:
+            return self.send_json({'major': '1', 'minor': '30', 'gitVersion': 'v1.30.2'})
+        if path == ['api']:
+            return self.send_json({'kind': 'APIVersions', 'versions': ['v1']})
+        if path == ['apis']:
+            return self.send_json({'kind': 'APIGroupList', 'apiVersion': 'v1', 'groups': []})
+        if path == ['api', 'v1']:
+            return self.send_json(server.discovery)
+
+        # /api/v1/<plural> or /api/v1/namespaces/<namespace>/<plural>
+        namespace = None
+        if len(path) == 5 and path[2] == 'namespaces':
+            namespace, path = path[3], path[:2] + path[4:]
+        if len(path) != 3 or path[:2] != ['api', 'v1'] or path[2] not in RESOURCES:
+            return self.send_json({'kind': 'Status', 'code': 404}, 404)
+
+        latency = server.latency.get(context, 0.0) if isinstance(server.latency, dict) else server.latency
+        if latency:
+            time.sleep(latency)
+
+        # the first items only, telling how many remain
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        if 'limit' in query:
+            return self.send_json(server.page(context, path[2], namespace, int(query['limit'][0])))
+
+        if CONTENT_TYPE in self.headers.get('Accept', ''):
+            return self.send_json(server.body(context, path[2], namespace, True), content_type=CONTENT_TYPE)
+        self.send_json(server.body(context, path[2], namespace))
+
+
+class FakeApiServer(ThreadingHTTPServer):
+    """
+    In-process stand-in for any number of clusters with the given items,
+    answering lists after `latency` seconds, or after the seconds given by
+    context if `latency` is a dict; list bodies are encoded once
+    up front, also in protobuf if `protobuf` is set, so serving them costs
+    as little as possible
+    """
+
+    daemon_threads = True
+
+    def __init__(self, clusters, latency=0.0, protobuf=False):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.clusters = clusters
+        self.latency = latency
+        self.requests = []
+        self.discovery = {
+            'kind': 'APIResourceList',
+            'groupVersion': 'v1',
+            'resources': [
+                {
+                    'name': plural,
+                    'singularName': resource['kind'].lower(),
+                    'namespaced': resource['namespaced'],
+                    'kind': resource['kind'],
+                    'verbs': ['get', 'list'],
+                }
+                for plural, resource in RESOURCES.items()
+            ],
+        }
+        self.bodies = {
+            (context, plural, encoding): self.encode(plural, items, encoding)
+            for context, resources in clusters.items()
+            for plural, items in resources.items()
+            for encoding in ([False, True] if protobuf else [False])
+        }
+
+    @staticmethod
+    def encode(plural, items, protobuf=False):
+        kind = RESOURCES[plural]['kind']
+        if protobuf:
+            return encode_list('v1', kind, items)
+        return json.dumps({'kind': f"{kind}List", 'apiVersion': 'v1', 'metadata': {}, 'items': items}).encode()
+
+    def body(self, context, plural, namespace=None, protobuf=False):
+        if namespace is None and (context, plural, protobuf) in self.bodies:
+            return self.bodies[(context, plural, protobuf)]
+        items = self.clusters[context][plural]
+        if namespace is not None:
+            items = [i for i in items if i['metadata'].get('namespace') == namespace]
+        return self.encode(plural, items, protobuf)
+
+    def page(self, context, plural, namespace=None, limit=1):
+        items = self.clusters[context][plural]
+        if namespace is not None:
+            items = [i for i in items if i['metadata'].get('namespace') == namespace]
+        metadata = {}
+        if len(items) > limit:
+            metadata = {'continue': 'next', 'remainingItemCount': len(items) - limit}
+        kind = RESOURCES[plural]['kind']
+        return {'kind': f"{kind}List", 'apiVersion': 'v1', 'metadata': metadata, 'items': items[:limit]}
+
+    def url(self, context):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/clusters/{context}"
+
+    def kubeconfig(self, path):
+        """
+        Write a kubeconfig with one context per cluster, the first one being
+        the current context
+        """
+
+        contexts = list(self.clusters)
+        config = {
+            'apiVersion': 'v1',
+            'kind': 'Config',
+            'clusters': [{'name': c, 'cluster': {'server': self.url(c)}} for c in contexts],
+            'contexts': [{'name': c, 'context': {'cluster': c, 'user': 'benchmark'}} for c in contexts],
+            'users': [{'name': 'benchmark', 'user': {'token': 'benchmark'}}],
+            'current-context': contexts[0],
+        }
+        with open(path, 'w') as stream:
+            json.dump(config, stream)
+        return path
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -1,6 +1,47 @@
+import contextlib
+import os
+import types
+from test.fakeapi import environment
+from test.fakeapi.server import FakeApiServer
+
 import pytest
 
 
 @pytest.fixture
 def mock_function():
     pass
+
+
+@pytest.fixture
+def client():
+    """
+    Stand-in for the Kubernetes client, only knowing about its contexts
+    """
+    return types.SimpleNamespace(default_contexts=['test'], known_contexts=['test'])
+
+
+@pytest.fixture
+def cache_home(tmp_path, monkeypatch):
+    """
+    Point the local cache at a temporary directory
+    """
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def fake_api(tmp_path):
+    """
+    Serve clusters from a stand-in for the Kubernetes API, pointing the
+    kubeconfig and the local cache at it until the test is done
+    """
+
+    with contextlib.ExitStack() as stack:
+
+        def serve(clusters, **kwargs):
+            server = stack.enter_context(FakeApiServer(clusters, **kwargs))
+            kubeconfig = server.kubeconfig(os.path.join(tmp_path, 'kubeconfig'))
+            stack.enter_context(environment(KUBECONFIG=kubeconfig, XDG_CACHE_HOME=str(tmp_path)))
+            return server
+
+        yield serve
@@ -0,0 +1,104 @@
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from kubectl_query import main
+from kubectl_query.aggregate import aggregations, group
+
+CONFIG = """
+tables:
+  inventory-pods:
+    api: file
+    kind: pods
+    fields:
+      pod: "$.name"
+      node: "$.node"
+  inventory-nodes:
+    api: file
+    kind: nodes
+    fields:
+      node: "$.name"
+      zone: "$.zone"
+queries:
+  inventory:
+    tables:
+      - inventory-pods
+      - inventory-nodes
+"""
+
+INVENTORY = """
+pods:
+  - {name: a, node: x}
+  - {name: b, node: y}
+  - {name: c, node: x}
+nodes:
+  - {name: x, zone: z1}
+"""
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'node': ['a', 'b', 'a', 'b', 'a'],
+        'namespace': ['x', 'x', 'y', 'y', 'y'],
+        'usagecpu': ['1', '2', '-', '4.5', '3'],
+    })
+
+
+def test_aggregations():
+    assert aggregations(['sum:usagecpu', 'count']) == [('sum', 'usagecpu'), ('count', None)]
+    assert aggregations({'usagecpu': ['sum', 'max'], 'pod': 'count'}) == [
+        ('sum', 'usagecpu'),
+        ('max', 'usagecpu'),
+        ('count', 'pod'),
+    ]
+    with pytest.raises(ValueError):
+        aggregations(['median:usagecpu'])
+    with pytest.raises(ValueError):
+        aggregations(['sum'])
+
+
+def test_group(frame):
+    result = group(frame, ['node'], [('sum', 'usagecpu'), ('count', None), ('nunique', 'namespace')])
+    assert result.to_dict('list') == {
+        'node': ['a', 'b'],
+        'usagecpu': [4.0, 6.5],
+        'count': [3, 2],
+        'namespace': [2, 2],
+    }
+
+    # columns used more than once or grouped by are told apart
+    result = group(frame, ['node', 'context'], [('max', 'usagecpu'), ('min', 'usagecpu'), ('count', 'node')])
+    assert list(result.columns) == ['node', 'usagecpu-max', 'usagecpu-min', 'node-count']
+    assert result['usagecpu-max'].tolist() == [3.0, 4.5]
+
+
+def test_group_everything(frame):
+    assert group(frame, [], [('mean', 'usagecpu')]).to_dict('list') == {'usagecpu': [2.625]}
+    assert group(frame, ['namespace'], []).to_dict('list') == {'namespace': ['x', 'y'], 'count': [2, 3]}
+    with pytest.raises(ValueError):
+        group(frame, ['node'], [('sum', 'usagemem')])
+
+
+def test_group_missing(frame):
+    # missing values aren't counted, and only a missing context is no typo
+    result = group(pd.DataFrame({'node': ['n', 'n'], 'pod': ['p', None]}), ['node', 'context'], [('count', 'pod')])
+    assert result.to_dict('list') == {'node': ['n'], 'pod': [1]}
+
+    with pytest.raises(ValueError, match="nodee"):
+        group(frame, ['nodee'], [])
+
+
+def test_group_query(tmp_path, cache_home, caplog):
+    tmp_path.joinpath('config.yaml').write_text(CONFIG)
+    tmp_path.joinpath('data').mkdir()
+    tmp_path.joinpath('data', 'inventory.yaml').write_text(INVENTORY)
+    args = ['-c', str(tmp_path / 'config.yaml'), '-I', str(tmp_path / 'data'), '-o', 'csv', 'inventory']
+
+    # node y has no zone, which is filled in only after grouping
+    result = CliRunner().invoke(main, args + ['-g', 'node,zone', '-a', 'count:zone'])
+    assert result.exit_code == 0, result.output
+    assert result.stdout.splitlines() == ['node,zone,zone-count', 'x,z1,2', 'y,-,0']
+
+    CliRunner().invoke(main, args + ['-g', 'nodee', '-a', 'count'])
+    assert "Cannot group by columns ['nodee']" in caplog.text
@@ -0,0 +1,50 @@
+import pytest
+
+from kubectl_query.config import Config
+
+
+def test_config_cache(client, cache_home, monkeypatch):
+    config = Config((), client)
+    config.init_config(['pods-nodes-metrics'], [])
+    assert list(cache_home.joinpath('kubectl-query').glob('config-*.pickle'))
+    assert list(cache_home.joinpath('kubectl-query').glob('paths-*.pickle'))
+
+    # a warm start must neither read yaml nor parse json paths
+    def fail(*args):
+        pytest.fail("config was parsed despite the cache")
+
+    monkeypatch.setattr(Config, 'merge_config', fail)
+    monkeypatch.setattr('jsonpath_ng.ext.parse', fail)
+
+    cached = Config((), client)
+    cached.init_config(['pnm'], [])
+    assert cached.show == ['pods-nodes-metrics']
+    assert cached.aliases == config.aliases
+    assert str(cached.tables['pods-metrics']['fields']['pod']) == str(config.tables['pods-metrics']['fields']['pod'])
+    assert cached.tables['nodes-metrics']['contexts'] == ['test']
+
+
+def test_config_cache_invalidation(client, cache_home, tmp_path):
+    configfile = tmp_path / 'extra.yaml'
+    configfile.write_text("tables:\n  extra:\n    api: v1\n    kind: Pod\n    fields:\n      pod: $.metadata.name\n")
+    assert 'extra' in Config((str(configfile),), client).tables
+
+    configfile.write_text("tables:\n  another:\n    api: v1\n    kind: Pod\n    fields:\n      pod: $.metadata.name\n")
+    config = Config((str(configfile),), client)
+    assert 'another' in config.tables
+    assert 'extra' not in config.tables
+
+
+def test_config_settings(client, cache_home, tmp_path):
+    configfile = tmp_path / 'extra.yaml'
+    configfile.write_text("tables:\n  extra:\n    api: v1\n    kind: Pod\n    pool_threshold: 5\n    protobuf: true\n")
+    defaults = {'cache': True, 'pool_threshold': 100, 'protobuf': False}
+
+    # the settings of a table win over the defaults, but not over overrides
+    config = Config((str(configfile),), client, defaults=defaults)
+    assert {k: config.tables['extra'][k] for k in defaults} == {'cache': True, 'pool_threshold': 5, 'protobuf': True}
+    assert config.tables['pods-nodes']['pool_threshold'] == 100
+
+    config = Config((str(configfile),), client, defaults=defaults, overrides={'pool_threshold': 0})
+    assert config.tables['extra']['pool_threshold'] == 0
+    assert config.tables['extra']['protobuf'] is True
@@ -0,0 +1,67 @@
+import json
+
+import pandas as pd
+from click.testing import CliRunner
+
+from kubectl_query import main
+from kubectl_query.diff import diff
+
+CONFIG = """
+tables:
+  inventory-pods:
+    api: file
+    kind: pods
+    key:
+      - pod
+    fields:
+      pod: "$.name"
+      node: "$.node"
+"""
+
+INVENTORY = """
+pods:
+  - {name: a, node: x}
+  - {name: b, node: y}
+  - {name: c, node: z}
+"""
+
+
+def test_diff():
+    left = pd.DataFrame({'pod': ['a', 'b', 'c', 'd', 'd'], 'node': ['x', 'y', 'z', None, None], 'zone': ['1'] * 5})
+    right = pd.DataFrame({'pod': ['a', 'b', 'e', 'd'], 'node': ['x', 'q', 'z', None]})
+
+    result = diff(left, right, ['pod'])
+    assert result.values.tolist() == [
+        ['-', 'c', 'z'],
+        ['-', 'd', '-'],
+        ['~', 'b', 'y -> q'],
+        ['+', 'e', 'z'],
+    ]
+
+    # without a key, changed rows are removed and added
+    result = diff(left, right)
+    assert result['diff'].tolist() == ['-', '-', '-', '+', '+']
+
+    assert diff(left, left, ['pod']).empty
+
+
+def test_diff_snapshot(tmp_path, cache_home):
+    tmp_path.joinpath('config.yaml').write_text(CONFIG)
+    tmp_path.joinpath('data').mkdir()
+    tmp_path.joinpath('data', 'inventory.yaml').write_text(INVENTORY)
+    snapshot = tmp_path / 'snapshot.jsonl'
+    snapshot.write_text(
+        "".join(json.dumps(row) + "\n" for row in [{'pod': 'a', 'node': 'x'}, {'pod': 'b', 'node': 'x'}])
+    )
+
+    args = ['-c', str(tmp_path / 'config.yaml'), '-I', str(tmp_path / 'data'), '-o', 'csv']
+    result = CliRunner().invoke(main, args + ['--diff', str(snapshot), str(snapshot), 'inventory-pods'])
+    assert result.exit_code == 0, result.output
+    assert result.stdout == ""
+
+    # file tables are the same in every context
+    (tmp_path / 'kubeconfig').write_text("contexts:\n- name: prod\ncurrent-context: prod\n")
+    env = {'KUBECONFIG': str(tmp_path / 'kubeconfig')}
+    result = CliRunner().invoke(main, args + ['--diff', str(snapshot), 'prod', 'inventory-pods'], env=env)
+    assert result.exit_code == 0, result.output
+    assert result.stdout.splitlines() == ['diff,pod,node', '~,b,x -> y', '+,c,z']
@@ -0,0 +1,83 @@
+from test.fakeapi import fixtures
+
+import pytest
+from click.testing import CliRunner
+
+from kubectl_query import main
+from kubectl_query.client import Client
+from kubectl_query.config import Config
+from kubectl_query.estimate import check, estimate_query, record, record_query, recorded
+from kubectl_query.query import Query
+
+
+@pytest.fixture
+def cluster(fake_api):
+    fake_api(fixtures.clusters(60, 2))
+    client = Client(['all'])
+    config = Config((), client, False)
+    config.init_config(['pods-nodes-images'], [])
+    return client, config
+
+
+def test_estimate_live(cluster):
+    client, config = cluster
+    tables, rows = estimate_query(client, config, 'pods-nodes-images', live=True)
+
+    assert [(t['table'], t['context'], t['objects'], t['source']) for t in tables] == [
+        ('nodes-specs', 'context-0', 1, 'live'),
+        ('nodes-specs', 'context-1', 1, 'live'),
+        ('pods-images', 'context-0', 30, 'live'),
+        ('pods-images', 'context-1', 30, 'live'),
+    ]
+    # the nodes come first, but the result has at least a row for each pod
+    assert rows == 60
+
+    # once the query ran, the fan-out of its joins is known
+    result = Query(client, config, [], 'pods-nodes-images')
+    assert estimate_query(client, config, 'pods-nodes-images', live=True)[1] == len(result)
+    assert estimate_query(client, config, 'pods-nodes-images')[1] == len(result)
+
+
+def test_estimate_recorded(cluster):
+    client, config = cluster
+
+    # nothing is known before the first run, so nothing is refused
+    tables, rows = estimate_query(client, config, 'pods-nodes-images')
+    assert rows is None and {t['source'] for t in tables} == {None}
+    check(client, config, max_rows=1)
+
+    # each node had five conditions and each pod one and a half containers
+    for context in ['context-0', 'context-1']:
+        record('nodes-specs', context, 1, 5)
+        record('pods-images', context, 30, 45)
+
+    tables, rows = estimate_query(client, config, 'pods-nodes-images')
+    assert [t['source'] for t in tables] == ['cached'] * 4
+    assert rows == 90
+
+    check(client, config, warn_rows=10, max_rows=100)
+    with pytest.raises(ValueError, match="estimated at 90 rows from 62 objects, more than 80"):
+        check(client, config, max_rows=80)
+
+    # the last run of the query gave two rows per node
+    record_query('pods-nodes-images', 10, 20)
+    assert estimate_query(client, config, 'pods-nodes-images')[1] == 20
+
+
+def test_estimate_uncached(fake_api, tmp_path):
+    fake_api(fixtures.clusters(60, 2))
+    tmp_path.joinpath('config.yaml').write_text(
+        "tables:\n  inventory:\n    api: file\n    kind: pods\n    fields:\n      pod: $.name\n"
+    )
+    tmp_path.joinpath('data').mkdir()
+    tmp_path.joinpath('data', 'inventory.yaml').write_text("pods:\n  - {name: a}\n  - {name: b}\n")
+
+    # counts are recorded without the row cache, and for tables from files as a whole
+    runner = CliRunner()
+    options = ['--no-cache', '--context', 'all', '-c', str(tmp_path / 'config.yaml'), '-I', str(tmp_path / 'data')]
+    assert runner.invoke(main, options + ['pods-images', 'inventory']).exit_code == 0
+    assert recorded('pods-images', 'context-0') == {'objects': 30, 'rows': 30}
+    assert recorded('inventory', None) == {'objects': 2, 'rows': 2}
+
+    result = runner.invoke(main, options + ['--max-rows', '50', 'pods-images'])
+    assert result.exit_code != 0 and "estimated at 60 rows" in result.output
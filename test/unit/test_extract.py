@@ -0,0 +1,148 @@
+import pickle
+import threading
+from test.fakeapi import fixtures
+
+import pytest
+
+from kubectl_query.client import Client
+from kubectl_query.config import Config
+from kubectl_query.estimate import recorded
+from kubectl_query.extract import Extractor, Lambda, RowCache, extract, pool_context
+from kubectl_query.profiling import Profile
+from kubectl_query.table import Table
+
+
+def test_lambda_pickles_as_source():
+    function = pickle.loads(pickle.dumps(Lambda("lambda x: int(x[:-1]) * 2")))
+    assert function.source == "lambda x: int(x[:-1]) * 2"
+    assert function("21m") == 42
+
+
+def test_pool_matches_serial(client, cache_home):
+    config = Config((), client)
+    config.init_config(['pods-cpurequests'], [])
+    fields = config.tables['pods-cpurequests']['fields']
+
+    entries = [
+        {
+            'metadata': {'name': f'pod-{i}', 'namespace': f'ns-{i % 7}'},
+            'spec': {'containers': [{'resources': {'requests': {'cpu': f'{i}m'}}}, {'resources': {}}]},
+        }
+        for i in range(3000)
+    ]
+    batches = [(Extractor(fields, context, kubernetes=True), entries) for context in ['a', 'b']]
+
+    serial = extract(batches, threshold=0)
+    pooled = extract(batches, threshold=1, workers=2)
+
+    assert pooled == serial
+    assert len(serial['pod']) == 2 * 3000
+    # quantities are transformed once the table is built
+    assert serial['requestscpu'][:2] == ['0m', '1m']
+    assert serial['context'][-1] == 'b'
+
+
+def test_pool_beside_threads(client, cache_home):
+    config = Config((), client)
+    config.init_config(['pods-nodes'], [])
+    fields = config.tables['pods-nodes']['fields']
+    entries = [{'metadata': {'name': f'pod-{i}', 'namespace': 'ns'}, 'spec': {'nodeName': 'node'}} for i in range(2000)]
+    batches = [(Extractor(fields, 'a', kubernetes=True), entries)]
+
+    # with a thread still fetching, the workers aren't forked from this process
+    done = threading.Event()
+    thread = threading.Thread(target=done.wait)
+    thread.start()
+    try:
+        assert pool_context().get_start_method() != 'fork'
+        assert extract(batches, threshold=1, workers=2) == extract(batches, threshold=0)
+    finally:
+        done.set()
+        thread.join()
+
+
+def test_stats(client, cache_home):
+    config = Config((), client)
+    config.init_config(['pods-nodes'], [])
+    fields = config.tables['pods-nodes']['fields']
+
+    entries = [{'metadata': {'name': f'pod-{i}', 'namespace': 'ns'}, 'spec': {'nodeName': 'node'}} for i in range(2500)]
+    batches = [
+        (Extractor(fields, context, kubernetes=True, profile=True), entries[:n])
+        for context, n in [('a', 2500), ('b', 10)]
+    ]
+
+    for threshold, workers in [(0, None), (1, 2)]:
+        stats = []
+        extract(batches, threshold=threshold, workers=workers, stats=stats)
+        assert [batch['rows'] for batch in stats] == [2500, 10]
+        assert set(stats[0]['timings']) == {'namespace', 'pod', 'node'}
+
+
+def test_row_cache(client, cache_home):
+    config = Config((), client)
+    config.init_config(['pods-images'], [])
+    fields = config.tables['pods-images']['fields']
+
+    def pod(i, version='1', containers=2):
+        return {
+            'metadata': {'name': f'pod-{i}', 'namespace': 'ns', 'uid': f'uid-{i}', 'resourceVersion': version},
+            'spec': {'containers': [{'name': f'c{c}', 'image': f'image-{i}'} for c in range(containers)]},
+        }
+
+    def extract_cached(entries):
+        extractor = Extractor(fields, 'a', kubernetes=True)
+        rowcache = RowCache('pods-images', fields, 'a')
+        fresh, reused = rowcache.split(entries)
+        stats = []
+        columns = extract([(extractor, fresh)], threshold=0, stats=stats)
+        return len(fresh), rowcache.merge(entries, reused, columns, stats[0]['counts'])
+
+    entries = [pod(i) for i in range(5)]
+    assert extract_cached(entries) == (5, extract([(Extractor(fields, 'a', kubernetes=True), entries)]))
+
+    # one pod changed, one is gone and one is new
+    entries = [pod(0), pod(1, '2', containers=1), pod(3), pod(4), pod(5)]
+    fresh, columns = extract_cached(entries)
+    assert fresh == 2
+    assert columns == extract([(Extractor(fields, 'a', kubernetes=True), entries)])
+    assert sorted(RowCache('pods-images', fields, 'a').rows) == ['uid-0', 'uid-1', 'uid-3', 'uid-4', 'uid-5']
+
+
+def test_row_cache_counts(fake_api, monkeypatch):
+    fake_api(fixtures.clusters(20, 2))
+    client = Client(['all'])
+    config = Config((), client, False)
+    config.init_config(['pods-images'], [])
+
+    # the counts of a warm run include the objects and rows from the cache
+    runs = []
+    for _ in range(2):
+        run = Profile()
+        run.enabled = True
+        monkeypatch.setattr('kubectl_query.table.profile', run)
+        Table(client, 'pods-images', [], **config.tables['pods-images'])
+        runs.append([(f['context'], f['objects'], f['rows']) for f in run.fetches])
+
+    assert runs[0] == runs[1] == [('context-0', 10, 10), ('context-1', 10, 10)]
+    assert recorded('pods-images', 'context-1') == {'objects': 10, 'rows': 10}
+
+
+def test_dropped_objects(client, cache_home, caplog):
+    config = Config((), client)
+    config.init_config(['pods-nodes'], [])
+    fields = config.tables['pods-nodes']['fields']
+
+    # objects a lambda fails on are dropped, and the batch isn't cached
+    fields = dict(fields, node=[fields['node'], Lambda("lambda x: x.split('/')[1]")])
+    entries = [{'metadata': {'name': f'pod-{i}', 'namespace': 'ns'}, 'spec': {'nodeName': f'n/{i}'}} for i in range(3)]
+    entries.insert(1, {'metadata': {'name': 'broken', 'namespace': 'ns'}, 'spec': {'nodeName': 'node'}})
+    stats = []
+    columns = extract([(Extractor(fields, 'a', kubernetes=True), entries)], stats=stats)
+    assert columns['pod'] == ['pod-0', 'pod-1', 'pod-2']
+    assert stats[0]['counts'] is None
+    assert 'Dropped 1 of 4 objects' in caplog.text
+
+    # errors in tables not read from Kubernetes aren't hidden
+    with pytest.raises(IndexError):
+        extract([(Extractor(fields), entries)])
@@ -0,0 +1,67 @@
+import pytest
+from jsonpath_ng.ext import parse
+
+from kubectl_query.intervals import helper_columns, merge
+from kubectl_query.table import Table
+
+INVENTORY = """
+pools:
+  - name: small
+    range: {start: 10.0.0.10, stop: 10.0.0.20}
+  - name: large
+    range: {cidr: 10.1.0.0/16}
+  - name: empty
+    range: {cidr: 10.2.0.0/24}
+pods:
+  - {name: a, ip: 10.0.0.10}
+  - {name: b, ip: 10.0.0.21}
+  - {name: c, ip: 10.1.255.255}
+  - {name: d, ip: 10.1.0.3}
+  - {name: e, ip: <none>}
+"""
+
+
+@pytest.fixture
+def tables(tmp_path):
+    tmp_path.joinpath('inventory.yaml').write_text(INVENTORY)
+    include = [str(tmp_path)]
+    pools = Table(
+        None, 'pools', include, 'file', 'pools', {'pool': parse('$.name'), 'podip': [parse('$.range'), 'unrange']}
+    )
+    pods = Table(None, 'pods', include, 'file', 'pods', {'pod': parse('$.name'), 'podip': parse('$.ip')})
+    return pools, pods
+
+
+def test_ranges_stay_intervals(tables):
+    pools, _ = tables
+    assert len(pools) == 3
+    assert list(pools['podip']) == ['10.0.0.10-10.0.0.20', '10.1.0.0/16', '10.2.0.0/24']
+    assert helper_columns(pools) == ['podip:start', 'podip:end']
+
+
+def test_addresses_join_ranges(tables):
+    pools, pods = tables
+    result = merge(pods, pools)
+    assert list(result.columns) == ['pod', 'podip', 'pool']
+    assert list(result['pod']) == ['a', 'b', 'c', 'd', 'e']
+    assert list(result['pool'].fillna('-')) == ['small', '-', 'large', 'large', '-']
+
+
+def test_ranges_join_addresses(tables):
+    pools, pods = tables
+    result = merge(pools, pods)
+    assert list(result.columns) == ['pool', 'podip', 'pod']
+    assert list(result['pool']) == ['small', 'large', 'large', 'empty']
+    assert list(result['podip']) == ['10.0.0.10', '10.1.0.3', '10.1.255.255', '10.2.0.0/24']
+    assert list(result['pod'].fillna('-')) == ['a', 'd', 'c', '-']
+
+
+def test_missing_values_match(tables):
+    pools, pods = tables
+    pools['namespace'] = [None, 'prod', None]
+    pods['namespace'] = [None, None, 'prod', None, None]
+
+    result = merge(pods, pools)
+    assert list(result['pool'].fillna('-')) == ['small', '-', 'large', '-', '-']
+    result = merge(pools, pods)
+    assert list(result['pod'].fillna('-')) == ['a', 'c', '-']
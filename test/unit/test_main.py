@@ -1,9 +1,84 @@
+import json
+import subprocess
+import sys
+
 from click.testing import CliRunner
 
 from kubectl_query import main
+from kubectl_query.extract import POOL_THRESHOLD
+
+# modules only needed once data is fetched and rendered
+HEAVY_MODULES = ['pandas', 'kubernetes', 'dns', 'requests', 'tabulate', 'jsonpath_ng']
 
 
 def test_main():
     runner = CliRunner()
     result = runner.invoke(main, ['-vvv'])
     assert result.exit_code == 0
+
+
+def run_isolated(code, tmp_path):
+    """
+    Run some code in a fresh interpreter, so the modules loaded by other
+    tests don't count, and return what it printed as json
+    """
+    kubeconfig = tmp_path / 'kubeconfig'
+    kubeconfig.write_text("contexts:\n- name: test\ncurrent-context: test\n")
+    env = {'KUBECONFIG': str(kubeconfig), 'XDG_CACHE_HOME': str(tmp_path), 'PATH': ''}
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_import_light(tmp_path):
+    # the heavy modules are what makes importing slow, so check that none of
+    # them is loaded rather than timing the import on a machine that may be busy
+    code = f"""
+import json, sys
+import kubectl_query
+print(json.dumps([m for m in {HEAVY_MODULES} if m in sys.modules]))
+"""
+    assert run_isolated(code, tmp_path) == []
+
+
+def test_list_fast_path(tmp_path):
+    code = f"""
+import json, sys
+from click.testing import CliRunner
+from kubectl_query import main
+from kubectl_query.extract import POOL_THRESHOLD
+for _ in range(2):
+    result = CliRunner().invoke(main, ['-l'])
+    assert result.exit_code == 0, result.output
+    assert 'pods-nodes-metrics' in result.output
+print(json.dumps([m for m in {HEAVY_MODULES} if m in sys.modules]))
+"""
+    assert run_isolated(code, tmp_path) == []
+
+
+def test_completion(cache_home):
+    env = {'_KUBECTL_QUERY_COMPLETE': 'bash_complete', 'COMP_WORDS': 'kubectl-query pods-nodes-m', 'COMP_CWORD': '1'}
+    result = CliRunner().invoke(main, [], env=env, prog_name='kubectl-query')
+    assert result.output.splitlines() == ['plain,pods-nodes-metrics']
+
+
+def test_explicit_settings(tmp_path, monkeypatch):
+    kubeconfig = tmp_path / 'kubeconfig'
+    kubeconfig.write_text("contexts:\n- name: test\ncurrent-context: test\n")
+    monkeypatch.setenv('KUBECONFIG', str(kubeconfig))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+
+    calls = []
+
+    def config(configpaths, client, use_cache, defaults, overrides):
+        calls.append((defaults, overrides))
+        raise SystemExit(0)
+
+    monkeypatch.setattr(sys.modules['kubectl_query.main'], 'Config', config)
+
+    # only the options given on the command line override the tables
+    CliRunner().invoke(main, ['pods', '--pool-threshold', '0', '--no-protobuf'])
+    CliRunner().invoke(main, ['pods'])
+    assert calls == [
+        ({'cache': True, 'pool_threshold': 0, 'protobuf': False}, {'pool_threshold': 0, 'protobuf': False}),
+        ({'cache': True, 'pool_threshold': POOL_THRESHOLD, 'protobuf': False}, {}),
+    ]
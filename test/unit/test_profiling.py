@@ -0,0 +1,102 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from kubectl_query import main
+from kubectl_query.profiling import Profile, profile, reset_peak_rss
+
+CONFIG = """
+tables:
+  inventory-pods:
+    api: file
+    kind: pods
+    fields:
+      pod: "$.name"
+      containers: "$.containers[*]"
+  inventory-nodes:
+    api: file
+    kind: pods
+    fields:
+      pod: "$.name"
+      node: "$.node"
+queries:
+  inventory:
+    tables:
+      - inventory-pods
+      - inventory-nodes
+"""
+
+INVENTORY = """
+pods:
+  - {name: a, node: x, containers: [one, two]}
+  - {name: b, node: y, containers: [three]}
+"""
+
+
+@pytest.fixture
+def inventory(tmp_path, cache_home):
+    tmp_path.joinpath('config.yaml').write_text(CONFIG)
+    tmp_path.joinpath('data').mkdir()
+    tmp_path.joinpath('data', 'inventory.yaml').write_text(INVENTORY)
+    yield ['-c', str(tmp_path / 'config.yaml'), '-I', str(tmp_path / 'data')]
+
+    profile.reset()
+
+
+def test_profile_json(inventory):
+    result = CliRunner().invoke(
+        main, inventory + ['--profile', '--profile-format', 'json', '-p', 'one|three', 'inventory']
+    )
+    assert result.exit_code == 0, result.output
+    report = json.loads(result.stderr)
+
+    assert [(f['table'], f['context'], f['objects'], f['rows']) for f in report['fetches']] == [
+        ('inventory-pods', 'file', 2, 3),
+        ('inventory-nodes', 'file', 2, 2),
+    ]
+    assert {(p['table'], p['field']) for p in report['paths']} == {
+        ('inventory-pods', 'pod'),
+        ('inventory-pods', 'containers'),
+        ('inventory-nodes', 'pod'),
+        ('inventory-nodes', 'node'),
+    }
+
+    steps = {(s['stage'], s['name']): (s['rows_in'], s['rows_out']) for s in report['steps']}
+    assert steps[('merge', 'inventory-nodes')] == (3, 3)
+    assert steps[('postprocess', 'patterns')] == (3, 2)
+    assert steps[('render', 'color')] == (2, None)
+    assert ('fetch', 'inventory-pods') in steps
+
+
+def test_step_peaks(monkeypatch):
+    if not reset_peak_rss():
+        pytest.skip("the peak resident size can't be reset here")
+
+    run = Profile()
+    run.reset(True)
+    with run.step('outer', 'a'):
+        with run.step('inner', 'big'):
+            block = bytearray(64 * 2**20)
+            block[::4096] = b'x' * len(block[::4096])
+            del block
+        with run.step('inner', 'small'):
+            pass
+
+    # each step has the peak during itself, the outer one that of both
+    peaks = {s['name']: s['peak'] for s in run.steps}
+    assert peaks['big'] - peaks['small'] > 48 * 2**20
+    assert peaks['a'] == peaks['big']
+
+
+def test_profile_table(inventory):
+    result = CliRunner().invoke(main, inventory + ['--profile', 'inventory'])
+    assert result.exit_code == 0, result.output
+    assert result.stderr.splitlines()[0].split() == ['TABLE', 'CONTEXT', 'MS', 'BYTES', 'OBJECTS', 'ROWS']
+    assert 'Max RSS of the process' in result.stderr
+
+    # a second run in the same process starts over
+    report = json.loads(
+        CliRunner().invoke(main, inventory + ['--profile', '--profile-format', 'json', 'inventory']).stderr
+    )
+    assert len(report['fetches']) == 2
@@ -0,0 +1,163 @@
+import json
+import os
+from test.fakeapi import fixtures
+from test.fakeapi.protobuf import encode_list
+
+import pytest
+from jsonpath_ng.ext import parse
+
+from kubectl_query import protobuf
+from kubectl_query.client import Client
+from kubectl_query.table import Table
+
+# A PodList with one pod the way the API server writes it, with every field
+# that isn't a pointer even if empty or zero; it is encoded by protoc from
+# pod-list.textproto with the field numbers of the Kubernetes generated.proto
+# given in pod-list.proto, independently of the encoder of the fake API, and
+# can be replaced by a list from a real cluster, as served by `kubectl proxy`
+# with `Accept: application/vnd.kubernetes.protobuf`
+POD_LIST = os.path.join(os.path.dirname(__file__), 'fixtures', 'pod-list.pb')
+
+
+def pod_list():
+    with open(POD_LIST, 'rb') as stream:
+        return stream.read()
+
+
+def test_loads():
+    result = protobuf.loads(pod_list(), 'Pod')
+
+    # what the API server gives as json for this pod, for the known fields
+    assert result == {
+        'apiVersion': 'v1',
+        'kind': 'PodList',
+        'metadata': {'resourceVersion': '184467'},
+        'items': [{
+            'metadata': {
+                'name': 'web-7d4b9c-x2x9q',
+                'generateName': 'web-7d4b9c-',
+                'namespace': 'shop',
+                'uid': '0f1e2d3c-4b5a-6978-8796-a5b4c3d2e1f0',
+                'resourceVersion': '184321',
+                'creationTimestamp': '2024-05-01T10:00:00Z',
+                'labels': {'app': 'web', 'pod-template-hash': '7d4b9c'},
+            },
+            'spec': {
+                'containers': [{
+                    'name': 'web',
+                    'image': 'nginx:1.25',
+                    'args': ['--port=8080'],
+                    'ports': [{'name': 'http', 'containerPort': 8080, 'protocol': 'TCP'}],
+                    'resources': {'limits': {'memory': '256Mi'}, 'requests': {'cpu': '250m', 'memory': '128Mi'}},
+                    'imagePullPolicy': 'IfNotPresent',
+                }],
+                'restartPolicy': 'Always',
+                'terminationGracePeriodSeconds': 30,
+                'dnsPolicy': 'ClusterFirst',
+                'serviceAccountName': 'default',
+                'nodeName': 'node-1',
+                'schedulerName': 'default-scheduler',
+            },
+            'status': {
+                'phase': 'Running',
+                'hostIP': '10.0.1.5',
+                'podIP': '10.244.1.17',
+                'startTime': '2024-05-01T10:00:01Z',
+                'qosClass': 'Burstable',
+                'podIPs': [{'ip': '10.244.1.17'}],
+            },
+        }],
+    }
+
+
+def test_loads_json():
+    assert protobuf.loads(b'{"kind": "IngressRouteList", "items": []}', 'IngressRoute')['items'] == []
+
+
+@pytest.mark.parametrize('plural', list(fixtures.RESOURCES))
+def test_round_trip(plural):
+    kind = fixtures.RESOURCES[plural]['kind']
+    items = fixtures.cluster(40)[plural]
+
+    # json leaves out empty lists just like protobuf
+    def clean(value):
+        if isinstance(value, dict):
+            return {k: clean(v) for k, v in value.items() if v != []}
+        if isinstance(value, list):
+            return [clean(v) for v in value]
+        return value
+
+    assert protobuf.loads(encode_list('v1', kind, items), kind)['items'] == clean(items)
+
+
+def test_scalars():
+    event = {
+        'metadata': {'name': 'e', 'deletionGracePeriodSeconds': -1},
+        'eventTime': '2024-05-01T10:00:00.123456Z',
+        'count': 3,
+    }
+    service = {'spec': {'ports': [{'port': 80, 'targetPort': 8080}, {'port': 443, 'targetPort': 'https'}]}}
+
+    assert protobuf.loads(encode_list('v1', 'Event', [event]), 'Event')['items'] == [event]
+    assert protobuf.loads(encode_list('v1', 'Service', [service]), 'Service')['items'] == [service]
+
+
+def test_table_plan():
+    fields = {
+        'pod': parse('$.metadata.name'),
+        'zone': parse("$.spec.tolerations[?key='topology.kubernetes.io/zone'].value"),
+        'cpu': [parse('$.spec.containers[*].resources.requests.cpu'), 'unroll'],
+    }
+    plan = protobuf.table_plan('v1', 'Pod', fields)
+
+    # only what the paths look at is decoded
+    assert sorted(plan) == [1, 2]
+    assert sorted(plan[1][4]) == [1]
+    assert sorted(plan[2][4]) == [2, 22]
+    assert sorted(plan[2][4][22][4]) == [1, 3]
+
+    item = protobuf.loads(pod_list(), 'Pod', plan)['items'][0]
+    assert item == {
+        'metadata': {'name': 'web-7d4b9c-x2x9q'},
+        'spec': {'containers': [{'resources': {'requests': {'cpu': '250m', 'memory': '128Mi'}}}]},
+    }
+
+
+def test_table_plan_json():
+    # custom resources, paths to fields that aren't decoded and partial objects
+    assert protobuf.table_plan('traefik.io/v1alpha1', 'IngressRoute', {'name': parse('$.metadata.name')}) is None
+    assert protobuf.table_plan('v1', 'Pod', {'overhead': parse('$.spec.overhead')}) is None
+    assert protobuf.table_plan('v1', 'Pod', {'spec': parse('$.spec')}) is None
+    assert protobuf.table_plan('v1', 'Pod', {'names': parse('$..name')}) is None
+
+
+def test_table(fake_api, monkeypatch):
+    fields = {
+        'pod': parse('$.metadata.name'),
+        'node': parse('$.spec.nodeName'),
+        'port': parse('$.spec.containers[*].ports[*].containerPort'),
+        'app': parse('$.metadata.labels.app'),
+    }
+    decoded = []
+    monkeypatch.setattr('kubectl_query.table.loads', lambda *args: decoded.append(args[1]) or protobuf.loads(*args))
+
+    fake_api(fixtures.clusters(20, 2), protobuf=True)
+    client = Client(['all'])
+    tables = [
+        Table(
+            client,
+            'pods',
+            [],
+            'v1',
+            'Pod',
+            fields,
+            contexts=client.default_contexts,
+            protobuf=encoding,
+            cache=False,
+        )
+        for encoding in (False, True)
+    ]
+
+    assert decoded == ['Pod', 'Pod']
+    assert len(tables[0]) == 30
+    assert json.loads(tables[1].to_json()) == json.loads(tables[0].to_json())
@@ -0,0 +1,91 @@
+from test.fakeapi import fixtures
+
+import pandas as pd
+from click.testing import CliRunner
+
+from kubectl_query import main
+from kubectl_query.client import Client
+from kubectl_query.config import Config
+from kubectl_query.query import Query, merge_tables, stream_contexts, streamable
+
+TABLES = ['pods', 'nodes', 'zones']
+
+
+def tables():
+    pods = pd.DataFrame({
+        'context': ['a', 'a', 'b', 'b', 'c'],
+        'pod': ['p1', 'p2', 'p1', 'p3', 'p4'],
+        'node': ['n1', 'n2', 'n1', 'n1', 'n9'],
+    })
+    nodes = pd.DataFrame({
+        'context': ['a', 'a', 'b', 'b'],
+        'node': ['n1', 'n2', 'n1', 'n2'],
+        'zone': ['z1', 'z2', 'z3', 'z1'],
+    })
+    # without a context column, like a table from a file
+    zones = pd.DataFrame({'zone': ['z1', 'z2', 'z3'], 'region': ['r1', 'r1', 'r2']})
+    return [pods, nodes, zones]
+
+
+def test_merge_tables():
+    result = merge_tables(TABLES, tables())
+
+    # rows only join rows of the same context, tables without one join all
+    assert result['zone'].tolist()[:4] == ['z1', 'z2', 'z3', 'z3']
+    assert result['region'].tolist()[:4] == ['r1', 'r1', 'r2', 'r2']
+    assert result['zone'].isna().tolist() == [False, False, False, False, True]
+
+
+def test_stream_contexts(fake_api):
+    fake_api(fixtures.clusters(30, 3), latency={'context-0': 0.5})
+    client = Client(['all'])
+    config = Config((), client, False)
+    config.init_config(['pods-nodes', 'pods-nodes-images', 'nodes-cpurequests'], [])
+
+    assert streamable(config, 'pods-nodes')
+    assert streamable(config, 'pods-nodes-images')
+    assert not streamable(config, 'nodes-cpurequests')
+
+    parts = list(stream_contexts(client, config, [], 'pods-nodes'))
+    expected = Query(client, config, [], 'pods-nodes')
+
+    output = CliRunner().invoke(main, ['--context', 'all', '-o', 'csv', '--stream', 'pods-nodes']).output
+
+    # the slowest context comes last, each with its own context column
+    assert [part['context'].unique().tolist() for part in parts][-1] == ['context-0']
+    result = pd.concat(parts).sort_values(['context', 'pod'], ignore_index=True)
+    pd.testing.assert_frame_equal(result, expected.sort_values(['context', 'pod'], ignore_index=True))
+
+    # rows of all contexts as one csv
+    lines = output.splitlines()
+    assert lines[0] == 'context,namespace,pod,node' and len(lines) == 1 + len(expected)
+    assert lines[-1].startswith('context-0,')
+
+
+def test_query_contexts(fake_api):
+    fake_api(fixtures.clusters(20, 2))
+    client = Client(['all'])
+    config = Config((), client, False)
+    config.init_config(['pods-nodes'], [])
+
+    # one side of a diff reads a single context, leaving the config alone
+    result = Query(client, config, [], 'pods-nodes', contexts=['context-1'])
+    assert len(result) == 10 and 'context' not in result.columns
+    assert config.tables['pods-nodes']['contexts'] == ['context-0', 'context-1']
+    assert len(Query(client, config, [], 'pods-nodes')) == 20
+
+
+def test_stream_query_contexts(fake_api):
+    fake_api(fixtures.clusters(30, 3), latency={'context-0': 0.5})
+    client = Client(['all'])
+    config = Config((), client, False)
+    config.init_config(['pods-nodes-images'], [])
+
+    # each context is joined on its own, giving the rows of one big join
+    parts = list(stream_contexts(client, config, [], 'pods-nodes-images'))
+    assert [part['context'].unique().tolist() for part in parts][-1] == ['context-0']
+
+    columns = ['context', 'namespace', 'pod', 'container']
+    result = pd.concat(parts).sort_values(columns, ignore_index=True)
+    expected = Query(client, config, [], 'pods-nodes-images')
+    pd.testing.assert_frame_equal(result, expected.sort_values(columns, ignore_index=True)[result.columns])
@@ -0,0 +1,66 @@
+import io
+import re
+
+import pandas as pd
+import pytest
+from tabulate import tabulate
+
+from kubectl_query.render import render
+
+
+@pytest.mark.parametrize(
+    'frame',
+    [
+        pd.DataFrame(
+            {'name': ['a', 'bb', 'c'], 'count': [1, 22, 3], 'usage': [0.5, 12.25, 3.0], 'limit': ['1.5', '2', '-']}
+        ),
+        pd.DataFrame({'name': ['1', '22'], 'cpu': ['1e5', '0.25'], 'memory': [0.30000000000000004, 100000000.0]}),
+        pd.DataFrame({'name': ['multi\nline', 'single'], 'status': ['ok', '']}),
+    ],
+)
+def test_plain_like_tabulate(frame, monkeypatch):
+    # several chunks, even for the small frames
+    monkeypatch.setattr('kubectl_query.render.CHUNK', 2)
+    stream = io.StringIO()
+    render(frame, 'plain', stream)
+
+    expected = tabulate(
+        frame, tablefmt='plain', stralign='left', showindex=False, headers=[h.upper() for h in frame.keys()]
+    )
+    assert stream.getvalue() == expected + "\n"
+
+
+def test_color():
+    stream = io.StringIO()
+    render(pd.DataFrame({'name': ['a', 'bb'], 'count': [1, 22]}), 'color', stream)
+
+    lines = stream.getvalue().splitlines()
+    assert lines[0] == "NAME      COUNT"
+    assert lines[2] == "\x1b[36mbb\x1b[0m    " + " " * 7 + "\x1b[32m22\x1b[0m"
+
+
+def test_color_like_plain():
+    frame = pd.DataFrame({'pod': ['a', 'b', 'c'], 'requestscpu': [0.25, 2.0, 0.1]})
+    plain, colored = io.StringIO(), io.StringIO()
+    render(frame, 'plain', plain)
+    render(frame, 'color', colored)
+
+    assert re.sub(r"\x1b\[[0-9;]*m", "", colored.getvalue()) == plain.getvalue()
+    assert plain.getvalue().splitlines()[2] == "b               2"
+
+
+def test_columns_like_tabulate():
+    columns = {'table': ['pods', 'nodes'], 'rows': [10, 200], 'fanout': [1.5, 2]}
+    stream = io.StringIO()
+    render(columns, 'plain', stream)
+
+    expected = tabulate(columns, tablefmt='plain', stralign='left', headers=[h.upper() for h in columns])
+    assert stream.getvalue() == expected + "\n"
+
+
+def test_missing_values():
+    frame = pd.DataFrame({'name': pd.Series(['a', None, 'c'], dtype=object), 'usage': [0.5, None, 2.0]})
+    stream = io.StringIO()
+    render(frame, 'plain', stream)
+
+    assert stream.getvalue().splitlines()[1:] == ["a           0.5", "None      nan", "c           2"]
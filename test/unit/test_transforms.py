@@ -0,0 +1,99 @@
+import pickle
+
+import pandas as pd
+import pytest
+
+from kubectl_query.config import Config
+from kubectl_query.extract import Extractor, Lambda, extract
+from kubectl_query.transforms import Transform, apply_transforms, vectorized
+
+
+def transform(steps, values):
+    frame = pd.DataFrame({'x': values})
+    apply_transforms(frame, {'x': [None] + [Transform(step) for step in steps]})
+    return frame['x']
+
+
+@pytest.mark.parametrize(
+    'steps, function, values',
+    [
+        (
+            ["replace('n', '')", 'int', 'div(1000000)', 'round'],
+            "lambda x: round(int(x.replace('n','')) / 1000000)",
+            ['123456789n', '1999999n', '0n'],
+        ),
+        (
+            ["strip_suffix('Ki')", 'int', 'div(1048576)', 'round(1)'],
+            "lambda x: round(int(x.replace('Ki', '')) / 1024 / 1024, 1)",
+            ['65842896Ki', '1048576Ki', '5Ki'],
+        ),
+        (
+            ['quantity'],
+            "lambda x: int(x[:-1]) * 0.001 if x[-1] == 'm' else int(x) * 1.0",
+            ['250m', '2', '1500m', '0m'],
+        ),
+        (
+            ["replace('--selector=app/', '')"],
+            "lambda x: x.replace('--selector=app/','')",
+            ['--selector=app/instance=traefik', '--log.level=INFO'],
+        ),
+    ],
+)
+def test_like_lambdas(steps, function, values):
+    expected = pd.DataFrame({'x': [Lambda(function)(v) for v in values]})['x']
+    pd.testing.assert_series_equal(transform(steps, values), expected)
+
+
+def test_transforms():
+    assert Transform('quantity').values(['64Gi', '3k', '100Mi', '5mm', 'x', None]) == [
+        2.0**36,
+        3000.0,
+        100 * 2.0**20,
+        None,
+        None,
+        None,
+    ]
+    assert Transform('int').values(['12', 'x', 7.9]) == [12.0, None, 7.0]
+    assert Transform("regex_extract('v([0-9]+)')").values(['v12', 'x']) == ['12', None]
+    assert Transform("split(',')").values(['a,b', 'c']) == [['a', 'b'], ['c']]
+    assert transform(["split(',', -1)", 'upper'], ['a,b', 'c']).tolist() == ['B', 'C']
+    assert transform(["strip_prefix('v')", 'float', 'mul(2)'], ['v1.5']).tolist() == [3.0]
+
+
+def test_parse():
+    assert Transform("div(1024)").args == (1024,)
+    assert pickle.loads(pickle.dumps(Transform("replace('a', 'b')"))).args == ('a', 'b')
+
+    for source in ["__import__('os')", "int(x)", "replace(old='a')", "div(1024", "int.real"]:
+        with pytest.raises(ValueError):
+            Transform(source)
+
+
+def test_extract(client, cache_home):
+    config = Config((), client)
+    config.init_config(['pods-cpurequests'], [])
+    fields = config.tables['pods-cpurequests']['fields']
+    assert vectorized(fields['requestscpu'])
+
+    entries = [{'metadata': {'name': 'a'}, 'spec': {'containers': [{'resources': {'requests': {'cpu': '2'}}}]}}]
+
+    # transforms mixed with lambdas or unrolling apply during extraction
+    fields['requestscpu'] = fields['requestscpu'] + [Lambda("lambda x: x * 2")]
+    assert not vectorized(fields['requestscpu'])
+    assert extract([(Extractor(fields, kubernetes=True), entries)])['requestscpu'] == [4.0]
+
+
+def test_compile_step(client, cache_home):
+    config = Config((), client)
+
+    # known names are transforms, any other callable expression is evaluated
+    assert isinstance(config.compile_step('t', 'f', 'int'), Transform)
+    assert isinstance(config.compile_step('t', 'f', 'div(1024)'), Transform)
+    assert config.compile_step('t', 'f', 'len')('abc') == 3
+    assert config.compile_step('t', 'f', 'str.upper')('abc') == 'ABC'
+    assert config.compile_step('t', 'f', "lambda x: x[::-1]")('abc') == 'cba'
+    assert config.compile_step('t', 'f', 'unroll') == 'unroll'
+
+    for step in ['quantiy', '42', 'div(1024']:
+        with pytest.raises(SystemExit):
+            config.compile_step('t', 'f', step)
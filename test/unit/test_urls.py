@@ -0,0 +1,96 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from jsonpath_ng.ext import parse
+
+from kubectl_query import urls
+from kubectl_query.table import Table
+
+INVENTORY = {
+    '/a': b"hosts:\n  - name: alpha\n  - name: beta\n",
+    '/b': b"hosts:\n  - name: gamma\n",
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Stand-in for an inventory endpoint supporting etags
+    """
+
+    seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.seen.append((self.path, self.headers.get('If-None-Match'), self.headers.get('Accept-Encoding')))
+        if self.path == '/slow':
+            time.sleep(1)
+        if self.path not in INVENTORY:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        etag = f'"{hash(INVENTORY[self.path])}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(INVENTORY[self.path])))
+        self.end_headers()
+        self.wfile.write(INVENTORY[self.path])
+
+
+@pytest.fixture
+def server(cache_home):
+    Handler.seen = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def hosts(**kwargs):
+    return Table(None, 'hosts', [], 'url', 'hosts', {'host': parse('$.name')}, **kwargs)
+
+
+def test_url_table_revalidates_cache(server):
+    assert list(hosts(url=f"{server}/a")['host']) == ['alpha', 'beta']
+    assert Handler.seen[-1][1] is None
+    assert 'gzip' in Handler.seen[-1][2]
+
+    # a new run asks whether the cached response is still current
+    assert list(hosts(url=f"{server}/a")['host']) == ['alpha', 'beta']
+    assert Handler.seen[-1][1] is not None
+    assert len(Handler.seen) == 2
+
+
+def test_url_table_concurrent_urls(server):
+    table = hosts(urls=[f"{server}/a", f"{server}/b", f"{server}/missing"])
+    assert sorted(table['host']) == ['alpha', 'beta', 'gamma']
+
+
+def test_url_table_failures(server):
+    assert hosts(url=f"{server}/missing").empty
+
+    start = time.perf_counter()
+    assert hosts(url=f"{server}/slow", timeout=0.2).empty
+    assert time.perf_counter() - start < 1
+
+
+def test_responses_of_a_run(server):
+    responses = {}
+    assert urls.fetch(f"{server}/a", responses=responses) == INVENTORY['/a'].decode()
+    assert urls.fetch(f"{server}/a", responses=responses) == INVENTORY['/a'].decode()
+    assert len(Handler.seen) == 1
+
+    # failures are tried again
+    assert urls.fetch(f"{server}/missing", responses=responses) is None
+    assert urls.fetch(f"{server}/missing", responses=responses) is None
+    assert len(Handler.seen) == 3
+    assert list(responses) == [urls.key(f"{server}/a", None)]
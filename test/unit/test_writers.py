@@ -0,0 +1,108 @@
+import io
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from kubectl_query import main
+from kubectl_query.writers import typed, write
+
+CONFIG = """
+tables:
+  inventory-pods:
+    api: file
+    kind: pods
+    fields:
+      pod: "$.name"
+      cpu:
+        - "$.cpu"
+        - "lambda x: int(x.replace('m', '')) / 1000"
+"""
+
+INVENTORY = """
+pods:
+  - {name: a/b, cpu: 250m}
+  - {name: c, cpu: 1500m}
+"""
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({'name': ['a', 'b', 'c'], 'cpu': [0.25, np.nan, 1.5], 'mixed': ['x', 1.5, None]}, dtype=object)
+
+
+def test_typed(frame):
+    result = typed(frame)
+    assert result['cpu'].dtype == np.float64
+    assert list(result['mixed'][:2]) == ['x', '1.5'] and pd.isna(result['mixed'][2])
+
+
+def test_jsonl(frame, monkeypatch):
+    monkeypatch.setattr('kubectl_query.writers.BATCH', 2)
+    stream = io.StringIO()
+    write(frame, 'jsonl', stream)
+
+    # each row on a line of its own, also across batches
+    assert stream.getvalue().count('\n') == 3 and stream.getvalue().endswith('}\n')
+    rows = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert rows == [
+        {'name': 'a', 'cpu': 0.25, 'mixed': 'x'},
+        {'name': 'b', 'cpu': None, 'mixed': '1.5'},
+        {'name': 'c', 'cpu': 1.5, 'mixed': None},
+    ]
+
+
+@pytest.mark.parametrize('tablefmt', ['arrow', 'parquet'])
+def test_arrow(frame, tablefmt, monkeypatch):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+
+    monkeypatch.setattr('kubectl_query.writers.BATCH', 2)
+    stream = io.BytesIO()
+    write(frame, tablefmt, stream)
+
+    stream.seek(0)
+    if tablefmt == 'arrow':
+        table = pa.ipc.open_stream(stream).read_all()
+    else:
+        table = pq.read_table(stream)
+
+    assert table.schema.field('cpu').type == pa.float64()
+    assert table.column('cpu').to_pylist() == [0.25, None, 1.5]
+    assert table.column('mixed').to_pylist() == ['x', '1.5', None]
+
+
+def test_main_jsonl(tmp_path, cache_home):
+    tmp_path.joinpath('config.yaml').write_text(CONFIG)
+    tmp_path.joinpath('data').mkdir()
+    tmp_path.joinpath('data', 'inventory.yaml').write_text(INVENTORY)
+    output = tmp_path / 'pods.jsonl'
+
+    args = ['-c', str(tmp_path / 'config.yaml'), '-I', str(tmp_path / 'data'), '-o', 'jsonl']
+    result = CliRunner().invoke(main, args + ['--output-file', str(output), 'inventory-pods'])
+    assert result.exit_code == 0, result.output
+
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert rows == [{'pod': 'a/b', 'cpu': 0.25}, {'pod': 'c', 'cpu': 1.5}]
+
+
+def test_main_output_closed(tmp_path, cache_home, monkeypatch):
+    tmp_path.joinpath('config.yaml').write_text(CONFIG)
+    tmp_path.joinpath('data').mkdir()
+    tmp_path.joinpath('data', 'inventory.yaml').write_text(INVENTORY)
+    output = tmp_path / 'pods.jsonl'
+
+    def fail(result, tablefmt, stream):
+        stream.write('partial')
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(sys.modules['kubectl_query.main'], 'write', fail)
+
+    # what was written is flushed, as the file is closed despite the error
+    args = ['-c', str(tmp_path / 'config.yaml'), '-I', str(tmp_path / 'data'), '-o', 'jsonl']
+    result = CliRunner().invoke(main, args + ['--output-file', str(output), 'inventory-pods'])
+    assert isinstance(result.exception, RuntimeError)
+    assert output.read_text() == 'partial'
@@ -0,0 +1,168 @@
+import socketserver
+import struct
+import threading
+
+import dns.exception
+import dns.message
+import dns.rdatatype
+import dns.rrset
+import dns.zone
+import pytest
+from jsonpath_ng.ext import parse
+
+from kubectl_query import cache
+from kubectl_query.table import Table
+
+ZONE = """
+$ORIGIN example.com.
+$TTL 300
+@ SOA ns1 admin {serial} 3600 600 86400 300
+@ NS ns1
+ns1 A 10.0.0.1
+{hosts}
+"""
+
+
+class Authority:
+    """
+    Stand-in for an authoritative nameserver answering SOA queries, AXFR
+    and IXFR, the latter as a delta from the previous serial only
+    """
+
+    def __init__(self):
+        self.serial = 0
+        self.zone = None
+        self.previous = None
+        self.seen = []
+
+    def publish(self, *hosts):
+        self.serial += 1
+        self.previous = self.zone
+        text = ZONE.format(serial=self.serial, hosts="\n".join(f"{h} A 10.0.1.{i}" for i, h in enumerate(hosts)))
+        self.zone = dns.zone.from_text(text, relativize=False)
+
+    def rrsets(self, zone, skip_soa=True):
+        return [
+            dns.rrset.from_rdata_list(name, rdataset.ttl, rdataset)
+            for name, rdataset in zone.iterate_rdatasets()
+            if not (skip_soa and rdataset.rdtype == dns.rdatatype.SOA)
+        ]
+
+    def answer(self, query):
+        rdtype = query.question[0].rdtype
+        self.seen.append(dns.rdatatype.to_text(rdtype))
+        response = dns.message.make_response(query)
+        soa = self.rrsets(self.zone, skip_soa=False)[0]
+
+        if rdtype == dns.rdatatype.SOA:
+            response.answer = [soa]
+        elif rdtype == dns.rdatatype.AXFR:
+            response.answer = [soa] + self.rrsets(self.zone) + [soa]
+        elif rdtype == dns.rdatatype.IXFR:
+            since = query.authority[0][0].serial
+            if since == self.serial:
+                response.answer = [soa]
+            else:
+                old = self.rrsets(self.previous, skip_soa=False)[0]
+                deleted = [r for r in self.rrsets(self.previous) if r not in self.rrsets(self.zone)]
+                added = [r for r in self.rrsets(self.zone) if r not in self.rrsets(self.previous)]
+                response.answer = [soa, old] + deleted + [soa] + added + [soa]
+        return response
+
+
+@pytest.fixture
+def authority(cache_home):
+    authority = Authority()
+
+    class TCPHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            (length,) = struct.unpack('!H', self.request.recv(2))
+            wire = authority.answer(dns.message.from_wire(self.request.recv(length))).to_wire()
+            self.request.sendall(struct.pack('!H', len(wire)) + wire)
+
+    class UDPHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            data, sock = self.request
+            sock.sendto(authority.answer(dns.message.from_wire(data)).to_wire(), self.client_address)
+
+    tcp = socketserver.ThreadingTCPServer(('127.0.0.1', 0), TCPHandler)
+    udp = socketserver.ThreadingUDPServer(('127.0.0.1', tcp.server_address[1]), UDPHandler)
+    for server in (tcp, udp):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    authority.port = tcp.server_address[1]
+    yield authority
+    tcp.shutdown()
+    udp.shutdown()
+
+
+def records(authority, fields=None, **kwargs):
+    fields = fields or {'name': parse('$.name'), 'type': parse('$.type'), 'record': parse('$.records[*]')}
+    table = Table(
+        None,
+        'dns',
+        [],
+        'dns',
+        'Zone',
+        fields,
+        nameserver='127.0.0.1',
+        port=authority.port,
+        domains=['example.com'],
+        **kwargs,
+    )
+    return sorted(table.loc[table['type'] == 'A', 'name'])
+
+
+def test_zone_transfers_are_incremental(authority):
+    authority.publish('alpha', 'beta')
+    assert records(authority) == ['alpha.example.com', 'beta.example.com', 'ns1.example.com']
+    assert authority.seen == ['SOA', 'AXFR']
+
+    # unchanged serial, served from the cache
+    assert records(authority) == ['alpha.example.com', 'beta.example.com', 'ns1.example.com']
+    assert authority.seen == ['SOA', 'AXFR', 'SOA']
+
+    # new serial, only the delta is transferred
+    authority.publish('alpha', 'gamma')
+    assert records(authority) == ['alpha.example.com', 'gamma.example.com', 'ns1.example.com']
+    assert authority.seen[3:] == ['SOA', 'IXFR']
+
+
+def test_zone_transfer_without_cache(authority):
+    authority.publish('alpha')
+    assert records(authority, cache=False) == ['alpha.example.com', 'ns1.example.com']
+    assert authority.seen == ['AXFR']
+
+
+def test_zone_from_cache_on_failure(authority, monkeypatch):
+    authority.publish('alpha')
+    assert records(authority) == ['alpha.example.com', 'ns1.example.com']
+
+    # a nameserver not answering the serial query leaves the cached zone
+    def timeout(*args):
+        raise dns.exception.Timeout()
+
+    monkeypatch.setattr('kubectl_query.zones.serial', timeout)
+    assert records(authority) == ['alpha.example.com', 'ns1.example.com']
+
+
+def test_zone_rows_are_cached_by_serial(authority, monkeypatch):
+    authority.publish('alpha')
+    assert records(authority) == ['alpha.example.com', 'ns1.example.com']
+
+    # an unchanged zone is neither read from the cache nor extracted
+    def fail(*args):
+        raise AssertionError("extracted an unchanged zone")
+
+    monkeypatch.setattr('kubectl_query.extract.Extractor.rows', fail)
+    monkeypatch.setattr('kubectl_query.zones.zone_entries', fail)
+    monkeypatch.setattr(
+        'kubectl_query.cache.load', lambda path, load=cache.load: None if '-rows' not in path else load(path)
+    )
+    assert records(authority) == ['alpha.example.com', 'ns1.example.com']
+    monkeypatch.undo()
+
+    # other fields, or a new serial, are extracted again
+    fields = {'name': parse('$.name'), 'type': parse('$.type'), 'zone': parse('$.zone')}
+    assert records(authority, fields) == ['alpha.example.com', 'ns1.example.com']
+    authority.publish('alpha', 'beta')
+    assert records(authority) == ['alpha.example.com', 'beta.example.com', 'ns1.example.com']